@@ -1,10 +1,24 @@
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.responses import StreamingResponse, JSONResponse
 from schemas.chat import ChatRequest, ErrorResponse
-from services.pydantic_ai_service import stream_agent_response, agent_response
+from services.pydantic_ai_service import (
+    stream_agent_response, agent_response, cancel_on_disconnect, coalescing_stats, streaming_stats
+)
+from services.history_compaction import compaction_stats, schedule_summary_refresh
 from services.database_service import Database
 from schemas.docs import InsertDocRequest, UpdateDocRequest, RemoveDocRequest
-from services.lightrag_service import insert_document, update_document, remove_document
+from services.lightrag_service import update_document, remove_document
+from services.rag_manager import startup_rag, shutdown_rag, workspace_exists, workspace_stats, DEFAULT_WORKSPACE
+from services.ingest_queue import IngestQueue
+from services.answer_cache import answer_cache
+from services.embedding_cache import embedding_cache_stats, close_embedding_caches
+from services.embedding_batcher import embedding_batcher_stats
+from services.my_openai_compatible_model import MyOpenAICompatibleModel
+from services.llm_router import llm_router_stats
+from services.storage.llm_cache_storage import llm_cache_stats
+from services.incremental_ingest import incremental_stats
+from services.adaptive_limiter import limiter_stats
+from services.ingest_pool import ingest_pool_stats, shutdown_pool
 import asyncio
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
@@ -22,6 +36,7 @@ app.add_middleware(
 # Create a single database instance for the application
 db = None
 db_cm = None  # <-- Add this line
+ingest_queue = None
 
 @app.on_event("startup")
 async def startup_db():
@@ -29,27 +44,79 @@ async def startup_db():
     db_cm = Database.connect()
     db = await db_cm.__aenter__()
 
+@app.on_event("startup")
+async def startup_lightrag():
+    global ingest_queue
+    # Load the shared LightRAG once instead of on every request
+    await startup_rag()
+    ingest_queue = IngestQueue()
+    await ingest_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_lightrag():
+    global ingest_queue
+    # Drain ingestion before the storages are finalized
+    if ingest_queue:
+        await ingest_queue.stop()
+        ingest_queue = None
+    await shutdown_rag()
+    shutdown_pool()
+    close_embedding_caches()
+
+@app.on_event("startup")
+async def startup_llm_client():
+    # One keep-alive connection pool for all MyOpenAICompatibleModel requests
+    await MyOpenAICompatibleModel.open_client()
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    await MyOpenAICompatibleModel.close_client()
+
 @app.on_event("shutdown")
 async def shutdown_db():
     global db, db_cm
     if db_cm:
+        # Write out chat turns still sitting in the write-behind buffer
+        await db.flush()
         await db_cm.__aexit__(None, None, None)
         db_cm = None
         db = None
 
+def workspace_not_found(workspace: str):
+    """404 response for reads of a workspace nothing was inserted into; None if it exists."""
+    if workspace_exists(workspace):
+        return None
+    return JSONResponse(
+        status_code=404,
+        content=ErrorResponse(error="Workspace Not Found", details=f"No workspace {workspace}").model_dump()
+    )
+
 @app.post("/chat/stream")
-async def chat_stream(chat_request: ChatRequest) -> StreamingResponse:
+async def chat_stream(chat_request: ChatRequest, request: Request) -> StreamingResponse:
     """
     Streams back a newline-delimited JSON payload. 
     Follows the Pydantic AI docs approach:
       1. Yield the user message right away.
-      2. Enter `agent.run_stream(...)` without history.
+      2. Answer with the conversation's stored history, if one is named.
       3. Stream each delta/text part via `result.stream(...)`.
     """
+    workspace = chat_request.workspace or DEFAULT_WORKSPACE
+    if (not_found := workspace_not_found(workspace)) is not None:
+        return not_found
     try:
-        # Only pass `user_input`, ignore `message_history`
+        # History comes from the stored conversation, as for /chat
+        # Stop retrieval and generation as soon as the client disconnects
         return StreamingResponse(
-             stream_agent_response(chat_request.user_input, chat_request.message_history, db),
+             cancel_on_disconnect(
+                 stream_agent_response(
+                     chat_request.user_input,
+                     chat_request.message_history,
+                     db,
+                     conversation_id=chat_request.conversation_id,
+                     workspace=workspace,
+                 ),
+                 request.is_disconnected,
+             ),
             media_type="text/plain"
         )
     except Exception as e:
@@ -60,11 +127,22 @@ async def chat_stream(chat_request: ChatRequest) -> StreamingResponse:
 
 @app.post("/chat")
 async def chat(chat_request: ChatRequest):
+    workspace = chat_request.workspace or DEFAULT_WORKSPACE
+    if (not_found := workspace_not_found(workspace)) is not None:
+        return not_found
     try:
-        # Retrieve message history from the database for memory
         global db
-        messages = await db.get_messages()
-        response = await agent_response(chat_request.user_input, messages)
+        conversation_id = chat_request.conversation_id
+        if not conversation_id:
+            # Without a conversation of its own the request is stateless, so it can be cached and coalesced
+            response = await agent_response(chat_request.user_input, [], workspace=workspace)
+            return {"response": response}
+        # Retrieve this conversation's recent history from the database for memory
+        messages = await db.get_messages(conversation_id)
+        response = await agent_response(chat_request.user_input, messages, db, conversation_id, workspace)
+        # Buffered; written to the database in batches off the response path
+        await db.record_turn(chat_request.user_input, response, conversation_id)
+        schedule_summary_refresh(conversation_id, db, workspace)
         return {"response": response}
     except Exception as e:
         return JSONResponse(
@@ -72,21 +150,41 @@ async def chat(chat_request: ChatRequest):
             content=ErrorResponse(error="Chat Error", details=str(e)).model_dump()
         )
 
-@app.post("/docs/insert")
+@app.post("/docs/insert", status_code=202)
 async def docs_insert(req: InsertDocRequest):
+    # Ingestion runs in the background; poll /docs/jobs/{job_id} for progress
     try:
-        doc_id = await insert_document(req.content)
-        return {"doc_id": doc_id}
+        job = ingest_queue.submit(req.content, req.workspace or DEFAULT_WORKSPACE)
+        return {"job_id": job.job_id, "doc_id": job.doc_id, "workspace": job.workspace, "status": job.status}
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content=ErrorResponse(error="Document Insert Error", details=str(e)).model_dump()
         )
 
+@app.get("/docs/jobs/{job_id}")
+async def docs_job_status(job_id: str):
+    try:
+        status = await ingest_queue.status(job_id)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content=ErrorResponse(error="Job Status Error", details=str(e)).model_dump()
+        )
+    if status is None:
+        return JSONResponse(
+            status_code=404,
+            content=ErrorResponse(error="Job Not Found", details=f"No ingestion job {job_id}").model_dump()
+        )
+    return status
+
 @app.post("/docs/update")
 async def docs_update(req: UpdateDocRequest):
+    workspace = req.workspace or DEFAULT_WORKSPACE
+    if (not_found := workspace_not_found(workspace)) is not None:
+        return not_found
     try:
-        result = await update_document(req.doc_id, req.content)
+        result = await update_document(req.doc_id, req.content, workspace)
         return {"result": result}
     except Exception as e:
         return JSONResponse(
@@ -96,8 +194,11 @@ async def docs_update(req: UpdateDocRequest):
 
 @app.post("/docs/remove")
 async def docs_remove(req: RemoveDocRequest):
+    workspace = req.workspace or DEFAULT_WORKSPACE
+    if (not_found := workspace_not_found(workspace)) is not None:
+        return not_found
     try:
-        result = await remove_document(req.doc_id)
+        result = await remove_document(req.doc_id, workspace)
         return {"result": result}
     except Exception as e:
         return JSONResponse(
@@ -105,6 +206,24 @@ async def docs_remove(req: RemoveDocRequest):
             content=ErrorResponse(error="Document Remove Error", details=str(e)).model_dump()
         )
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "embedding_batcher": embedding_batcher_stats(),
+        "chat_coalescing": coalescing_stats(),
+        "chat_streaming": streaming_stats(),
+        "llm_routers": llm_router_stats(),
+        "llm_response_cache": llm_cache_stats(),
+        "chat_history_writes": db.write_stats() if db else None,
+        "history_compaction": compaction_stats(),
+        "workspaces": workspace_stats(),
+        "incremental_ingest": incremental_stats(),
+        "provider_limits": limiter_stats(),
+        "ingest_pool": ingest_pool_stats(),
+    }
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
 
@@ -0,0 +1,120 @@
+"""Event-loop lag seen by other requests while a large document is inserted.
+
+Run from `api/`:
+
+    python -m benchmarks.bench_ingest_loop_lag --chars 2000000 --workers 0 4
+
+A probe task stands in for `/chat`: it sleeps `--interval` seconds in a loop
+and records how late it wakes up. Meanwhile `upsert_document` (the path behind
+`/docs/insert`) ingests one large synthetic markdown document into a corpus of
+`--corpus-docs` documents, once inline (`--workers 0`) and once per pool size.
+The LLM and embedding functions are instant stand-ins, so only the CPU-bound
+stages and the storage writes are measured.
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+from lightrag import LightRAG
+from lightrag.kg.shared_storage import initialize_pipeline_status, initialize_share_data
+from lightrag.utils import EmbeddingFunc
+
+from services import ingest_pool
+from services.incremental_ingest import attach_index, index_storages, upsert_document
+
+DIM = 64
+WORDS = "agent model tool graph cache index query retrieval pydantic validator schema stream".split()
+
+
+async def fake_llm(prompt, system_prompt=None, history_messages=[], **kwargs) -> str:
+    return "<|COMPLETE|>"
+
+
+async def fake_embed(texts: list[str]) -> np.ndarray:
+    return np.random.default_rng(len(texts)).normal(size=(len(texts), DIM)).astype(np.float32)
+
+
+def synthetic_doc(chars: int, rng: np.random.Generator) -> str:
+    sections, size = [], 0
+    while size < chars:
+        paragraphs = [" ".join(rng.choice(WORDS, size=rng.integers(40, 160))) for _ in range(rng.integers(2, 6))]
+        section = f"## Section {len(sections)}\n\n" + "\n\n".join(paragraphs)
+        sections.append(section)
+        size += len(section)
+    return "\n\n".join(sections)
+
+
+async def probe(interval: float, lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def measure(working_dir: str, prefix: str, corpus: list[str], doc: str, interval: float) -> dict:
+    rag = LightRAG(
+        working_dir=working_dir,
+        namespace_prefix=prefix,
+        embedding_func=EmbeddingFunc(embedding_dim=DIM, max_token_size=8192, func=fake_embed),
+        llm_model_func=fake_llm,
+        auto_manage_storages_states=False,
+    )
+    attach_index(rag)
+    await rag.initialize_storages()
+    for storage in index_storages(rag):
+        await storage.initialize()
+    for i, text in enumerate(corpus):
+        await upsert_document(rag, f"doc-corpus-{i}", text)
+    # Spawn the workers and load their tokenizers before measuring
+    await upsert_document(rag, "doc-warmup", doc[: ingest_pool.INGEST_POOL_MIN_CHARS * 2])
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(interval, lags, stop))
+    started = time.perf_counter()
+    await upsert_document(rag, "doc-large", doc)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    await rag.finalize_storages()
+    lags_ms = np.array(lags) * 1000
+    return {
+        "insert_s": elapsed,
+        "p50_ms": float(np.percentile(lags_ms, 50)),
+        "p99_ms": float(np.percentile(lags_ms, 99)),
+        "max_ms": float(lags_ms.max()),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, default=2_000_000, help="size of the inserted document")
+    parser.add_argument("--corpus-docs", type=int, default=10, help="documents already stored, same size")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4], help="ingest pool sizes; 0 is inline")
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    initialize_share_data()
+    await initialize_pipeline_status()
+    rng = np.random.default_rng(0)
+    doc = synthetic_doc(args.chars, rng)
+    corpus = [synthetic_doc(args.chars, rng) for _ in range(args.corpus_docs)]
+    print(f"{'workers':>8}{'insert s':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for workers in args.workers:
+        ingest_pool.INGEST_POOL_WORKERS = workers
+        ingest_pool.shutdown_pool()
+        with tempfile.TemporaryDirectory() as tmp:
+            result = await measure(tmp, f"w{workers}_", corpus, doc, args.interval)
+        print(
+            f"{workers:>8}{result['insert_s']:>10.2f}{result['p50_ms']:>9.1f}"
+            f"{result['p99_ms']:>9.1f}{result['max_ms']:>9.1f}"
+        )
+    ingest_pool.shutdown_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
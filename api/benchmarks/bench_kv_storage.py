@@ -0,0 +1,74 @@
+"""Insert-latency benchmark: JsonKVStorage vs LogKVStorage as the corpus grows.
+
+Run from `api/`:
+
+    python -m benchmarks.bench_kv_storage --docs 5000 --batch 10
+
+Each step upserts `--batch` synthetic chunks and calls `index_done_callback()`,
+which is what one `/docs/insert` costs the KV layer. Latency is reported per
+`--every` inserted documents, so the O(corpus) rewrite of the JSON store shows
+up as a growing column while the log stays flat.
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+from lightrag.kg.json_kv_impl import JsonKVStorage
+from lightrag.kg.shared_storage import initialize_share_data
+
+from services.storage.log_kv_storage import LogKVStorage
+
+
+def chunk(i: int, size: int) -> dict:
+    return {"content": f"chunk {i} " + "x" * size, "tokens": size // 4, "full_doc_id": f"doc-{i // 8}"}
+
+
+async def run(storage_cls, working_dir: str, args) -> list[tuple[int, float, float]]:
+    storage = storage_cls(
+        namespace="text_chunks",
+        global_config={"working_dir": working_dir},
+        embedding_func=None,
+    )
+    await storage.initialize()
+    rows, latencies, inserted = [], [], 0
+    for step in range(args.docs):
+        batch = {f"chunk-{inserted + j}": chunk(inserted + j, args.chunk_size) for j in range(args.batch)}
+        started = time.perf_counter()
+        await storage.upsert(batch)
+        await storage.index_done_callback()
+        latencies.append(time.perf_counter() - started)
+        inserted += args.batch
+        if (step + 1) % args.every == 0:
+            rows.append((step + 1, float(np.percentile(latencies, 50)) * 1000, float(np.percentile(latencies, 95)) * 1000))
+            latencies = []
+    await storage.finalize()
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=10, help="chunks per document")
+    parser.add_argument("--chunk-size", type=int, default=1200, help="characters per chunk")
+    parser.add_argument("--every", type=int, default=250)
+    args = parser.parse_args()
+
+    initialize_share_data()
+    results = {}
+    for name, storage_cls in (("json", JsonKVStorage), ("log", LogKVStorage)):
+        with tempfile.TemporaryDirectory() as tmp:
+            results[name] = await run(storage_cls, tmp, args)
+            size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+            print(f"{name}: {size / 2**20:.1f} MB on disk")
+
+    print(f"{'docs':>8}{'json p50':>12}{'json p95':>12}{'log p50':>12}{'log p95':>12}  (ms per insert)")
+    for (docs, j50, j95), (_, l50, l95) in zip(results["json"], results["log"]):
+        print(f"{docs:>8}{j50:>12.2f}{j95:>12.2f}{l50:>12.2f}{l95:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
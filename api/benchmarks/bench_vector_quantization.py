@@ -0,0 +1,65 @@
+"""Memory and recall of quantized vector storage (`IVF_QUANTIZATION`).
+
+Run from `api/`:
+
+    python -m benchmarks.bench_vector_quantization --size 100000 --dim 1024
+
+Every query scans all rows (no clustering), so the numbers isolate the effect
+of quantization; recall@k is measured against exact float32 scores.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from services.storage import ivf_index
+from services.storage.ivf_index import IVFIndex, normalize
+from benchmarks.bench_vector_storage import clustered_vectors, percentiles
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    clusters = max(8, args.size // 500)
+    data = clustered_vectors(args.size, args.dim, clusters, rng)
+    queries = normalize(clustered_vectors(args.queries, args.dim, clusters, rng))
+    exact = normalize(data) @ queries.T
+    truth = [set(np.argsort(exact[:, i])[-args.top_k:]) for i in range(args.queries)]
+
+    ivf_index.IVF_MIN_TRAIN = args.size + 1
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest, data_dir = os.path.join(tmp, "vdb_chunks.ivf.json"), os.path.join(tmp, "ivf_chunks")
+        index = IVFIndex(manifest, data_dir, args.dim)
+        index.upsert([{"__id__": f"chunk-{i}"} for i in range(args.size)], data)
+        index.save()
+
+        print(f"{'storage':<20}{'memory MB':>10}{'recall@' + str(args.top_k):>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for quantization in ("none", "float16", "int8"):
+            ivf_index.IVF_QUANTIZATION = quantization
+            index = IVFIndex(manifest, data_dir, args.dim)
+            for rerank in args.rerank if quantization != "none" else [0]:
+                index.rerank = rerank
+                hits, latencies = 0, []
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    results = index.search(q, args.top_k)
+                    latencies.append(time.perf_counter() - started)
+                    hits += len(expected & {row for row, _ in results})
+                p50, p95 = percentiles(latencies)
+                label = quantization + (f" rerank={rerank}" if rerank else "")
+                recall = hits / (args.top_k * len(queries))
+                print(f"{label:<20}{index.memory_bytes() / 2**20:>10.1f}{recall:>10.3f}{p50:>10.2f}{p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Recall-versus-latency benchmark: NanoVectorDB brute force vs the IVF index.
+
+Run from `api/`:
+
+    python -m benchmarks.bench_vector_storage --size 100000 --dim 1536
+
+Vectors are synthetic and clustered (so the IVF partitions mean something);
+recall@k is measured against NanoVectorDB's exact results.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from nano_vectordb import NanoVectorDB
+
+from services.storage import ivf_index
+from services.storage.ivf_index import IVFIndex
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    return float(np.percentile(samples, 50)) * 1000, float(np.percentile(samples, 95)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    clusters = max(8, args.size // 500)
+    data = clustered_vectors(args.size, args.dim, clusters, rng)
+    queries = clustered_vectors(args.queries, args.dim, clusters, rng)
+    ids = [f"chunk-{i}" for i in range(args.size)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nano = NanoVectorDB(args.dim, storage_file=os.path.join(tmp, "vdb_chunks.json"))
+        nano.upsert([{"__id__": i, "__vector__": v} for i, v in zip(ids, data)])
+
+        started = time.perf_counter()
+        ivf_index.IVF_MIN_TRAIN = 0
+        index = IVFIndex(os.path.join(tmp, "vdb_chunks.ivf.json"), os.path.join(tmp, "ivf_chunks"), args.dim)
+        index.upsert([{"__id__": i} for i in ids], data)
+        index.save()
+        print(f"IVF build: {time.perf_counter() - started:.2f}s, {len(index.centroids)} lists")
+        # Query a freshly loaded (memory-mapped) index, as the service does after a restart
+        index = IVFIndex(index.manifest_file, index.data_dir, args.dim)
+
+        truth, latencies = [], []
+        for q in queries:
+            started = time.perf_counter()
+            results = nano.query(q, top_k=args.top_k, better_than_threshold=-1.0)
+            latencies.append(time.perf_counter() - started)
+            truth.append({r["__id__"] for r in results})
+        p50, p95 = percentiles(latencies)
+        print(f"{'backend':<16}{'recall@' + str(args.top_k):>10}{'p50 ms':>10}{'p95 ms':>10}")
+        print(f"{'nano (exact)':<16}{1.0:>10.3f}{p50:>10.2f}{p95:>10.2f}")
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            hits, latencies = 0, []
+            for q, expected in zip(queries, truth):
+                started = time.perf_counter()
+                results = index.search(q, args.top_k)
+                latencies.append(time.perf_counter() - started)
+                hits += len(expected & {index.ids[row] for row, _ in results})
+            p50, p95 = percentiles(latencies)
+            recall = hits / (args.top_k * len(queries))
+            print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>10.3f}{p50:>10.2f}{p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Startup benchmark: loading a workspace from its storage files vs from its snapshot.
+
+Run from `api/`:
+
+    python -m benchmarks.bench_warm_start --chunks 2000 20000
+
+A synthetic corpus is written in LightRAG's default formats (JSON KV stores,
+GraphML, NanoVectorDB). Each size is loaded cold, which also writes the
+snapshot on close, and then loaded again from the snapshot.
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+import networkx as nx
+from nano_vectordb import NanoVectorDB
+from lightrag.kg.shared_storage import initialize_share_data
+
+from services import rag_manager
+from services.rag_manager import RAGManager
+
+DIM = 1536  # build_lightrag embeds with text-embedding-3-small
+
+
+def write_corpus(working_dir: str, chunks: int, rng: np.random.Generator):
+    docs = {f"doc-{i}": {"content": "x" * 4000} for i in range(chunks // 8 + 1)}
+    text_chunks = {
+        f"chunk-{i}": {"content": "x" * 1200, "tokens": 300, "full_doc_id": f"doc-{i // 8}", "chunk_order_index": i % 8}
+        for i in range(chunks)
+    }
+    status = {doc_id: {"status": "processed", "content_summary": "x" * 100, "content_length": 4000,
+                       "chunks_count": 8, "created_at": "", "updated_at": "", "file_path": "bench"} for doc_id in docs}
+    for namespace, data in (("full_docs", docs), ("text_chunks", text_chunks), ("doc_status", status)):
+        with open(os.path.join(working_dir, f"kv_store_{namespace}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    graph = nx.Graph()
+    nodes = chunks // 2
+    for i in range(nodes):
+        graph.add_node(f"E{i}", entity_id=f"E{i}", entity_type="concept", description="y" * 200, source_id=f"chunk-{i}")
+    for i in range(nodes):
+        graph.add_edge(f"E{i}", f"E{rng.integers(nodes)}", weight=1.0, description="z" * 100, keywords="k", source_id=f"chunk-{i}")
+    nx.write_graphml(graph, os.path.join(working_dir, "graph_chunk_entity_relation.graphml"))
+
+    for namespace, rows in (("chunks", chunks), ("entities", nodes), ("relationships", nodes)):
+        db = NanoVectorDB(DIM, storage_file=os.path.join(working_dir, f"vdb_{namespace}.json"))
+        db.upsert([{"__id__": f"{namespace}-{i}", "__vector__": v}
+                   for i, v in enumerate(rng.normal(size=(rows, DIM)).astype(np.float32))])
+        db.save()
+
+
+async def timed_load(manager: RAGManager) -> float:
+    started = time.perf_counter()
+    await manager.get()
+    elapsed = time.perf_counter() - started
+    await manager.close()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    initialize_share_data()
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8}{'files MB':>10}{'snapshot MB':>13}{'cold s':>9}{'warm s':>9}")
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_corpus(tmp, chunks, rng)
+            files = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp)) / 2**20
+            manager = RAGManager(working_dir=tmp)
+            cold = await timed_load(manager)
+            snapshot = os.path.join(tmp, rag_manager.SNAPSHOT_FILE)
+            warm = await timed_load(manager)
+            print(f"{chunks:>8}{files:>10.1f}{os.path.getsize(snapshot) / 2**20:>13.1f}{cold:>9.2f}{warm:>9.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
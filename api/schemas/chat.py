@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from typing import List, Optional, Any, Literal
 from typing_extensions import LiteralString, ParamSpec, TypedDict
+from .docs import workspace_field
 
 
 class MessagePart(BaseModel):
@@ -39,11 +40,15 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     user_input: str
     message_history: Optional[List[Any]] = []
+    conversation_id: Optional[str] = None
+    workspace: Optional[str] = workspace_field()
 
     model_config = {
         "json_schema_extra": {
             "example": {
                 "user_input": "How do I print hello world in Python?",
+                "conversation_id": "3f2b9c1e-session",
+                "workspace": "acme",
                 "message_history": [
                     {"role": "user", "content": "Hi"},
                     {"role": "assistant", "content": "Hello! How can I help you?"}
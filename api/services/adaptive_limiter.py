@@ -0,0 +1,459 @@
+"""Adaptive (AIMD) concurrency and tokens-per-minute limits for provider calls.
+
+One limiter per provider (LLM, embeddings) is shared by every workspace.
+Each limiter admits calls while fewer than `limit` are in flight and its token
+bucket, refilled at `tpm` tokens per minute, covers the call's estimate. Both
+budgets grow additively while calls come back under the latency target with
+the budget in use, and are cut multiplicatively on 429/5xx responses,
+timeouts or slow calls, at most once per round of in-flight calls.
+
+Waiting calls are admitted in priority order: chat traffic first, background
+ingestion after. A call is background inside `background()` (RAGManager.write
+sets it) or when LightRAG tags it with a priority lower than its query calls.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Optional
+
+from lightrag.utils import EmbeddingFunc
+
+INTERACTIVE, BACKGROUND = 0, 1
+# LightRAG tags query-time LLM and embedding calls with this `_priority`
+LIGHTRAG_QUERY_PRIORITY = 5
+
+# Concurrency limits; LightRAG's llm_model_max_async is raised to the LLM maximum
+LLM_LIMIT_INITIAL = int(os.getenv("LLM_LIMIT_INITIAL", "4"))
+LLM_LIMIT_MAX = int(os.getenv("LLM_LIMIT_MAX", "32"))
+EMBED_LIMIT_INITIAL = int(os.getenv("EMBED_LIMIT_INITIAL", "8"))
+EMBED_LIMIT_MAX = int(os.getenv("EMBED_LIMIT_MAX", "64"))
+# Tokens-per-minute ceilings (the provider's quota); 0 leaves tokens unlimited
+LLM_LIMIT_TPM = int(os.getenv("LLM_LIMIT_TPM", "0"))
+EMBED_LIMIT_TPM = int(os.getenv("EMBED_LIMIT_TPM", "0"))
+# Seconds; a call slower than this counts as congestion
+LLM_LIMIT_LATENCY_TARGET = float(os.getenv("LLM_LIMIT_LATENCY_TARGET", "30"))
+EMBED_LIMIT_LATENCY_TARGET = float(os.getenv("EMBED_LIMIT_LATENCY_TARGET", "5"))
+# Multiplicative decrease factor, and the additive TPM step as a fraction of the ceiling
+LIMIT_BACKOFF = float(os.getenv("LIMIT_BACKOFF", "0.5"))
+LIMIT_TPM_STEP = float(os.getenv("LIMIT_TPM_STEP", "0.05"))
+
+_call_priority: ContextVar[int] = ContextVar("call_priority", default=INTERACTIVE)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+@contextmanager
+def background():
+    """Run provider calls made inside the block behind chat traffic."""
+    token = _call_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+@contextmanager
+def call_priority(priority: int):
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _call_priority.get()
+
+
+def _is_overload(e: BaseException) -> bool:
+    """429, 5xx and timeouts mean the provider is saturated; other errors are the request's fault."""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in type(e).__name__:
+        return True
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def _retry_after(e: BaseException) -> float:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        maximum: int,
+        latency_target: float,
+        tpm: int = 0,
+        minimum: int = 1,
+        backoff: float = LIMIT_BACKOFF,
+    ):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.tpm_ceiling = tpm
+        self.tpm = float(tpm)
+        self._bucket = float(tpm)
+        self._refilled_at = time.monotonic()
+        self.in_flight = 0
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self.ewma_latency = 0.0
+        self.requests = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.overloads = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+        self.tokens = 0
+
+    # --- token bucket -----------------------------------------------------
+
+    def _refill(self, now: float):
+        if self.tpm_ceiling:
+            self._bucket = min(self.tpm, self._bucket + (now - self._refilled_at) * self.tpm / 60)
+        self._refilled_at = now
+
+    def _tokens_ready(self, tokens: int) -> bool:
+        # A call larger than the whole bucket goes out once the bucket is full
+        return not self.tpm_ceiling or self._bucket >= min(tokens, self.tpm)
+
+    def _wait_for_tokens(self, tokens: int) -> float:
+        return (min(tokens, self.tpm) - self._bucket) * 60 / self.tpm
+
+    def charge(self, tokens: int):
+        """Debit tokens only known after the call, such as the completion."""
+        self.tokens += tokens
+        if self.tpm_ceiling:
+            self._refill(time.monotonic())
+            self._bucket -= tokens
+
+    # --- admission --------------------------------------------------------
+
+    def _admit(self, tokens: int):
+        self.in_flight += 1
+        self.tokens += tokens
+        if self.tpm_ceiling:
+            self._bucket -= tokens
+
+    def _wake(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            head = self._waiters[0]
+            if head.future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            elif self.in_flight >= int(self.limit):
+                return  # the next release wakes us
+            elif not self._tokens_ready(head.tokens):
+                delay = self._wait_for_tokens(head.tokens)
+            else:
+                heapq.heappop(self._waiters)
+                self._admit(head.tokens)
+                head.future.set_result(None)
+                continue
+            self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+            return
+
+    async def acquire(self, tokens: int, priority: int):
+        now = time.monotonic()
+        self._refill(now)
+        self.requests[priority] += 1
+        if (
+            not self._waiters
+            and now >= self._paused_until
+            and self.in_flight < int(self.limit)
+            and self._tokens_ready(tokens)
+        ):
+            self._admit(tokens)
+            return
+        waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        if self._timer is None:
+            self._wake()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we were cancelled: hand the slot on
+                self.in_flight -= 1
+                self._schedule_wake()
+            raise
+
+    def _schedule_wake(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._wake()
+
+    # --- AIMD -------------------------------------------------------------
+
+    def release(self, started: float, latency: float, error: Optional[BaseException] = None):
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        now = time.monotonic()
+        overload = error is not None and _is_overload(error)
+        if error is None or overload:
+            self.ewma_latency = latency if not self.ewma_latency else 0.8 * self.ewma_latency + 0.2 * latency
+        if overload:
+            self.overloads += 1
+            self._paused_until = max(self._paused_until, now + _retry_after(error))
+            self._decrease(started, now)
+        elif error is not None:
+            self.errors += 1
+        elif latency > self.latency_target:
+            self._decrease(started, now)
+        elif saturated or self._waiters:
+            self._increase()
+        self._schedule_wake()
+
+    def _increase(self):
+        # +1 per round of `limit` completions, like TCP congestion avoidance
+        if self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.increases += 1
+        if self.tpm_ceiling and self.tpm < self.tpm_ceiling:
+            self.tpm = min(self.tpm_ceiling, self.tpm + self.tpm_ceiling * LIMIT_TPM_STEP / self.limit)
+
+    def _decrease(self, started: float, now: float):
+        # Calls already in flight at the last cut report the same congestion
+        if started < self._last_decrease:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        if self.tpm_ceiling:
+            self.tpm = max(self.tpm_ceiling * 0.05, self.tpm * self.backoff)
+            self._bucket = min(self._bucket, self.tpm)
+        self.decreases += 1
+
+    async def run(self, tokens: int, call):
+        """Await `call()` under the limiter, charging `tokens` up front."""
+        await self.acquire(tokens, current_priority())
+        started = time.monotonic()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self.abandon()
+            raise
+        except Exception as e:
+            self.release(started, time.monotonic() - started, e)
+            raise
+        if hasattr(result, "__aiter__"):
+            # Streaming responses hold their slot until the stream is drained
+            return _LimitedStream(self, result, started)
+        self.release(started, time.monotonic() - started)
+        return result
+
+    def abandon(self):
+        """Free a slot whose call never completed; its latency says nothing about the provider."""
+        self.in_flight -= 1
+        self._schedule_wake()
+
+    def stats(self) -> dict:
+        waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        for waiter in self._waiters:
+            if not waiter.future.done():
+                waiting[waiter.priority] += 1
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.maximum,
+            "in_flight": self.in_flight,
+            "waiting_interactive": waiting[INTERACTIVE],
+            "waiting_background": waiting[BACKGROUND],
+            "tpm": round(self.tpm) if self.tpm_ceiling else None,
+            "tpm_ceiling": self.tpm_ceiling or None,
+            "tokens_available": round(self._bucket) if self.tpm_ceiling else None,
+            "paused": time.monotonic() < self._paused_until,
+            "ewma_latency": self.ewma_latency,
+            "interactive_requests": self.requests[INTERACTIVE],
+            "background_requests": self.requests[BACKGROUND],
+            "tokens": self.tokens,
+            "overloads": self.overloads,
+            "errors": self.errors,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+llm_limiter = AdaptiveLimiter("llm", LLM_LIMIT_INITIAL, LLM_LIMIT_MAX, LLM_LIMIT_LATENCY_TARGET, LLM_LIMIT_TPM)
+embedding_limiter = AdaptiveLimiter(
+    "embedding", EMBED_LIMIT_INITIAL, EMBED_LIMIT_MAX, EMBED_LIMIT_LATENCY_TARGET, EMBED_LIMIT_TPM
+)
+
+
+def _prompt_tokens(prompt, system_prompt, history_messages) -> int:
+    text = [prompt or "", system_prompt or ""]
+    text.extend(str(m.get("content", "")) for m in history_messages or [])
+    return sum(estimate_tokens(t) for t in text)
+
+
+class _LimitedStream:
+    """A streaming response that holds its limiter slot until drained, closed or dropped.
+
+    A generator would only release in its `finally`, which never runs for a
+    stream that is dropped before its first `__anext__`. Latency is measured to
+    the first chunk: the rest of a stream's duration depends on the answer's
+    length and on how fast the client reads, not on provider congestion. A
+    stream cancelled or closed before its first chunk frees its slot without
+    reporting anything.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, chunks, started: float):
+        self._limiter = limiter
+        self._chunks = chunks
+        self._started = started
+        self._loop = asyncio.get_running_loop()
+        self._first_chunk: Optional[float] = None
+        self._released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._released:
+            raise StopAsyncIteration
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._release()
+            raise
+        except Exception as e:
+            self._release(e)
+            raise
+        except BaseException:
+            # Cancelled, e.g. the client disconnected: not a completed call
+            self._abandon()
+            raise
+        if self._first_chunk is None:
+            self._first_chunk = time.monotonic() - self._started
+        if isinstance(chunk, str):
+            self._limiter.charge(estimate_tokens(chunk))
+        return chunk
+
+    async def aclose(self):
+        try:
+            if hasattr(self._chunks, "aclose"):
+                await self._chunks.aclose()
+        finally:
+            if self._first_chunk is not None:
+                self._release()
+            else:
+                self._abandon()
+
+    def _release(self, error: Optional[BaseException] = None):
+        if not self._released:
+            self._released = True
+            latency = self._first_chunk if self._first_chunk is not None else time.monotonic() - self._started
+            self._limiter.release(self._started, latency, error)
+
+    def _abandon(self):
+        if not self._released:
+            self._released = True
+            self._limiter.abandon()
+
+    def __del__(self):
+        if self._released:
+            return
+        self._released = True
+        # May be collected off the loop thread, which must not touch the waiters' futures
+        if self._loop.is_closed():
+            self._limiter.in_flight -= 1
+        else:
+            self._loop.call_soon_threadsafe(self._limiter.abandon)
+
+
+def limited_llm_func(func, limiter: AdaptiveLimiter = llm_limiter):
+    """Wrap a LightRAG-style `llm_model_func` with the adaptive limiter."""
+
+    @wraps(func)
+    async def call(prompt, system_prompt=None, history_messages=[], **kwargs):
+        result = await limiter.run(
+            _prompt_tokens(prompt, system_prompt, history_messages),
+            lambda: func(prompt, system_prompt=system_prompt, history_messages=history_messages, **kwargs),
+        )
+        if isinstance(result, str):
+            limiter.charge(estimate_tokens(result))
+        return result
+
+    return call
+
+
+def limited_embedding_func(embedding_func: EmbeddingFunc, limiter: AdaptiveLimiter = embedding_limiter) -> EmbeddingFunc:
+    """Wrap an `EmbeddingFunc` with the adaptive limiter; goes inside the batcher and cache."""
+
+    async def embed(texts: list[str], **kwargs):
+        return await limiter.run(sum(estimate_tokens(t) for t in texts), lambda: embedding_func(texts, **kwargs))
+
+    return EmbeddingFunc(
+        embedding_dim=embedding_func.embedding_dim,
+        max_token_size=embedding_func.max_token_size,
+        func=embed,
+    )
+
+
+def _prioritized(func):
+    """Stand-in for LightRAG's call queue that turns its `_priority` into ours."""
+
+    @wraps(func)
+    async def call(*args, _priority=None, _timeout=None, _queue_timeout=None, **kwargs):
+        priority = current_priority()
+        if _priority is not None:
+            priority = INTERACTIVE if _priority <= LIGHTRAG_QUERY_PRIORITY else BACKGROUND
+        with call_priority(priority):
+            if _timeout:
+                return await asyncio.wait_for(func(*args, **kwargs), _timeout)
+            return await func(*args, **kwargs)
+
+    return call
+
+
+def bypass_call_queues(rag):
+    """Replace LightRAG's fixed-size call queues with direct, prioritized calls.
+
+    LightRAG funnels LLM and embedding calls through worker tasks with a fixed
+    concurrency, which would cap the adaptive limits and run the calls outside
+    the caller's context, losing its priority. Storages read `embedding_func`
+    at call time, so the unwrapped function can be swapped in after construction.
+    """
+    rag.llm_model_func = _prioritized(rag.llm_model_func.__wrapped__)
+    embedding_func = _prioritized(rag.embedding_func.__wrapped__)
+    for storage in (
+        rag.llm_response_cache, rag.full_docs, rag.text_chunks, rag.chunk_entity_relation_graph,
+        rag.entities_vdb, rag.relationships_vdb, rag.chunks_vdb,
+    ):
+        if getattr(storage, "embedding_func", None) is rag.embedding_func:
+            storage.embedding_func = embedding_func
+    rag.embedding_func = embedding_func
+
+
+def limiter_stats() -> dict:
+    return {limiter.name: limiter.stats() for limiter in (llm_limiter, embedding_limiter)}
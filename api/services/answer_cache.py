@@ -0,0 +1,148 @@
+"""Answer cache in front of `run_rag_agent` / `stream_rag_answer`.
+
+Two tiers share one LRU: an exact match on the normalized question, and a
+semantic match on the cosine similarity of question embeddings. Every entry
+remembers the corpus version it was answered against, so any write through
+`RAGManager.write()` invalidates it. Versions are `(workspace, corpus_version)`
+pairs, which also keeps the semantic tier from matching another workspace's answers.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Optional
+
+import numpy as np
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Minimum cosine similarity for the semantic tier; 0 disables it
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+EmbedFunc = Callable[[list[str]], Awaitable[np.ndarray]]
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+@dataclass
+class _Entry:
+    answer: str
+    version: Hashable
+    created_at: float
+    embedding: Optional[np.ndarray]
+    size: int
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+        # Stacked, normalized embeddings for the semantic tier, rebuilt lazily
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list[str] = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _valid(self, entry: _Entry, version: Hashable) -> bool:
+        return entry.version == version and time.monotonic() - entry.created_at < self.ttl
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self._matrix = None
+
+    def _semantic_index(self) -> tuple[Optional[np.ndarray], list[str]]:
+        if self._matrix is None:
+            keys = [k for k, e in self._entries.items() if e.embedding is not None]
+            self._matrix_keys = keys
+            self._matrix = np.stack([self._entries[k].embedding for k in keys]) if keys else None
+        return self._matrix, self._matrix_keys
+
+    async def embed(self, question: str, embed_func: Optional[EmbedFunc]) -> Optional[np.ndarray]:
+        if embed_func is None or self.similarity <= 0:
+            return None
+        vector = np.asarray((await embed_func([question]))[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get(
+        self, key: str, version: Hashable, embed_func: Optional[EmbedFunc] = None, question: Optional[str] = None
+    ) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """Look up an answer; also returns the question embedding so `put()` can reuse it.
+
+        `question` is the text embedded for the semantic tier (default: `key`).
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._valid(entry, version):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.answer, entry.embedding
+            self._remove(key)
+
+        embedding = await self.embed(question or key, embed_func)
+        if embedding is not None:
+            matrix, keys = self._semantic_index()
+            if matrix is not None:
+                scores = matrix @ embedding
+                for i in np.argsort(scores)[::-1]:
+                    if scores[i] < self.similarity:
+                        break
+                    candidate = self._entries.get(keys[i])
+                    if candidate is not None and self._valid(candidate, version):
+                        self._entries.move_to_end(keys[i])
+                        self.semantic_hits += 1
+                        return candidate.answer, embedding
+        self.misses += 1
+        return None, embedding
+
+    def put(self, key: str, answer: str, version: Hashable, embedding: Optional[np.ndarray] = None):
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + len(answer) + (embedding.nbytes if embedding is not None else 0)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = _Entry(answer, version, time.monotonic(), embedding, size)
+        self._bytes += size
+        self._matrix = None
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
@@ -1,16 +1,62 @@
+import os
 import asyncio
+from collections import OrderedDict, deque
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Optional
 from typing_extensions import LiteralString
 import asyncpg
+from lightrag.utils import logger
+
+from pydantic_ai.messages import (
+    ModelMessage, ModelMessagesTypeAdapter, ModelRequest, ModelResponse, TextPart, UserPromptPart
+)
+
+DEFAULT_CONVERSATION_ID = "default"
+# History window handed to the agent: the last N turns, capped by an estimated token budget
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "4000"))
+# Conversations whose parsed history is kept in memory
+HISTORY_CACHE_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_CONVERSATIONS", "1000"))
+# Write-behind buffer for chat turns: writers block once it holds this many turns
+HISTORY_WRITE_BUFFER = int(os.getenv("HISTORY_WRITE_BUFFER", "10000"))
+# A batch is flushed when it reaches this size or its first turn has waited this long
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "200"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+HISTORY_FLUSH_RETRIES = int(os.getenv("HISTORY_FLUSH_RETRIES", "3"))
+HISTORY_FLUSH_TIMEOUT = float(os.getenv("HISTORY_FLUSH_TIMEOUT", "30"))
+
+
+def estimate_tokens(message_list: str) -> int:
+    return len(message_list) // 4 + 1
+
+
+@dataclass
+class _Turn:
+    tokens: int
+    messages: list[ModelMessage]
 
-from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
 
 @dataclass
 class Database:
     pool: asyncpg.Pool
+    history_turns: int = HISTORY_MAX_TURNS
+    history_tokens: int = HISTORY_MAX_TOKENS
+    # conversation_id -> most recent turns (oldest first), parsed; LRU ordered
+    _history: OrderedDict = field(default_factory=OrderedDict)
+    # (message_list, conversation_id, token_count) rows waiting to be written
+    _writes: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(HISTORY_WRITE_BUFFER))
+    _writer: Optional[asyncio.Task] = None
+    # conversation_id -> turns queued or being written (oldest first), not yet in the table
+    _pending: dict = field(default_factory=dict)
+    # Held while a batch is written and while a history cache miss reads the table, so
+    # a reader sees each turn either in the table or in `_pending`, never both or neither
+    _write_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # conversation_id -> (summary, hash of the last turn it covers)
+    _summaries: dict = field(default_factory=dict)
+    turns_written: int = 0
+    turns_dropped: int = 0
 
     @classmethod
     @asynccontextmanager
@@ -26,28 +72,193 @@ class Database:
                     id SERIAL PRIMARY KEY,
                     message_list TEXT
                 );
+                ALTER TABLE messages
+                    ADD COLUMN IF NOT EXISTS conversation_id TEXT NOT NULL DEFAULT 'default',
+                    ADD COLUMN IF NOT EXISTS token_count INTEGER NOT NULL DEFAULT 0;
+                CREATE INDEX IF NOT EXISTS messages_conversation_id_idx
+                    ON messages (conversation_id, id);
+                CREATE TABLE IF NOT EXISTS conversation_summaries (
+                    conversation_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    covered_turn TEXT NOT NULL
+                );
                 '''
             )
         db = cls(pool)
+        db._writer = asyncio.create_task(db._write_behind())
         try:
             yield db
         finally:
-            await pool.close()
+            await db.close()
 
     async def close(self):
+        await self.stop_writer()
         await self.pool.close()
 
-    async def add_messages(self, messages: bytes):
+    # ─── Write-behind ───
+
+    async def _write_behind(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            deadline = loop.time() + HISTORY_FLUSH_INTERVAL
+            while len(batch) < HISTORY_FLUSH_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._writes.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                async with self._write_lock:
+                    try:
+                        await self._write_batch(batch)
+                    finally:
+                        self._settle(batch)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def _settle(self, batch: list[tuple]):
+        """Forget the pending turns of a batch that was written or dropped."""
+        for _, conversation_id, _ in batch:
+            pending = self._pending.get(conversation_id)
+            if pending:
+                pending.pop(0)
+                if not pending:
+                    del self._pending[conversation_id]
+
+    async def _write_batch(self, batch: list[tuple]):
+        for attempt in range(HISTORY_FLUSH_RETRIES):
+            try:
+                async with self.pool.acquire() as con:
+                    await con.copy_records_to_table(
+                        'messages', records=batch, columns=['message_list', 'conversation_id', 'token_count']
+                    )
+                self.turns_written += len(batch)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to write {len(batch)} chat turns (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+        logger.error(f"Dropped {len(batch)} chat turns after {HISTORY_FLUSH_RETRIES} failed writes")
+        self.turns_dropped += len(batch)
+
+    async def flush(self, timeout: float = HISTORY_FLUSH_TIMEOUT):
+        """Wait until every buffered turn has been written (or `timeout` passes)."""
+        try:
+            await asyncio.wait_for(self._writes.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out flushing chat history; {self._writes.qsize()} turns not written")
+
+    async def stop_writer(self):
+        if self._writer is None:
+            return
+        await self.flush()
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+
+    def write_stats(self) -> dict:
+        return {
+            "buffered": self._writes.qsize(),
+            "written": self.turns_written,
+            "dropped": self.turns_dropped,
+        }
+
+    # ─── History ───
+
+    def _cached_turns(self, conversation_id: str) -> deque:
+        turns = self._history.pop(conversation_id)
+        self._history[conversation_id] = turns
+        return turns
+
+    def _cache_turns(self, conversation_id: str, turns: deque):
+        self._history[conversation_id] = turns
+        while len(self._history) > HISTORY_CACHE_CONVERSATIONS:
+            evicted, _ = self._history.popitem(last=False)
+            self._summaries.pop(evicted, None)
+
+    async def _enqueue(self, message_list: str, conversation_id: str, messages: list[ModelMessage]):
+        tokens = estimate_tokens(message_list)
+        turn = _Turn(tokens, messages)
+        # Readers see the turn right away, before it reaches the database
+        self._pending.setdefault(conversation_id, []).append(turn)
+        if conversation_id in self._history:
+            self._cached_turns(conversation_id).append(turn)
+        await self._writes.put((message_list, conversation_id, tokens))
+
+    async def add_messages(self, messages: bytes, conversation_id: str = DEFAULT_CONVERSATION_ID):
+        """Queue messages for the write-behind writer; blocks only while the buffer is full."""
+        message_list = messages.decode() if isinstance(messages, bytes) else messages
+        await self._enqueue(message_list, conversation_id, ModelMessagesTypeAdapter.validate_json(message_list))
+
+    async def record_turn(self, user_input: str, answer: str, conversation_id: str = DEFAULT_CONVERSATION_ID):
+        turn = [
+            ModelRequest(parts=[UserPromptPart(content=user_input)]),
+            ModelResponse(parts=[TextPart(content=answer)]),
+        ]
+        await self._enqueue(ModelMessagesTypeAdapter.dump_json(turn).decode(), conversation_id, turn)
+
+    async def get_messages(self, conversation_id: str = DEFAULT_CONVERSATION_ID) -> list[ModelMessage]:
+        """Most recent history of one conversation, within `history_turns` and `history_tokens`."""
+        if conversation_id not in self._history:
+            await self._load_turns(conversation_id)
+        turns = self._cached_turns(conversation_id)
+
+        # Newest turns first until the token budget is spent; the latest turn always fits
+        window: list[_Turn] = []
+        budget = self.history_tokens
+        for turn in reversed(turns):
+            if window and turn.tokens > budget:
+                break
+            window.append(turn)
+            budget -= turn.tokens
+        messages: list[ModelMessage] = []
+        for turn in reversed(window):
+            messages.extend(turn.messages)
+        return messages
+
+    async def _load_turns(self, conversation_id: str):
+        async with self._write_lock:
+            if conversation_id in self._history:
+                return
+            async with self.pool.acquire() as con:
+                rows = await con.fetch(
+                    'SELECT message_list, token_count FROM messages '
+                    'WHERE conversation_id = $1 ORDER BY id DESC LIMIT $2',
+                    conversation_id,
+                    self.history_turns,
+                )
+            turns = deque(maxlen=self.history_turns)
+            for row in reversed(rows):
+                message_list = row['message_list']
+                tokens = row['token_count'] or estimate_tokens(message_list)
+                turns.append(_Turn(tokens, ModelMessagesTypeAdapter.validate_json(message_list)))
+            # Turns still in the write-behind buffer come after everything in the table
+            turns.extend(self._pending.get(conversation_id, ()))
+            self._cache_turns(conversation_id, turns)
+
+    async def get_summary(self, conversation_id: str) -> tuple[Optional[str], Optional[str]]:
+        """Rolling summary of a conversation's older turns and the hash of the last turn it covers."""
+        if conversation_id not in self._summaries:
+            async with self.pool.acquire() as con:
+                row = await con.fetchrow(
+                    'SELECT summary, covered_turn FROM conversation_summaries WHERE conversation_id = $1',
+                    conversation_id,
+                )
+            self._summaries[conversation_id] = (row['summary'], row['covered_turn']) if row else (None, None)
+        return self._summaries[conversation_id]
+
+    async def save_summary(self, conversation_id: str, summary: str, covered_turn: str):
+        self._summaries[conversation_id] = (summary, covered_turn)
         async with self.pool.acquire() as con:
             await con.execute(
-                'INSERT INTO messages (message_list) VALUES ($1);',
-                messages.decode() if isinstance(messages, bytes) else messages
+                'INSERT INTO conversation_summaries (conversation_id, summary, covered_turn) VALUES ($1, $2, $3) '
+                'ON CONFLICT (conversation_id) DO UPDATE SET summary = $2, covered_turn = $3',
+                conversation_id,
+                summary,
+                covered_turn,
             )
-
-    async def get_messages(self) -> list[ModelMessage]:
-        async with self.pool.acquire() as con:
-            rows = await con.fetch('SELECT message_list FROM messages ORDER BY id')
-            messages: list[ModelMessage] = []
-            for row in rows:
-                messages.extend(ModelMessagesTypeAdapter.validate_json(row['message_list']))
-            return messages
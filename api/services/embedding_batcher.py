@@ -0,0 +1,147 @@
+"""Micro-batching for embedding calls.
+
+LightRAG embeds in many small, concurrent calls (one per query, one per
+entity/relation batch during ingestion). The batcher holds each call for at
+most `EMBED_BATCH_WINDOW` seconds, merges whatever arrived in that window into
+one provider request and hands every caller back its own rows.
+"""
+
+import os
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from lightrag.utils import EmbeddingFunc
+
+from .adaptive_limiter import call_priority, current_priority
+
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW", "0.01"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Token budget per provider request; defaults to the wrapped func's MAX_EMBED_TOKENS
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "0"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting a batch
+    return len(text) // 4 + 1
+
+
+@dataclass
+class _Pending:
+    texts: list[str]
+    tokens: int
+    future: asyncio.Future
+    priority: int
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        embedding_func: EmbeddingFunc,
+        max_batch_size: int = EMBED_BATCH_SIZE,
+        max_tokens: Optional[int] = None,
+        window: float = EMBED_BATCH_WINDOW,
+    ):
+        self.embedding_func = embedding_func
+        self.max_batch_size = max_batch_size
+        self.max_tokens = max_tokens or EMBED_BATCH_MAX_TOKENS or embedding_func.max_token_size
+        self.window = window
+        self._pending: list[_Pending] = []
+        self._pending_texts = 0
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending: set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, texts: list[str], **kwargs) -> np.ndarray:
+        if kwargs or not texts:
+            # Provider options can't be merged across callers
+            return await self.embedding_func(texts, **kwargs)
+        loop = asyncio.get_running_loop()
+        pending = _Pending(list(texts), sum(estimate_tokens(t) for t in texts), loop.create_future(), current_priority())
+        self._pending.append(pending)
+        self._pending_texts += len(pending.texts)
+        self._pending_tokens += pending.tokens
+        self.requests += 1
+        if self._pending_texts >= self.max_batch_size or self._pending_tokens >= self.max_tokens:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await pending.future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        self._pending_texts = self._pending_tokens = 0
+        batch: list[_Pending] = []
+        size = tokens = 0
+        for item in pending:
+            # A single caller larger than the limits still goes out on its own
+            if batch and (size + len(item.texts) > self.max_batch_size or tokens + item.tokens > self.max_tokens):
+                self._dispatch(batch)
+                batch, size, tokens = [], 0, 0
+            batch.append(item)
+            size += len(item.texts)
+            tokens += item.tokens
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: list[_Pending]):
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: list[_Pending]):
+        texts = [t for item in batch for t in item.texts]
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            # A merged request is as urgent as its most urgent caller
+            with call_priority(min(item.priority for item in batch)):
+                vectors = np.asarray(await self.embedding_func(texts))
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        except BaseException:
+            # The send itself was cancelled (e.g. at shutdown); don't leave its callers waiting forever
+            for item in batch:
+                item.future.cancel()
+            raise
+        offset = 0
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(vectors[offset:offset + len(item.texts)])
+            offset += len(item.texts)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+_batchers: list[EmbeddingBatcher] = []
+
+
+def batched_embedding_func(embedding_func: EmbeddingFunc) -> EmbeddingFunc:
+    """Wrap an `EmbeddingFunc` so concurrent calls share provider requests."""
+    batcher = EmbeddingBatcher(embedding_func)
+    _batchers.append(batcher)
+    return EmbeddingFunc(
+        embedding_dim=embedding_func.embedding_dim,
+        max_token_size=embedding_func.max_token_size,
+        func=batcher.embed,
+    )
+
+
+def embedding_batcher_stats() -> list[dict]:
+    return [batcher.stats() for batcher in _batchers]
@@ -0,0 +1,239 @@
+"""Persistent embedding cache keyed by content hash.
+
+Vectors live in a memory-mapped float32 file (one row per text) next to an
+append-only index of fixed-width lines, where line N holds the hash of row N's
+text and a CRC32 of the row. The vector file is grown ahead of use and padded
+with zeros, so its size says nothing about which rows were written; the index
+is the record of committed rows, and on open it is cut at the first line whose
+row fails its checksum. Lookups read rows straight out of the mapping, and both
+files survive restarts, so re-ingesting unchanged text or repeating a query
+never reaches the provider.
+
+Several processes (uvicorn workers, the API and the ingestion script) can share
+one cache directory. Appending and growing the files happen under an exclusive
+`flock` on a lock file. Under that lock a process first indexes the lines the
+others appended, so its new rows go after theirs. The vector file is only ever
+grown, never truncated.
+"""
+
+import os
+import re
+import zlib
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+from lightrag.utils import EmbeddingFunc
+
+# Shared cache directory; defaults to <working_dir>/embedding_cache
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR")
+
+_KEY_LEN = 32  # hex chars of the truncated sha256 digest
+# "<key> <crc32 hex>\n"
+_LINE_LEN = _KEY_LEN + 10
+
+
+def content_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()[:_KEY_LEN]
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model: str, dim: int):
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.model = model
+        self.dim = dim
+        self.vectors_file = os.path.join(directory, f"{slug}-{dim}.f32")
+        self.index_file = os.path.join(directory, f"{slug}-{dim}.crc.idx")
+        # Hash-only index of earlier versions, converted on first open
+        self._legacy_index_file = os.path.join(directory, f"{slug}-{dim}.idx")
+        self._lock_fd = os.open(os.path.join(directory, f"{slug}-{dim}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.hits = 0
+        self.misses = 0
+        self._rows: dict[str, int] = {}
+        # Index lines read so far; a key written twice by racing processes has two
+        self._lines = 0
+        self._mm: Optional[np.memmap] = None
+        self._capacity = 0
+        self._load()
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._locked():
+            if not os.path.exists(self.vectors_file):
+                open(self.vectors_file, "wb").close()
+            self._remap()
+            if not os.path.exists(self.index_file) and os.path.exists(self._legacy_index_file):
+                self._convert_legacy_index()
+            self._catch_up()
+        self._index = open(self.index_file, "ab")
+
+    def _remap(self):
+        """Map the whole vector file, which another process may have grown."""
+        rows = os.path.getsize(self.vectors_file) // (self.dim * 4)
+        if rows > self._capacity:
+            if self._mm is not None:
+                self._mm.flush()
+            self._mm = np.memmap(self.vectors_file, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+            self._capacity = rows
+
+    def _catch_up(self):
+        """Index the lines appended since the last read; the caller holds the lock.
+
+        Writers finish their lines under the lock, so an invalid line is left by
+        a crash: a torn line, or one whose row never reached the disk. The index
+        is cut there so later appends are not written after it.
+        """
+        self._remap()
+        start = self._lines * _LINE_LEN
+        with open(self.index_file, "a+b") as f:
+            f.seek(start)
+            data = f.read()
+            valid = 0
+            for i in range(0, len(data) - _LINE_LEN + 1, _LINE_LEN):
+                row, line = self._lines, data[i:i + _LINE_LEN]
+                if row >= self._capacity or line[_KEY_LEN:_KEY_LEN + 1] != b" " or line[-1:] != b"\n":
+                    break
+                try:
+                    crc = int(line[_KEY_LEN + 1:-1], 16)
+                except ValueError:
+                    break
+                if zlib.crc32(self._mm[row].tobytes()) != crc:
+                    break
+                self._rows[line[:_KEY_LEN].decode()] = row
+                self._lines += 1
+                valid = i + _LINE_LEN
+            if valid < len(data):
+                f.truncate(start + valid)
+
+    def _convert_legacy_index(self):
+        """Checksum the rows a hash-only index lists, trusting them as that version did."""
+        with open(self._legacy_index_file, "rb") as f:
+            data = f.read()
+        lines = []
+        for row, i in enumerate(range(0, len(data) - _KEY_LEN, _KEY_LEN + 1)):
+            if row >= self._capacity:
+                break
+            lines.append(data[i:i + _KEY_LEN] + b" %08x\n" % zlib.crc32(self._mm[row].tobytes()))
+        with open(self.index_file + ".tmp", "wb") as f:
+            f.write(b"".join(lines))
+        os.replace(self.index_file + ".tmp", self.index_file)
+        os.remove(self._legacy_index_file)
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity * 2, 1024)
+        if self._mm is not None:
+            self._mm.flush()
+        with open(self.vectors_file, "r+b") as f:
+            # Never shrink: the file may be larger than this process has mapped
+            if os.fstat(f.fileno()).st_size < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        self._remap()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Zero-copy view of a cached vector, or None."""
+        row = self._rows.get(key)
+        return None if row is None else self._mm[row]
+
+    def add(self, keys: list[str], vectors: np.ndarray):
+        with self._locked():
+            # Rows other processes added since our last write come first
+            self._catch_up()
+            new = {k: v for k, v in zip(keys, vectors) if k not in self._rows}
+            if not new:
+                return
+            start = self._lines
+            self._ensure_capacity(start + len(new))
+            lines = []
+            for offset, (key, vector) in enumerate(new.items()):
+                self._mm[start + offset] = vector
+                lines.append(key.encode() + b" %08x\n" % zlib.crc32(self._mm[start + offset].tobytes()))
+            self._index.write(b"".join(lines))
+            self._index.flush()
+            for offset, key in enumerate(new):
+                self._rows[key] = start + offset
+            self._lines += len(new)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+        self._index.close()
+        os.close(self._lock_fd)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "entries": len(self._rows),
+            "bytes": len(self._rows) * self.dim * 4,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_caches: dict[tuple[str, str, int], EmbeddingCache] = {}
+
+
+def get_embedding_cache(directory: str, model: str, dim: int) -> EmbeddingCache:
+    key = (os.path.abspath(directory), model, dim)
+    if key not in _caches:
+        _caches[key] = EmbeddingCache(directory, model, dim)
+    return _caches[key]
+
+
+def cached_embedding_func(embedding_func: EmbeddingFunc, model: str, working_dir: str) -> EmbeddingFunc:
+    """Wrap an `EmbeddingFunc` so only texts missing from the cache reach the provider."""
+    directory = EMBED_CACHE_DIR or os.path.join(working_dir, "embedding_cache")
+    cache = get_embedding_cache(directory, model, embedding_func.embedding_dim)
+
+    async def embed(texts: list[str], **kwargs) -> np.ndarray:
+        keys = [content_key(model, t) for t in texts]
+        result = np.empty((len(texts), cache.dim), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            vector = cache.get(key)
+            if vector is None:
+                missing.append(i)
+            else:
+                result[i] = vector
+        cache.hits += len(texts) - len(missing)
+        cache.misses += len(missing)
+        if missing:
+            vectors = np.asarray(await embedding_func([texts[i] for i in missing], **kwargs), dtype=np.float32)
+            if vectors.shape[1] != cache.dim:
+                # Provider dimension differs from the declared one: don't cache, don't mix
+                if len(missing) == len(texts):
+                    return vectors
+                raise ValueError(f"Embedding dim {vectors.shape[1]} does not match declared {cache.dim}")
+            result[missing] = vectors
+            cache.add([keys[i] for i in missing], vectors)
+        return result
+
+    return EmbeddingFunc(
+        embedding_dim=embedding_func.embedding_dim,
+        max_token_size=embedding_func.max_token_size,
+        func=embed,
+    )
+
+
+def embedding_cache_stats() -> list[dict]:
+    return [cache.stats() for cache in _caches.values()]
+
+
+def close_embedding_caches():
+    for cache in _caches.values():
+        cache.close()
+    _caches.clear()
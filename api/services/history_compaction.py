@@ -0,0 +1,171 @@
+"""Token-budgeted compaction of conversation history.
+
+The most recent turns are passed to the model verbatim, as many as fit in
+`HISTORY_PROMPT_TOKENS`. Older turns are folded into a rolling summary that is
+stored per conversation. The summary remembers the last turn it covers, so each
+turn is summarized once and later requests reuse the stored text.
+
+Compaction itself never calls the LLM: it uses whatever summary is stored. The
+summary is refreshed in the background once a turn has been recorded (see
+`schedule_summary_refresh`), so it can lag a turn behind.
+"""
+
+import os
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Optional
+
+from lightrag.utils import logger
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+
+from .rag_manager import DEFAULT_WORKSPACE, get_manager
+
+HISTORY_PROMPT_TOKENS = int(os.getenv("HISTORY_PROMPT_TOKENS", "1500"))
+# Turns kept verbatim even when they alone exceed the budget
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "1"))
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant "
+    "about Pydantic documentation. Keep facts, decisions, names, code identifiers and open "
+    "questions; drop pleasantries. Answer with the updated summary only, at most 200 words."
+)
+
+Turn = list[dict[str, str]]
+Summarize = Callable[[Optional[str], list[Turn]], Awaitable[str]]
+
+_stats = {
+    "requests": 0,
+    "compacted": 0,
+    "summaries_computed": 0,
+    "summaries_reused": 0,
+    "summary_refresh_failures": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _turn_tokens(turn: Turn) -> int:
+    return sum(estimate_tokens(m["content"]) for m in turn)
+
+
+def turn_hash(turn: Turn) -> str:
+    return hashlib.md5("\0".join(f"{m['role']}:{m['content']}" for m in turn).encode("utf-8")).hexdigest()
+
+
+def to_turns(messages: list[ModelMessage]) -> list[Turn]:
+    """Group pydantic-ai messages into user/assistant turns of `{"role", "content"}` dicts."""
+    turns: list[Turn] = []
+    for message in messages:
+        if isinstance(message, ModelRequest):
+            text = "\n".join(p.content for p in message.parts if isinstance(p, UserPromptPart) and isinstance(p.content, str))
+            if text:
+                turns.append([{"role": "user", "content": text}])
+        elif isinstance(message, ModelResponse):
+            text = "".join(p.content for p in message.parts if isinstance(p, TextPart))
+            if text and turns:
+                turns[-1].append({"role": "assistant", "content": text})
+    return turns
+
+
+async def summarize_turns(summary: Optional[str], turns: list[Turn], workspace: str = DEFAULT_WORKSPACE) -> str:
+    """Fold `turns` into `summary` with the workspace's LightRAG LLM (and its response cache)."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for turn in turns for m in turn)
+    prompt = f"Current summary:\n{summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+    async with get_manager(workspace).use() as rag:
+        return await rag.llm_model_func(prompt, system_prompt=SUMMARY_SYSTEM_PROMPT)
+
+
+def _split(turns: list[Turn]) -> tuple[list[Turn], list[Turn]]:
+    """(older, recent): the newest turns that fit `HISTORY_PROMPT_TOKENS`, and the rest."""
+    keep = 0
+    budget = HISTORY_PROMPT_TOKENS
+    for turn in reversed(turns):
+        tokens = _turn_tokens(turn)
+        if keep >= HISTORY_KEEP_TURNS and tokens > budget:
+            break
+        keep += 1
+        budget -= tokens
+    return turns[:len(turns) - keep], turns[len(turns) - keep:]
+
+
+async def compact_history(messages: list[ModelMessage], conversation_id: str, db=None) -> list[dict[str, str]]:
+    """Return `conversation_history` for a `QueryParam`, within `HISTORY_PROMPT_TOKENS`."""
+    turns = to_turns(messages)
+    older, recent = _split(turns)
+    summary, _ = (await db.get_summary(conversation_id)) if db is not None else (None, None)
+
+    history: list[dict[str, str]] = []
+    if summary:
+        history.append({"role": "user", "content": f"Summary of our earlier conversation:\n{summary}"})
+        history.append({"role": "assistant", "content": "Understood."})
+    for turn in recent:
+        history.extend(turn)
+
+    _stats["requests"] += 1
+    _stats["compacted"] += 1 if older else 0
+    _stats["tokens_before"] += sum(_turn_tokens(t) for t in turns)
+    _stats["tokens_after"] += sum(estimate_tokens(m["content"]) for m in history)
+    return history
+
+
+async def refresh_summary(
+    messages: list[ModelMessage],
+    conversation_id: str,
+    db,
+    summarize: Summarize = summarize_turns,
+):
+    """Fold the turns that fell out of the verbatim window into the stored summary."""
+    older, recent = _split(to_turns(messages))
+    if not older:
+        return
+    summary, covered = await db.get_summary(conversation_id)
+    hashes = [turn_hash(t) for t in older]
+    if covered in hashes:
+        # Only turns after the last summarized one are new
+        start = len(hashes) - hashes[::-1].index(covered)
+    elif covered is not None and covered in {turn_hash(t) for t in recent}:
+        start = len(older)
+    else:
+        start = 0
+    if start == len(older):
+        _stats["summaries_reused"] += 1
+        return
+    summary = await summarize(summary, older[start:])
+    _stats["summaries_computed"] += 1
+    await db.save_summary(conversation_id, summary, hashes[-1])
+
+
+_refreshing: dict[str, asyncio.Task] = {}
+
+
+def schedule_summary_refresh(conversation_id: str, db, workspace: str = DEFAULT_WORKSPACE):
+    """Refresh a conversation's summary off the response path; one refresh per conversation at a time."""
+    if conversation_id in _refreshing:
+        return  # the next recorded turn schedules another
+
+    async def refresh():
+        try:
+            messages = await db.get_messages(conversation_id)
+            await refresh_summary(
+                messages, conversation_id, db, lambda summary, turns: summarize_turns(summary, turns, workspace)
+            )
+        except Exception as e:
+            _stats["summary_refresh_failures"] += 1
+            logger.warning(f"Failed to refresh the summary of conversation {conversation_id}: {e}")
+        finally:
+            _refreshing.pop(conversation_id, None)
+
+    _refreshing[conversation_id] = asyncio.create_task(refresh())
+
+
+def compaction_stats() -> dict:
+    requests = _stats["requests"]
+    return {
+        **_stats,
+        "avg_tokens_before": _stats["tokens_before"] / requests if requests else 0.0,
+        "avg_tokens_after": _stats["tokens_after"] / requests if requests else 0.0,
+    }
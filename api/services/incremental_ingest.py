@@ -0,0 +1,648 @@
+"""Incremental (re-)ingestion: only the chunks that changed are embedded and extracted.
+
+LightRAG chunks a document into fixed token windows, so editing one paragraph
+shifts every later chunk, and `ainsert` of a changed document redoes all of
+them. Here documents are cut into content-defined chunks instead. Chunks are
+packed from whole paragraphs, and a chunk ends after a paragraph whose hash is
+0 modulo `INCREMENTAL_CDC_DIVISOR`. An edit therefore only changes the chunks
+around it, and the cut points resynchronize right after.
+
+Chunk ids are content hashes (as in LightRAG). Two KV namespaces form a
+reverse index from documents to what they contributed:
+
+    doc_chunks   doc id   -> ordered chunk ids of the document
+    chunk_graph  chunk id -> documents containing the chunk, and the entities
+                             and relations extracted from it
+
+Re-ingesting a document diffs the new chunk ids against `doc_chunks`:
+
+    added    embedded into chunks_vdb, extracted and merged into the graph
+    shared   already ingested for another document; only indexed for this one
+    removed  retracted once no document contains them: deleted from the chunk
+             stores and dropped from the source_id of the entities and relations
+             listed in `chunk_graph`; those left without sources are deleted
+    reused   kept as they are; only their text_chunks metadata is refreshed
+
+Deleting a document retracts all of its chunks, so updates and deletions touch
+only the records the document contributed to. While a document is processed
+it claims its id and its old and new chunk ids, so documents that share chunks
+are applied one after another and each shared chunk is extracted once. Chunks ingested before the index
+existed are indexed with one scan of the graph the first time they are retracted.
+Chunking large documents and writing the JSON stores run in the ingest process
+pool (see ingest_pool.py).
+"""
+
+import os
+import re
+import time
+import asyncio
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from lightrag.lightrag import LightRAG
+from lightrag.base import BaseKVStorage, DocStatus
+from lightrag.namespace import make_namespace
+from lightrag.operate import extract_entities, merge_nodes_and_edges
+from lightrag.prompt import GRAPH_FIELD_SEP
+from lightrag.kg.json_kv_impl import JsonKVStorage
+from lightrag.kg.json_doc_status_impl import JsonDocStatusStorage
+from lightrag.kg.shared_storage import (
+    clear_all_update_flags, get_graph_db_lock, get_namespace_data, get_pipeline_status_lock
+)
+from lightrag.utils import TiktokenTokenizer, compute_mdhash_id, get_content_summary, logger
+
+from .ingest_pool import INGEST_POOL_MIN_CHARS, run_in_pool, worker_tokenizer, write_json_file
+
+DOC_CHUNKS_NAMESPACE = "doc_chunks"
+CHUNK_GRAPH_NAMESPACE = "chunk_graph"
+# On average one paragraph in this many ends a chunk (besides the token limit)
+INCREMENTAL_CDC_DIVISOR = int(os.getenv("INCREMENTAL_CDC_DIVISOR", "4"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+_GRAPH_COUNTS = ("entities_deleted", "entities_updated", "relations_deleted", "relations_updated")
+
+_stats = {
+    "documents": 0,
+    "unchanged": 0,
+    "deleted": 0,
+    "chunks_reused": 0,
+    "chunks_shared": 0,
+    "chunks_added": 0,
+    "chunks_removed": 0,
+    **dict.fromkeys(_GRAPH_COUNTS, 0),
+    "index_backfills": 0,
+    "seconds": 0.0,
+}
+
+
+def attach_index(rag: LightRAG):
+    """Create the index namespaces in the instance's KV backend as `rag.doc_chunks` / `rag.chunk_graph`.
+
+    They are not part of LightRAG's own storages, so the caller initializes and
+    finalizes them (see `index_storages`).
+    """
+    for attr, namespace in (("doc_chunks", DOC_CHUNKS_NAMESPACE), ("chunk_graph", CHUNK_GRAPH_NAMESPACE)):
+        setattr(rag, attr, rag.key_string_value_json_storage_cls(
+            namespace=make_namespace(rag.namespace_prefix, namespace),
+            embedding_func=rag.embedding_func,
+        ))
+    # Claimed document / chunk ids -> future resolved when their claim is released
+    rag.chunk_claims = {}
+
+
+def index_storages(rag: LightRAG) -> tuple[BaseKVStorage, BaseKVStorage]:
+    return rag.doc_chunks, rag.chunk_graph
+
+
+def _is_cut(paragraph: str) -> bool:
+    return int(compute_mdhash_id(paragraph)[:8], 16) % INCREMENTAL_CDC_DIVISOR == 0
+
+
+def cut_chunks(
+    tokenizer, chunking_func, content: str, max_tokens: int, overlap_tokens: int
+) -> list[tuple[str, str, int]]:
+    """Cut `content` at content-defined paragraph boundaries into `(chunk id, text, tokens)` in document order.
+
+    Chunks hold at most `max_tokens` tokens. A paragraph longer than that is
+    split with `chunking_func`, and each of its pieces is a chunk.
+    """
+    min_tokens = max_tokens // 4
+    pieces: list[tuple[str, int, bool]] = []
+    for paragraph in _PARAGRAPH_BREAK.split(content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = len(tokenizer.encode(paragraph))
+        if tokens <= max_tokens:
+            pieces.append((paragraph, tokens, _is_cut(paragraph)))
+            continue
+        for dp in chunking_func(tokenizer, paragraph, None, False, overlap_tokens, max_tokens):
+            pieces.append((dp["content"], dp["tokens"], True))
+
+    groups: list[tuple[list[str], int]] = []
+    current, size = [], 0
+    for text, tokens, cut in pieces:
+        if current and size + tokens > max_tokens:
+            groups.append((current, size))
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+        if cut and size >= min_tokens:
+            groups.append((current, size))
+            current, size = [], 0
+    if current:
+        groups.append((current, size))
+
+    chunks = []
+    for texts, tokens in groups:
+        chunk = "\n\n".join(texts)
+        chunks.append((compute_mdhash_id(chunk, prefix="chunk-"), chunk, tokens))
+    return chunks
+
+
+def _cut_chunks_in_worker(model_name: str, chunking_func, content: str, max_tokens: int, overlap_tokens: int):
+    return cut_chunks(worker_tokenizer(model_name), chunking_func, content, max_tokens, overlap_tokens)
+
+
+def _chunk_records(cut: list[tuple[str, str, int]], doc_id: str, file_path: str) -> dict[str, dict]:
+    return {
+        chunk_id: {
+            "tokens": tokens,
+            "content": chunk,
+            "chunk_order_index": index,
+            "full_doc_id": doc_id,
+            "file_path": file_path,
+        }
+        for index, (chunk_id, chunk, tokens) in enumerate(cut)
+    }
+
+
+def content_defined_chunks(rag: LightRAG, doc_id: str, content: str, file_path: str) -> dict[str, dict]:
+    """Chunk `content` with the instance's tokenizer and chunk size, keyed by chunk id in document order."""
+    cut = cut_chunks(rag.tokenizer, rag.chunking_func, content, rag.chunk_token_size, rag.chunk_overlap_token_size)
+    return _chunk_records(cut, doc_id, file_path)
+
+
+def _poolable(rag: LightRAG) -> bool:
+    # Workers rebuild tiktoken tokenizers by model name and import the chunking function by reference
+    return type(rag.tokenizer) is TiktokenTokenizer and "<" not in getattr(rag.chunking_func, "__qualname__", "<")
+
+
+async def chunk_document(rag: LightRAG, doc_id: str, content: str, file_path: str) -> dict[str, dict]:
+    """`content_defined_chunks`, run in the ingest pool for documents of `INGEST_POOL_MIN_CHARS` or more."""
+    if len(content) < INGEST_POOL_MIN_CHARS or not _poolable(rag):
+        return content_defined_chunks(rag, doc_id, content, file_path)
+    cut = await run_in_pool(
+        _cut_chunks_in_worker, rag.tokenizer.model_name, rag.chunking_func, content,
+        rag.chunk_token_size, rag.chunk_overlap_token_size,
+    )
+    return _chunk_records(cut, doc_id, file_path)
+
+
+@dataclass
+class ChunkDiff:
+    doc_id: str
+    content: str
+    file_path: str
+    chunks: dict[str, dict]
+    added: dict[str, dict]
+    # Chunk id -> chunk_graph entry, for new chunks another document already contributed
+    shared: dict[str, dict]
+    removed: list[str]
+    reused: int
+    unchanged: bool
+    created_at: str
+    report: dict = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    claim: Optional[tuple[frozenset, asyncio.Future]] = None
+
+
+async def _claim(rag: LightRAG, keys: set) -> tuple[frozenset, asyncio.Future]:
+    """Wait until none of `keys` is claimed, then claim them all at once."""
+    keys = frozenset(keys)
+    while True:
+        busy = {rag.chunk_claims[key] for key in keys if key in rag.chunk_claims}
+        if not busy:
+            break
+        await asyncio.wait(busy)
+    released = asyncio.get_running_loop().create_future()
+    for key in keys:
+        rag.chunk_claims[key] = released
+    return keys, released
+
+
+def release_claim(rag: LightRAG, diff: ChunkDiff):
+    """Let other documents touching the diff's chunks proceed; safe to call more than once."""
+    if diff.claim is None:
+        return
+    keys, released = diff.claim
+    for key in keys:
+        if rag.chunk_claims.get(key) is released:
+            del rag.chunk_claims[key]
+    released.set_result(None)
+    diff.claim = None
+
+
+async def _claim_document(rag: LightRAG, doc_id: str, chunk_ids) -> tuple[Optional[list[str]], tuple]:
+    """Claim a document with its stored and `chunk_ids` chunks; returns its stored chunk ids and the claim."""
+    while True:
+        previous = await _previous_chunk_ids(rag, doc_id)
+        claim = await _claim(rag, {("doc", doc_id), *chunk_ids, *(previous or ())})
+        # Another update of the same document may have finished while we waited
+        if await _previous_chunk_ids(rag, doc_id) == previous:
+            return previous, claim
+        keys, released = claim
+        for key in keys:
+            del rag.chunk_claims[key]
+        released.set_result(None)
+
+
+async def _previous_chunk_ids(rag: LightRAG, doc_id: str) -> Optional[list[str]]:
+    record = await rag.doc_chunks.get_by_id(doc_id)
+    if record is not None:
+        return record["chunks"]
+    if await rag.full_docs.get_by_id(doc_id) is None:
+        return None
+    # Inserted with `ainsert` before this index existed; found once by scanning text_chunks
+    get_all = getattr(rag.text_chunks, "get_all", None)
+    if get_all is None:
+        return []
+    return [
+        chunk_id for chunk_id, chunk in (await get_all()).items()
+        if isinstance(chunk, dict) and chunk.get("full_doc_id") == doc_id
+    ]
+
+
+async def diff_document(rag: LightRAG, doc_id: str, content: str, file_path: str = "unknown_source") -> ChunkDiff:
+    """Chunk the new content of `doc_id` and compare it with what is stored.
+
+    The document and its old and new chunks stay claimed until `extract_chunks`
+    finishes or `apply_chunks` fails; an unchanged document is released at once.
+    """
+    chunks = await chunk_document(rag, doc_id, content, file_path)
+    previous, claim = await _claim_document(rag, doc_id, chunks)
+    diff = ChunkDiff(
+        doc_id=doc_id, content=content, file_path=file_path, chunks=chunks, added={}, shared={}, removed=[],
+        reused=0, unchanged=False, created_at="", claim=claim,
+    )
+    try:
+        status = await rag.doc_status.get_by_id(doc_id)
+        old = set(previous or ())
+        new_ids = [chunk_id for chunk_id in chunks if chunk_id not in old]
+        entries = await rag.chunk_graph.get_by_ids(new_ids) if new_ids else []
+        diff.shared = {chunk_id: entry for chunk_id, entry in zip(new_ids, entries) if entry is not None}
+        diff.added = {chunk_id: chunks[chunk_id] for chunk_id in new_ids if chunk_id not in diff.shared}
+        diff.removed = [chunk_id for chunk_id in previous or () if chunk_id not in chunks]
+        diff.reused = len(chunks) - len(new_ids)
+        diff.unchanged = (
+            previous == list(chunks)
+            and status is not None
+            and status.get("status") == DocStatus.PROCESSED
+        )
+        now = datetime.now(tz=timezone.utc).isoformat()
+        diff.created_at = status.get("created_at", now) if status else now
+    except BaseException:
+        release_claim(rag, diff)
+        raise
+    if diff.unchanged:
+        release_claim(rag, diff)
+    return diff
+
+
+async def _set_status(rag: LightRAG, diff: ChunkDiff, status: DocStatus, error: Optional[str] = None):
+    data = {
+        "status": status,
+        "chunks_count": len(diff.chunks),
+        "content": diff.content,
+        "content_summary": get_content_summary(diff.content),
+        "content_length": len(diff.content),
+        "created_at": diff.created_at,
+        "updated_at": datetime.now(tz=timezone.utc).isoformat(),
+        "file_path": diff.file_path,
+    }
+    if error is not None:
+        data["error"] = error
+    await rag.doc_status.upsert({diff.doc_id: data})
+
+
+def _contributions(maybe_nodes: dict, maybe_edges: dict) -> dict[str, list]:
+    """What one chunk's extraction result adds to the graph, keyed as `merge_nodes_and_edges` stores it."""
+    relations = sorted({tuple(sorted(edge)) for edge in maybe_edges})
+    # Endpoints missing from the graph are created with the relation's sources
+    entities = sorted(set(maybe_nodes) | {name for edge in relations for name in edge})
+    return {"entities": entities, "relations": [list(edge) for edge in relations]}
+
+
+async def _backfill(rag: LightRAG, doc_id: str, chunk_ids: list[str]) -> dict[str, dict]:
+    """Index chunks ingested before `chunk_graph` existed, with one scan of the graph.
+
+    Every unindexed chunk the graph mentions is indexed, not only `chunk_ids`,
+    so later retractions of such chunks find their entries.
+    """
+    graph = rag.chunk_entity_relation_graph
+    found: dict[str, dict[str, set]] = {}
+    seen_edges = set()
+    for label in await graph.get_all_labels():
+        node = await graph.get_node(label)
+        for chunk_id in (node or {}).get("source_id", "").split(GRAPH_FIELD_SEP):
+            if chunk_id:
+                found.setdefault(chunk_id, {"entities": set(), "relations": set()})["entities"].add(label)
+        for edge_key in await graph.get_node_edges(label) or ():
+            edge_key = tuple(sorted(edge_key))
+            if edge_key in seen_edges:
+                continue
+            seen_edges.add(edge_key)
+            edge = await graph.get_edge(*edge_key)
+            for chunk_id in (edge or {}).get("source_id", "").split(GRAPH_FIELD_SEP):
+                if chunk_id:
+                    found.setdefault(chunk_id, {"entities": set(), "relations": set()})["relations"].add(edge_key)
+
+    missing = await rag.chunk_graph.filter_keys(set(found) | set(chunk_ids))
+    missing_ids = sorted(missing)
+    chunks = dict(zip(missing_ids, await rag.text_chunks.get_by_ids(missing_ids))) if missing_ids else {}
+    entries = {}
+    for chunk_id in missing_ids:
+        contributions = found.get(chunk_id, {"entities": set(), "relations": set()})
+        owner = (chunks.get(chunk_id) or {}).get("full_doc_id", doc_id)
+        entries[chunk_id] = {
+            "docs": [owner],
+            "entities": sorted(contributions["entities"]),
+            "relations": [list(edge) for edge in sorted(contributions["relations"])],
+        }
+    await rag.chunk_graph.upsert(entries)
+    _stats["index_backfills"] += 1
+    logger.info(f"Indexed graph contributions of {len(entries)} chunks ingested before the chunk index")
+    return entries
+
+
+async def retract_chunks(rag: LightRAG, doc_id: str, chunk_ids: list[str]) -> dict[str, int]:
+    """Remove `doc_id`'s claim on chunks; chunks no other document contains are retracted.
+
+    Retracting a chunk deletes it and removes it from the source_id of the
+    entities and relations `chunk_graph` lists for it. Those left without
+    sources are deleted; the others keep their description.
+    """
+    counts = dict.fromkeys(_GRAPH_COUNTS, 0)
+    if not chunk_ids:
+        return counts
+    entries = dict(zip(chunk_ids, await rag.chunk_graph.get_by_ids(chunk_ids)))
+    unindexed = [chunk_id for chunk_id, entry in entries.items() if entry is None]
+    if unindexed:
+        backfilled = await _backfill(rag, doc_id, unindexed)
+        for chunk_id in unindexed:
+            entries[chunk_id] = backfilled.get(chunk_id) or {"docs": [doc_id], "entities": [], "relations": []}
+
+    still_used, retracted = {}, []
+    for chunk_id, entry in entries.items():
+        docs = [d for d in entry["docs"] if d != doc_id]
+        if docs:
+            still_used[chunk_id] = {**entry, "docs": docs}
+        else:
+            retracted.append(chunk_id)
+    if still_used:
+        await rag.chunk_graph.upsert(still_used)
+        # Chunks recorded under this document are handed to one that still contains them
+        ids = list(still_used)
+        await rag.text_chunks.upsert({
+            chunk_id: {**chunk, "full_doc_id": still_used[chunk_id]["docs"][0]}
+            for chunk_id, chunk in zip(ids, await rag.text_chunks.get_by_ids(ids))
+            if chunk and chunk.get("full_doc_id") == doc_id
+        })
+    if not retracted:
+        return counts
+
+    await rag.chunks_vdb.delete(retracted)
+    await rag.text_chunks.delete(retracted)
+    await rag.chunk_graph.delete(retracted)
+    gone = set(retracted)
+    entities = sorted({name for chunk_id in retracted for name in entries[chunk_id]["entities"]})
+    relations = sorted({tuple(edge) for chunk_id in retracted for edge in entries[chunk_id]["relations"]})
+
+    graph = rag.chunk_entity_relation_graph
+    async with get_graph_db_lock(enable_logging=False):
+        dead_edges = []
+        for src, tgt in relations:
+            edge = await graph.get_edge(src, tgt)
+            if not edge or "source_id" not in edge:
+                continue
+            sources = edge["source_id"].split(GRAPH_FIELD_SEP)
+            kept = [s for s in sources if s not in gone]
+            if not kept:
+                dead_edges.append((src, tgt))
+            elif len(kept) < len(sources):
+                await graph.upsert_edge(src, tgt, {**edge, "source_id": GRAPH_FIELD_SEP.join(kept)})
+                counts["relations_updated"] += 1
+        dead_nodes = []
+        for name in entities:
+            node = await graph.get_node(name)
+            if not node or "source_id" not in node:
+                continue
+            sources = node["source_id"].split(GRAPH_FIELD_SEP)
+            kept = [s for s in sources if s not in gone]
+            if not kept:
+                dead_nodes.append(name)
+            elif len(kept) < len(sources):
+                await graph.upsert_node(name, {**node, "source_id": GRAPH_FIELD_SEP.join(kept)})
+                counts["entities_updated"] += 1
+
+        if dead_edges:
+            await rag.relationships_vdb.delete([
+                compute_mdhash_id(a + b, prefix="rel-") for src, tgt in dead_edges for a, b in ((src, tgt), (tgt, src))
+            ])
+            await graph.remove_edges(dead_edges)
+        for name in dead_nodes:
+            # Also drops the remaining relations of the entity from relationships_vdb
+            await rag.entities_vdb.delete_entity(name)
+            await rag.relationships_vdb.delete_entity_relation(name)
+        if dead_nodes:
+            await graph.remove_nodes(dead_nodes)
+        counts["entities_deleted"] = len(dead_nodes)
+        counts["relations_deleted"] = len(dead_edges)
+    return counts
+
+
+async def apply_chunks(rag: LightRAG, diff: ChunkDiff):
+    """Retract removed chunks and store and embed the added ones."""
+    try:
+        await _set_status(rag, diff, DocStatus.PROCESSING)
+        diff.report.update(await retract_chunks(rag, diff.doc_id, diff.removed))
+        await rag.chunks_vdb.upsert(diff.added)
+        # Reused chunks keep their vectors, but their order may have changed;
+        # shared chunks keep the record of the document that added them
+        await rag.text_chunks.upsert({k: v for k, v in diff.chunks.items() if k not in diff.shared})
+        await rag.full_docs.upsert({diff.doc_id: {"content": diff.content}})
+    except BaseException as e:
+        release_claim(rag, diff)
+        if isinstance(e, Exception):
+            await _set_status(rag, diff, DocStatus.FAILED, str(e))
+        raise
+
+
+async def extract_chunks(rag: LightRAG, diff: ChunkDiff, pipeline_status: dict = None, pipeline_status_lock=None):
+    """Extract entities and relations of the added chunks, index the document's chunks and release its claim.
+
+    Progress goes to LightRAG's shared pipeline status unless another one is given.
+    """
+    try:
+        await _extract_chunks(rag, diff, pipeline_status, pipeline_status_lock)
+    finally:
+        release_claim(rag, diff)
+
+
+def _merge_entry(current: Optional[dict], entry: dict) -> dict:
+    if current is None:
+        return entry
+    return {
+        "docs": [*current["docs"], *(d for d in entry["docs"] if d not in current["docs"])],
+        "entities": sorted(set(current["entities"]) | set(entry["entities"])),
+        "relations": [list(edge) for edge in sorted({tuple(e) for e in (*current["relations"], *entry["relations"])})],
+    }
+
+
+async def _extract_chunks(rag: LightRAG, diff: ChunkDiff, pipeline_status: dict, pipeline_status_lock):
+    if pipeline_status is None:
+        pipeline_status = await get_namespace_data("pipeline_status")
+        pipeline_status_lock = get_pipeline_status_lock()
+    index = {chunk_id: {"docs": [diff.doc_id], "entities": [], "relations": []} for chunk_id in diff.shared}
+    try:
+        if diff.added:
+            chunk_results = await extract_entities(
+                diff.added,
+                global_config=asdict(rag),
+                pipeline_status=pipeline_status,
+                pipeline_status_lock=pipeline_status_lock,
+                llm_response_cache=rag.llm_response_cache,
+            )
+            await merge_nodes_and_edges(
+                chunk_results=chunk_results,
+                knowledge_graph_inst=rag.chunk_entity_relation_graph,
+                entity_vdb=rag.entities_vdb,
+                relationships_vdb=rag.relationships_vdb,
+                global_config=asdict(rag),
+                pipeline_status=pipeline_status,
+                pipeline_status_lock=pipeline_status_lock,
+                llm_response_cache=rag.llm_response_cache,
+                file_path=diff.file_path,
+            )
+            # Results come back in the order of the chunks
+            for chunk_id, (maybe_nodes, maybe_edges) in zip(diff.added, chunk_results):
+                index[chunk_id] = {"docs": [diff.doc_id], **_contributions(maybe_nodes, maybe_edges)}
+    except Exception as e:
+        await _set_status(rag, diff, DocStatus.FAILED, str(e))
+        raise
+    # Merged into the entries as they are now, not as `diff_document` read them
+    ids = list(index)
+    current = dict(zip(ids, await rag.chunk_graph.get_by_ids(ids))) if ids else {}
+    await rag.chunk_graph.upsert({chunk_id: _merge_entry(current.get(chunk_id), entry) for chunk_id, entry in index.items()})
+    await rag.doc_chunks.upsert({diff.doc_id: {"chunks": list(diff.chunks)}})
+    await _set_status(rag, diff, DocStatus.PROCESSED)
+
+
+def record(diff: ChunkDiff) -> dict:
+    """Count a finished document in the totals and return its report."""
+    report = {
+        "doc_id": diff.doc_id,
+        "unchanged": diff.unchanged,
+        "chunks": len(diff.chunks),
+        "chunks_reused": diff.reused,
+        "chunks_shared": len(diff.shared),
+        "chunks_added": len(diff.added) if not diff.unchanged else 0,
+        "chunks_removed": len(diff.removed),
+        **dict.fromkeys(_GRAPH_COUNTS, 0),
+        **diff.report,
+    }
+    _stats["documents"] += 1
+    _stats["unchanged"] += diff.unchanged
+    for key in _stats:
+        if key.startswith(("chunks_", "entities_", "relations_")):
+            _stats[key] += report[key]
+    _stats["seconds"] += time.perf_counter() - diff.started
+    return report
+
+
+async def _write_json_stores(rag: LightRAG):
+    """Encode the changed whole-file JSON stores in the ingest pool.
+
+    `_insert_done` then finds them clean and skips its own in-loop `write_json`.
+    The storage lock is held until the file is written, as LightRAG does.
+    """
+    for storage in (rag.full_docs, rag.text_chunks, rag.llm_response_cache, rag.doc_status, *index_storages(rag)):
+        if not isinstance(storage, (JsonKVStorage, JsonDocStatusStorage)):
+            continue
+        async with storage._storage_lock:
+            if storage.storage_updated.value:
+                data = dict(storage._data) if hasattr(storage._data, "_getvalue") else storage._data
+                await run_in_pool(write_json_file, data, storage._file_name)
+                await clear_all_update_flags(storage.namespace)
+
+
+async def persist(rag: LightRAG):
+    """Write the instance's storages and the chunk index to disk."""
+    await _write_json_stores(rag)
+    await rag._insert_done()
+    for storage in index_storages(rag):
+        await storage.index_done_callback()
+
+
+async def upsert_documents(
+    rag: LightRAG,
+    documents: dict[str, str],
+    file_path: str = "unknown_source",
+    pipeline_status: dict = None,
+    pipeline_status_lock=None,
+) -> dict[str, Any]:
+    """Insert or update documents by id, reprocessing only their changed chunks.
+
+    Up to `rag.max_parallel_insert` documents are processed at a time. Returns
+    each document's report of reused versus reprocessed chunks and retracted
+    graph records, or the exception it failed with.
+    """
+    semaphore = asyncio.Semaphore(rag.max_parallel_insert)
+
+    async def upsert(doc_id: str, content: str) -> dict:
+        async with semaphore:
+            diff = await diff_document(rag, doc_id, content, file_path)
+            try:
+                if not diff.unchanged:
+                    await apply_chunks(rag, diff)
+                    await extract_chunks(rag, diff, pipeline_status, pipeline_status_lock)
+            finally:
+                release_claim(rag, diff)
+            report = record(diff)
+            logger.info(
+                f"Document {doc_id}: {report['chunks_reused']} chunks reused, {report['chunks_added']} added, "
+                f"{report['chunks_removed']} removed"
+            )
+            return report
+
+    results = await asyncio.gather(
+        *(upsert(doc_id, content) for doc_id, content in documents.items()), return_exceptions=True
+    )
+    await persist(rag)
+    return dict(zip(documents, results))
+
+
+async def upsert_document(
+    rag: LightRAG,
+    doc_id: str,
+    content: str,
+    file_path: str = "unknown_source",
+    pipeline_status: dict = None,
+    pipeline_status_lock=None,
+) -> dict[str, Any]:
+    """Insert or update one document; see `upsert_documents`. Raises if it fails."""
+    results = await upsert_documents(rag, {doc_id: content}, file_path, pipeline_status, pipeline_status_lock)
+    if isinstance(results[doc_id], BaseException):
+        raise results[doc_id]
+    return results[doc_id]
+
+
+async def delete_document(rag: LightRAG, doc_id: str) -> Optional[dict[str, Any]]:
+    """Retract every chunk of a document and delete it; None if it does not exist."""
+    previous, claim = await _claim_document(rag, doc_id, ())
+    diff = ChunkDiff(
+        doc_id=doc_id, content="", file_path="", chunks={}, added={}, shared={}, removed=list(previous or ()),
+        reused=0, unchanged=False, created_at="", claim=claim,
+    )
+    try:
+        if previous is None and await rag.doc_status.get_by_id(doc_id) is None:
+            return None
+        diff.report.update(await retract_chunks(rag, doc_id, diff.removed))
+        await rag.full_docs.delete([doc_id])
+        await rag.doc_status.delete([doc_id])
+        await rag.doc_chunks.delete([doc_id])
+    finally:
+        release_claim(rag, diff)
+    await persist(rag)
+    _stats["deleted"] += 1
+    return record(diff)
+
+
+def incremental_stats() -> dict:
+    processed = _stats["chunks_reused"] + _stats["chunks_shared"] + _stats["chunks_added"]
+    return {
+        **_stats,
+        "reuse_rate": (_stats["chunks_reused"] + _stats["chunks_shared"]) / processed if processed else 0.0,
+    }
@@ -0,0 +1,86 @@
+"""Process pool for the CPU-bound stages of ingestion.
+
+Tokenizing and chunking a large document, and re-encoding the JSON KV stores
+after an insert, take long enough to stall the event loop that also serves
+`/chat`. These stages run in a `ProcessPoolExecutor` of `INGEST_POOL_WORKERS`
+processes instead; 0 runs them inline. Workers are spawned, not forked, since
+the parent has an event loop and client threads running, and each keeps its
+own tokenizers. Results come back as plain tuples rather than chunk dicts.
+"""
+
+import os
+import json
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+INGEST_POOL_WORKERS = int(os.getenv("INGEST_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Documents shorter than this are chunked inline; the round trip would cost more
+INGEST_POOL_MIN_CHARS = int(os.getenv("INGEST_POOL_MIN_CHARS", "20000"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_stats = {"tasks": 0, "inline": 0, "failed": 0, "seconds": 0.0}
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if INGEST_POOL_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(INGEST_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def run_in_pool(func: Callable, *args):
+    """Run the picklable `func(*args)` in the pool, or inline when it is disabled."""
+    pool = _get_pool()
+    if pool is None:
+        _stats["inline"] += 1
+        return func(*args)
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except Exception:
+        _stats["failed"] += 1
+        raise
+    finally:
+        _stats["tasks"] += 1
+        _stats["seconds"] += time.perf_counter() - started
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+# --- worker-side functions ------------------------------------------------
+
+_tokenizers: dict = {}
+
+
+def worker_tokenizer(model_name: str):
+    """The worker's tokenizer for `model_name`, built on first use."""
+    if model_name not in _tokenizers:
+        from lightrag.utils import TiktokenTokenizer
+
+        _tokenizers[model_name] = TiktokenTokenizer(model_name)
+    return _tokenizers[model_name]
+
+
+def write_json_file(data: dict, file_name: str):
+    """Same output as LightRAG's `write_json`, replaced atomically."""
+    tmp = f"{file_name}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, file_name)
+
+
+def ingest_pool_stats() -> dict:
+    return {
+        "workers": INGEST_POOL_WORKERS if _pool is not None else 0,
+        **_stats,
+    }
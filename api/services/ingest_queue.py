@@ -0,0 +1,217 @@
+"""Background ingestion queue for `/docs/insert`.
+
+Documents are written to a small on-disk journal and acknowledged with a job ID
+straight away. A bounded pool of workers drains the queue, merging whatever is
+waiting into one batched `insert_documents` call per workspace. Unfinished jobs
+are picked up again on the next start.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from .rag_manager import WORKING_DIR, DEFAULT_WORKSPACE
+from .lightrag_service import compute_doc_id, insert_documents, get_document_status, get_pipeline_status
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "8"))
+# Seconds a worker waits for more documents before sending a partial batch
+INGEST_BATCH_WAIT = float(os.getenv("INGEST_BATCH_WAIT", "0.5"))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "30"))
+# Finished jobs kept in the journal for status lookups
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+
+def _now() -> str:
+    return datetime.now(tz=timezone.utc).isoformat()
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    doc_id: str
+    workspace: str = DEFAULT_WORKSPACE
+    status: str = "queued"  # queued | running | done | failed
+    created_at: str = field(default_factory=_now)
+    updated_at: str = field(default_factory=_now)
+    error: Optional[str] = None
+
+
+class IngestQueue:
+    def __init__(self, queue_dir: str = os.path.join(WORKING_DIR, "ingest_queue"), workers: int = INGEST_WORKERS):
+        self.queue_dir = queue_dir
+        self.journal_file = os.path.join(queue_dir, "jobs.json")
+        self.num_workers = workers
+        self.jobs: dict[str, IngestJob] = {}
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._accepting = False
+
+    # ─── Journal ───
+
+    def _payload_file(self, job_id: str) -> str:
+        return os.path.join(self.queue_dir, f"{job_id}.txt")
+
+    def _save(self):
+        finished = [j for j in self.jobs.values() if j.status in ("done", "failed")]
+        for job in finished[: max(len(finished) - INGEST_JOB_HISTORY, 0)]:
+            del self.jobs[job.job_id]
+        tmp = self.journal_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([asdict(j) for j in self.jobs.values()], f)
+        os.replace(tmp, self.journal_file)
+
+    def _load(self):
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, encoding="utf-8") as f:
+            for data in json.load(f):
+                job = IngestJob(**data)
+                self.jobs[job.job_id] = job
+
+    def _set_status(self, job: IngestJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.updated_at = _now()
+
+    # ─── Lifecycle ───
+
+    async def start(self):
+        os.makedirs(self.queue_dir, exist_ok=True)
+        self._load()
+        # Anything not finished before the last shutdown/crash runs again;
+        # LightRAG skips documents it already processed.
+        for job in sorted(self.jobs.values(), key=lambda j: j.created_at):
+            if job.status in ("queued", "running"):
+                self._set_status(job, "queued")
+                self._queue.put_nowait(job.job_id)
+        self._save()
+        self._accepting = True
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self, timeout: float = INGEST_DRAIN_TIMEOUT):
+        """Stop accepting jobs, give queued ones `timeout` seconds to finish, then stop the workers."""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Jobs still queued or running stay in the journal for the next start
+        self._save()
+
+    # ─── API ───
+
+    def submit(self, content: str, workspace: str = DEFAULT_WORKSPACE) -> IngestJob:
+        if not self._accepting:
+            raise Exception("Ingestion queue is not accepting jobs")
+        job = IngestJob(job_id=uuid.uuid4().hex, doc_id=compute_doc_id(content), workspace=workspace)
+        with open(self._payload_file(job.job_id), "w", encoding="utf-8") as f:
+            f.write(content)
+        self.jobs[job.job_id] = job
+        self._save()
+        self._queue.put_nowait(job.job_id)
+        return job
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        document = await get_document_status(job.doc_id, job.workspace)
+        if job.status == "running" and document and document.get("status") in ("processed", "failed"):
+            # Finished by a pipeline run that another worker or process owned
+            failed = document["status"] == "failed"
+            self._set_status(job, "failed" if failed else "done", document.get("error"))
+            self._save()
+        result = asdict(job)
+        result["document"] = document
+        result["queue_position"] = None
+        if job.status == "queued":
+            queued = [j.job_id for j in self.jobs.values() if j.status == "queued"]
+            result["queue_position"] = queued.index(job_id)
+        if job.status == "running":
+            result["pipeline"] = await get_pipeline_status()
+        return result
+
+    # ─── Workers ───
+
+    async def _next_batch(self) -> list[str]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + INGEST_BATCH_WAIT
+        while len(batch) < INGEST_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._run_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _run_batch(self, job_ids: list[str]):
+        jobs = [self.jobs[j] for j in job_ids if j in self.jobs]
+        for job in jobs:
+            self._set_status(job, "running")
+        self._save()
+        by_workspace: dict[str, list[IngestJob]] = {}
+        for job in jobs:
+            by_workspace.setdefault(job.workspace, []).append(job)
+        for workspace, workspace_jobs in by_workspace.items():
+            await self._run_workspace_batch(workspace, workspace_jobs)
+
+    async def _run_workspace_batch(self, workspace: str, jobs: list[IngestJob]):
+        # Identical documents share a doc ID; LightRAG requires unique IDs per call
+        contents: dict[str, str] = {}
+        for job in list(jobs):
+            if job.doc_id in contents:
+                continue
+            try:
+                with open(self._payload_file(job.job_id), encoding="utf-8") as f:
+                    contents[job.doc_id] = f.read()
+            except FileNotFoundError:
+                self._set_status(job, "failed", "Document payload missing from ingestion queue")
+                jobs.remove(job)
+        if not contents:
+            self._save()
+            return
+
+        try:
+            statuses = await insert_documents(list(contents.values()), list(contents.keys()), workspace)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            for job in jobs:
+                self._set_status(job, "failed", str(e))
+        else:
+            for job in jobs:
+                doc_status = (statuses.get(job.doc_id) or {}).get("status")
+                if doc_status == "processed":
+                    self._set_status(job, "done")
+                elif doc_status == "failed":
+                    self._set_status(job, "failed", statuses[job.doc_id].get("error"))
+                # Otherwise another process owns the pipeline; `status()` reports live progress
+
+        for job in jobs:
+            if job.status in ("done", "failed"):
+                try:
+                    os.remove(self._payload_file(job.job_id))
+                except FileNotFoundError:
+                    pass
+        self._save()
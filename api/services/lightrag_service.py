@@ -1,77 +1,117 @@
 import os
 import asyncio
-from lightrag.lightrag import LightRAG
-from lightrag.llm.openai import openai_complete_if_cache, openai_embed, gpt_4o_mini_complete
-from lightrag.utils import EmbeddingFunc
-from lightrag.kg.shared_storage import initialize_pipeline_status
+from lightrag.llm.openai import openai_complete_if_cache, openai_embed
+from lightrag.utils import EmbeddingFunc, clean_text, compute_mdhash_id, logger
+from lightrag.kg.shared_storage import get_namespace_data
+
+from .rag_manager import WORKING_DIR, DEFAULT_WORKSPACE, get_manager, get_rag, workspace_exists
+from .embedding_cache import cached_embedding_func
+from .embedding_batcher import batched_embedding_func
+from .adaptive_limiter import limited_embedding_func
+from .incremental_ingest import delete_document, upsert_document, upsert_documents
+from .llm_router import get_router, hosts_from_env
 
 async def custom_llm_model_func(prompt, system_prompt=None, history_messages=[], **kwargs):
-    return await openai_complete_if_cache(
+    router = get_router(hosts_from_env("LLM_BINDING_HOSTS", "LLM_BINDING_HOST"))
+    return await router.call(lambda base_url: openai_complete_if_cache(
         os.getenv("LLM_MODEL", "your-model-name"),
         prompt,
         system_prompt=system_prompt,
         history_messages=history_messages,
         api_key=os.getenv("LLM_BINDING_API_KEY"),
-        base_url=os.getenv("LLM_BINDING_HOST"),
+        base_url=base_url,
         **kwargs,
-    )
+    ))
 
-def custom_embedding_func(texts):
-    return EmbeddingFunc(
-        embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")),
-        max_token_size=int(os.getenv("MAX_EMBED_TOKENS", "8192")),
-        func=lambda texts: openai_embed(
-            texts,
-            embed_model=os.getenv("EMBEDDING_MODEL", "your-embedding-model"),
-            api_key=os.getenv("EMBEDDING_BINDING_API_KEY") or os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("EMBEDDING_BINDING_HOST", "http://localhost:8001"),
-        ),
-    )(texts)
+# Built on first use so every call shares one embedding cache
+_custom_embedding = None
 
-WORKING_DIR = "./pydantic-docs"
+def custom_embedding_func(texts):
+    global _custom_embedding
+    if _custom_embedding is None:
+        embed_model = os.getenv("EMBEDDING_MODEL", "your-embedding-model")
+        _custom_embedding = cached_embedding_func(
+            batched_embedding_func(limited_embedding_func(EmbeddingFunc(
+                embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")),
+                max_token_size=int(os.getenv("MAX_EMBED_TOKENS", "8192")),
+                func=lambda texts: openai_embed(
+                    texts,
+                    model=embed_model,
+                    api_key=os.getenv("EMBEDDING_BINDING_API_KEY") or os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("EMBEDDING_BINDING_HOST", "http://localhost:8001"),
+                ),
+            ))),
+            embed_model,
+            WORKING_DIR,
+        )
+    return _custom_embedding(texts)
 
-async def get_lightrag():
-    if not os.path.exists(WORKING_DIR):
-        os.mkdir(WORKING_DIR)
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        # llm_model_func=custom_llm_model_func
-        llm_model_func=gpt_4o_mini_complete
-    )
-    await rag.initialize_storages()
-    return rag
+async def get_lightrag(workspace: str = DEFAULT_WORKSPACE):
+    return await get_rag(workspace)
 
-async def get_lightrag_for_insertion():
-    if not os.path.exists(WORKING_DIR):
-        os.mkdir(WORKING_DIR)
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        # llm_model_func=custom_llm_model_func
-        llm_model_func=gpt_4o_mini_complete
-    )
-    await rag.initialize_storages()
-    await initialize_pipeline_status()
-    return rag
+async def get_lightrag_for_insertion(workspace: str = DEFAULT_WORKSPACE):
+    # Pipeline status is initialized once when the shared instance is loaded
+    return await get_rag(workspace)
 
-async def insert_document(content: str):
+async def insert_document(content: str, workspace: str = DEFAULT_WORKSPACE):
     try:
-        rag = await get_lightrag_for_insertion()
-        return await rag.ainsert(content)
+        async with get_manager(workspace, create=True).write() as rag:
+            content = clean_text(content)
+            return await upsert_document(rag, compute_doc_id(content), content)
     except Exception as e:
         raise Exception(f"Failed to insert document: {str(e)}")
 
-async def update_document(doc_id: str, content: str):
+def compute_doc_id(content: str) -> str:
+    """Same ID LightRAG assigns to a document it is given without explicit IDs."""
+    return compute_mdhash_id(clean_text(content), prefix="doc-")
+
+async def insert_documents(contents: list[str], ids: list[str], workspace: str = DEFAULT_WORKSPACE) -> dict[str, dict]:
+    """Insert several documents concurrently and return their doc status by ID.
+
+    Documents are indexed by chunk (see incremental_ingest.py), so a later
+    update or removal only touches the records they contributed to.
+    """
+    try:
+        async with get_manager(workspace, create=True).write() as rag:
+            results = await upsert_documents(rag, {doc_id: clean_text(c) for doc_id, c in zip(ids, contents)})
+            statuses = {doc_id: _without_content(await rag.doc_status.get_by_id(doc_id)) for doc_id in ids}
+            for doc_id, result in results.items():
+                if isinstance(result, BaseException):
+                    logger.error(f"Failed to insert document {doc_id}: {result}")
+                    statuses[doc_id] = {**(statuses[doc_id] or {}), "status": "failed", "error": str(result)}
+            return statuses
+    except Exception as e:
+        raise Exception(f"Failed to insert documents: {str(e)}")
+
+def _without_content(status: dict | None) -> dict | None:
+    if status is None:
+        return None
+    return {k: v for k, v in status.items() if k != "content"}
+
+async def get_document_status(doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> dict | None:
+    if not workspace_exists(workspace):
+        # Queued for a workspace its first insert has not created yet
+        return None
+    async with get_manager(workspace).use() as rag:
+        return _without_content(await rag.doc_status.get_by_id(doc_id))
+
+async def get_pipeline_status() -> dict:
+    status = await get_namespace_data("pipeline_status")
+    keys = ("busy", "job_name", "job_start", "docs", "batchs", "cur_batch", "latest_message")
+    return {k: status.get(k) for k in keys}
+
+async def update_document(doc_id: str, content: str, workspace: str = DEFAULT_WORKSPACE) -> dict:
+    """Replace a document's content, re-embedding and re-extracting only its changed chunks."""
     try:
-        rag = await get_lightrag()
-        return await rag.update(doc_id, content)
+        async with get_manager(workspace).write() as rag:
+            return await upsert_document(rag, doc_id, clean_text(content))
     except Exception as e:
         raise Exception(f"Failed to update document {doc_id}: {str(e)}")
 
-async def remove_document(doc_id: str):
+async def remove_document(doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> dict | None:
+    """Delete a document and retract what it contributed; None if it does not exist."""
     try:
-        rag = await get_lightrag()
-        return await rag.remove(doc_id)
+        async with get_manager(workspace).write() as rag:
+            return await delete_document(rag, doc_id)
     except Exception as e:
         raise Exception(f"Failed to remove document {doc_id}: {str(e)}")
@@ -0,0 +1,203 @@
+"""Client-side load balancing across several OpenAI-compatible backends.
+
+Each request goes to the healthy backend with the fewest requests in flight,
+ties broken by an EWMA of its latency. A backend that keeps failing is ejected
+for a while, a request that fails on one backend fails over to the next, and a
+request that runs past `LLM_HEDGE_AFTER` seconds gets a hedged duplicate on
+another backend; whichever answers first wins.
+"""
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from tenacity import RetryError
+
+T = TypeVar("T")
+
+# Consecutive failures before a backend is ejected, and for how long
+LLM_EJECT_AFTER = int(os.getenv("LLM_EJECT_AFTER", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "30"))
+# Seconds before a hedged duplicate is sent to another backend; 0 disables hedging
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.3"))
+
+
+def hosts_from_env(hosts_var: str, host_var: str, default: Optional[str] = None) -> list[Optional[str]]:
+    """Comma-separated `hosts_var`, else the single `host_var`, else `default`."""
+    hosts = [h.strip() for h in os.getenv(hosts_var, "").split(",") if h.strip()]
+    # A host listed twice is still one backend
+    return list(dict.fromkeys(hosts)) or [os.getenv(host_var, default)]
+
+
+# Errors reaching the backend at all, as raised by httpx and the OpenAI client
+_TRANSPORT_ERRORS = (httpx.TransportError, openai.APIConnectionError, asyncio.TimeoutError, ConnectionError)
+
+
+def _is_backend_failure(e: Exception) -> bool:
+    """Transport errors, timeouts, 429 and 5xx; anything else is the request's or our own fault."""
+    if isinstance(e, RetryError) and e.last_attempt.failed:
+        # LightRAG's OpenAI calls retry connection errors and give up with this wrapper
+        e = e.last_attempt.exception()
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(e, _TRANSPORT_ERRORS)
+
+
+@dataclass
+class Backend:
+    url: Optional[str]
+    in_flight: int = 0
+    ewma_latency: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected": not self.healthy(time.monotonic()),
+        }
+
+
+class LLMRouter:
+    def __init__(self, urls: list[Optional[str]], hedge_after: float = LLM_HEDGE_AFTER):
+        self.backends = [Backend(url) for url in dict.fromkeys(urls)]
+        self.hedge_after = hedge_after
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def pick(self, exclude: set = frozenset()) -> Optional[Backend]:
+        candidates = [b for b in self.backends if b.url not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [b for b in candidates if b.healthy(now)]
+        if not healthy:
+            # Everything is ejected: try the one that comes back soonest
+            return min(candidates, key=lambda b: b.ejected_until)
+        return min(healthy, key=lambda b: (b.in_flight, b.ewma_latency))
+
+    def _start(self, backend: Backend, send: Callable[[Optional[str]], Awaitable[T]]) -> asyncio.Task:
+        # Counted before the task runs so concurrent picks already see the load
+        backend.in_flight += 1
+        backend.requests += 1
+        return asyncio.create_task(self._attempt(backend, send))
+
+    async def _attempt(self, backend: Backend, send: Callable[[Optional[str]], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        try:
+            result = await send(backend.url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _is_backend_failure(e):
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= LLM_EJECT_AFTER:
+                    backend.ejected_until = time.monotonic() + LLM_EJECT_SECONDS
+            raise
+        finally:
+            backend.in_flight -= 1
+        latency = time.monotonic() - started
+        backend.ewma_latency = latency if not backend.ewma_latency else (
+            LLM_EWMA_ALPHA * latency + (1 - LLM_EWMA_ALPHA) * backend.ewma_latency
+        )
+        backend.consecutive_failures = 0
+        backend.ejected_until = 0.0
+        return result
+
+    async def _hedged(
+        self,
+        backend: Backend,
+        send: Callable[[Optional[str]], Awaitable[T]],
+        tried: set,
+        discard: Optional[Callable[[T], Awaitable[None]]],
+    ) -> T:
+        primary = self._start(backend, send)
+        tasks = {primary}
+        try:
+            if self.hedge_after > 0:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                spare = None if done else self.pick(exclude=tried)
+                if spare is not None:
+                    tried.add(spare.url)
+                    self.hedged += 1
+                    tasks.add(self._start(spare, send))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winners = [t for t in done if t.exception() is None]
+                if winners:
+                    if winners[0] is not primary:
+                        self.hedge_wins += 1
+                    if discard is not None:
+                        for loser in winners[1:]:
+                            await discard(loser.result())
+                    return winners[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(
+        self,
+        send: Callable[[Optional[str]], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """Run `send(base_url)` on the best backend.
+
+        `discard` releases the result of a hedged duplicate that finished but lost.
+        """
+        tried: set = set()
+        backend = self.pick()
+        while True:
+            tried.add(backend.url)
+            try:
+                return await self._hedged(backend, send, tried, discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not _is_backend_failure(e):
+                    raise
+                backend = self.pick(exclude=tried)
+                if backend is None:
+                    raise
+                self.failovers += 1
+
+    def stats(self) -> dict:
+        return {
+            "backends": [b.stats() for b in self.backends],
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+        }
+
+
+_routers: dict[tuple, LLMRouter] = {}
+
+
+def get_router(urls: list[Optional[str]]) -> LLMRouter:
+    key = tuple(urls)
+    if key not in _routers:
+        _routers[key] = LLMRouter(urls)
+    return _routers[key]
+
+
+def llm_router_stats() -> list[dict]:
+    return [router.stats() for router in _routers.values()]
@@ -1,4 +1,7 @@
 import os
+import random
+import asyncio
+import importlib.util
 import httpx
 from typing import List, AsyncIterator, Optional
 from datetime import datetime
@@ -9,10 +12,97 @@ from pydantic_ai.models import (
 from pydantic_ai.messages import SystemPromptPart, UserPromptPart, TextPart
 import dotenv
 
+from .llm_router import LLMRouter, get_router, hosts_from_env
+
 # Load environment variables from .env file
 dotenv.load_dotenv()
 
+# Connection pool shared by every MyOpenAICompatibleModel request
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_MAX_BACKOFF = float(os.getenv("LLM_RETRY_MAX_BACKOFF", "10"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_BACKOFF)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_RETRY_BACKOFF * 2 ** attempt, LLM_RETRY_MAX_BACKOFF))
+
+
 class MyOpenAICompatibleModel(Model):
+    _client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    async def open_client(cls) -> httpx.AsyncClient:
+        """Create the shared keep-alive client; called from the app's startup hook."""
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                http2=LLM_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+        return cls._client
+
+    @classmethod
+    async def close_client(cls):
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @property
+    def router(self) -> LLMRouter:
+        return get_router(hosts_from_env("LLM_BINDING_HOSTS_PYDANTIC", "LLM_BINDING_HOST_PYDANTIC", "http://localhost:8000"))
+
+    async def _send_once(
+        self, client: httpx.AsyncClient, base_url: str, payload: dict, headers: dict, stream: bool
+    ) -> httpx.Response:
+        request = client.build_request("POST", f"{base_url}/v1/chat/completions", json=payload, headers=headers)
+        response = await client.send(request, stream=stream)
+        if response.status_code in RETRY_STATUS_CODES:
+            await response.aclose()
+            raise httpx.HTTPStatusError(
+                f"Retryable status {response.status_code} from {base_url}", request=request, response=response
+            )
+        return response
+
+    async def _send(self, payload: dict, stream: bool) -> httpx.Response:
+        """POST to the least-loaded backend, retrying connection errors, 429 and 5xx."""
+        client = await self.open_client()
+        api_key = os.getenv("LLM_BINDING_API_KEY")
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                return await self.router.call(
+                    lambda base_url: self._send_once(client, base_url, payload, headers, stream),
+                    discard=lambda response: response.aclose(),
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+            except httpx.HTTPStatusError as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                retry_after = e.response.headers.get("retry-after")
+            await asyncio.sleep(_retry_delay(attempt, retry_after))
+
     @property
     def model_name(self) -> str:
         return os.getenv("LLM_MODEL", "your-model-name")
@@ -23,7 +113,8 @@ class MyOpenAICompatibleModel(Model):
 
     @property
     def base_url(self) -> Optional[str]:
-        return os.getenv("LLM_BINDING_HOST_PYDANTIC", "http://localhost:8000")
+        # Requests are spread over every configured host; see `router`
+        return self.router.backends[0].url
 
     def convert_message(self, m: ModelMessage):
         # Handle ModelRequest type
@@ -51,17 +142,9 @@ class MyOpenAICompatibleModel(Model):
             "messages": formatted_messages,
             "stream": False,
         }
-        api_key = os.getenv("LLM_BINDING_API_KEY")
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self.base_url}/v1/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=60,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        resp = await self._send(payload, stream=False)
+        resp.raise_for_status()
+        data = resp.json()
             
         print(f"Response from OpenAI API: {data}")  # Debugging line to check response
         # Create response part
@@ -99,22 +182,19 @@ class MyOpenAICompatibleModel(Model):
             "messages": formatted_messages,
             "stream": True,
         }
-        api_key = os.getenv("LLM_BINDING_API_KEY")
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/v1/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=60,
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[len("data: "):]
-                        if data.strip() == "[DONE]":
-                            break
-                        yield StreamedResponse.from_openai_chunk(data)
+        response = await self._send(payload, stream=True)
+        # Runs on normal completion and when the consumer is cancelled or closes
+        # this generator (client disconnect), so the upstream stream never outlives it
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    data = line[len("data: "):]
+                    if data.strip() == "[DONE]":
+                        break
+                    yield StreamedResponse.from_openai_chunk(data)
+        finally:
+            await response.aclose()
 
     @property
     def profile(self):
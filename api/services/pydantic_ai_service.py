@@ -1,23 +1,249 @@
 # services/pydantic_ai_service.py
 
+import os
+import time
+import hashlib
 import asyncio
 from datetime import datetime, timezone
 import json
-from typing import AsyncIterator
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from .rag_agent import stream_rag_answer, run_rag_agent
+from .rag_agent import stream_rag_answer, run_rag_agent, answer_key
+from .rag_manager import DEFAULT_WORKSPACE
+from .history_compaction import compact_history, schedule_summary_refresh
+
+# Streamed deltas are buffered until this many bytes are waiting...
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "64"))
+# ...or the oldest buffered delta has waited this many seconds
+STREAM_FLUSH_DELAY = float(os.getenv("STREAM_FLUSH_DELAY", "0.05"))
+# Seconds between client-disconnect checks while waiting for the next chunk
+STREAM_DISCONNECT_POLL = float(os.getenv("STREAM_DISCONNECT_POLL", "0.5"))
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class _Flight:
+    """One in-flight answer shared by every concurrent request for the same question.
+
+    The producer appends chunks as they arrive; each subscriber replays the
+    chunks produced so far and then follows the live ones. When the last
+    subscriber goes away the producer is cancelled.
+    """
+
+    def __init__(self, key: str, source: AsyncIterator[str]):
+        self.key = key
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source: AsyncIterator[str]):
+        try:
+            async with aclosing(source):
+                async for chunk in source:
+                    self.chunks.append(chunk)
+                    self._notify()
+            _record_answer_tokens(sum(_estimate_tokens(c) for c in self.chunks))
+        except asyncio.CancelledError:
+            # Subscribers still replaying see the error; the task itself ends cancelled
+            self.error = Exception("Answer generation was cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            _release(self)
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nobody is listening any more: stop paying for the answer
+                _release(self)
+                self.task.cancel()
+                produced = sum(_estimate_tokens(c) for c in self.chunks)
+                _flight_stats["cancelled"] += 1
+                _flight_stats["estimated_tokens_saved"] += max(round(_flight_stats["avg_answer_tokens"]) - produced, 0)
+
+
+_flights: dict[str, _Flight] = {}
+_flight_stats = {
+    "started": 0,
+    "coalesced": 0,
+    "completed": 0,
+    "cancelled": 0,
+    "avg_answer_tokens": 0.0,
+    # Average answer length minus what was already generated when a flight was cancelled
+    "estimated_tokens_saved": 0,
+}
+
+
+def _record_answer_tokens(tokens: int):
+    _flight_stats["completed"] += 1
+    _flight_stats["avg_answer_tokens"] += (tokens - _flight_stats["avg_answer_tokens"]) / _flight_stats["completed"]
+
+
+def _release(flight: _Flight):
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+
+
+def _join(key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """Subscribe to the in-flight answer for `key`, starting one with `source()` if there is none."""
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = _Flight(key, source())
+        _flight_stats["started"] += 1
+    else:
+        _flight_stats["coalesced"] += 1
+    return flight.subscribe()
+
+
+def coalescing_stats() -> dict:
+    return {**_flight_stats, "in_flight": len(_flights)}
+
+
+_stream_stats = {
+    "streams": 0,
+    "abandoned": 0,
+    "chunks": 0,
+    "bytes": 0,
+    "ttfb_total": 0.0,
+    "ttfb_max": 0.0,
+    "encode_total": 0.0,
+}
+
+
+def streaming_stats() -> dict:
+    streams, chunks = _stream_stats["streams"], _stream_stats["chunks"]
+    return {
+        "streams": streams,
+        "abandoned": _stream_stats["abandoned"],
+        "chunks": chunks,
+        "bytes": _stream_stats["bytes"],
+        "avg_ttfb_seconds": _stream_stats["ttfb_total"] / streams if streams else 0.0,
+        "max_ttfb_seconds": _stream_stats["ttfb_max"],
+        "avg_chunk_overhead_seconds": _stream_stats["encode_total"] / chunks if chunks else 0.0,
+    }
+
+
+async def _stream_deltas(user_input: str, workspace: str, history: list[dict]) -> AsyncIterator[str]:
+    # aclosing() makes an abandoned stream close the generators behind it,
+    # which in turn closes the upstream LLM response
+    async with aclosing(stream_rag_answer(user_input, stream=True, workspace=workspace, conversation_history=history)) as answer:
+        async for chunk in answer:
+            # If chunk is an async generator, forward its parts as they arrive
+            if hasattr(chunk, "__aiter__"):
+                async with aclosing(chunk):
+                    async for part in chunk:
+                        yield str(part)
+            else:
+                yield str(chunk)
+
+
+async def _coalesce(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Group tiny deltas under the STREAM_FLUSH_BYTES / STREAM_FLUSH_DELAY policy.
+
+    The first delta is always sent on its own so time-to-first-byte is unaffected.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = deltas.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    buffer: list[str] = []
+    size = 0
+    deadline = None
+    first = True
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                next_delta, pending = pending, None
+                try:
+                    delta = next_delta.result()
+                except StopAsyncIteration:
+                    break
+                if not delta:
+                    continue
+                if not buffer:
+                    deadline = loop.time() + STREAM_FLUSH_DELAY
+                buffer.append(delta)
+                size += len(delta.encode("utf-8"))
+                if size < STREAM_FLUSH_BYTES and not first:
+                    continue
+            if buffer:
+                first = False
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            # Let the cancelled read unwind before the source is closed
+            await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def _stream_contents(user_input: str, workspace: str, history: list[dict]) -> AsyncIterator[str]:
+    return _coalesce(_stream_deltas(user_input, workspace, history))
+
+
+def _history_answer_key(user_input: str, workspace: str, history: list[dict]) -> str:
+    """Single-flight key; requests only share an answer if they also share a history."""
+    key = answer_key(user_input, workspace)
+    if history:
+        key += "\0" + hashlib.md5(json.dumps(history).encode("utf-8")).hexdigest()
+    return key
+
+
+async def _full_answer(user_input: str, history: list[dict], workspace: str) -> AsyncIterator[str]:
+    yield await run_rag_agent(user_input, history, workspace)
 
 
 async def stream_agent_response(
     user_input: str,
     message_history: list,
-    db=None
+    db=None,
+    conversation_id: Optional[str] = None,
+    workspace: str = DEFAULT_WORKSPACE,
 ) -> AsyncIterator[bytes]:
     """
     Streams newline-delimited JSON back to the HTTP client using LightRAG.
 
     1. Immediately yield the user's own message.
-    2. Stream model response from LightRAG.
+    2. Stream model response deltas from LightRAG as they arrive, shared with
+       identical concurrent requests.
+    3. Once the answer is complete, buffer the turn in `db` for write-behind
+       persistence if the client named a conversation, and refresh its summary.
+
+    A named conversation's stored history is compacted and passed to LightRAG,
+    as in `agent_response`.
     """
 
     try:
@@ -30,29 +256,102 @@ async def stream_agent_response(
         yield user_message
 
         # ─── 2. Stream model response ───
-        async for chunk in stream_rag_answer(user_input, stream=True):
-            # If chunk is an async generator, consume it
-            if hasattr(chunk, "__aiter__"):
-                content = ""
-                async for part in chunk:
-                    content += str(part)
-            else:
-                content = str(chunk)
-            yield json.dumps({
-                "role": "model",
-                "timestamp": datetime.now(tz=timezone.utc).isoformat(),
-                "content": content
-            }).encode("utf-8") + b"\n"
+        # Every line of one answer shares a timestamp, so the JSON around the
+        # content is built once instead of per delta.
+        prefix = (
+            '{"role": "model", "timestamp": '
+            + json.dumps(datetime.now(tz=timezone.utc).isoformat())
+            + ', "content": '
+        ).encode("utf-8")
+        started = time.perf_counter()
+        first = True
+        answer: list[str] = []
+        history = []
+        if db is not None and conversation_id:
+            messages = await db.get_messages(conversation_id)
+            history = await compact_history(messages, conversation_id, db) if messages else []
+        key = _history_answer_key(user_input, workspace, history)
+        async with aclosing(_join(key, lambda: _stream_contents(user_input, workspace, history))) as contents:
+            async for content in contents:
+                answer.append(content)
+                encode_started = time.perf_counter()
+                line = prefix + json.dumps(content).encode("utf-8") + b"}\n"
+                _stream_stats["encode_total"] += time.perf_counter() - encode_started
+                _stream_stats["chunks"] += 1
+                _stream_stats["bytes"] += len(line)
+                if first:
+                    first = False
+                    ttfb = time.perf_counter() - started
+                    _stream_stats["streams"] += 1
+                    _stream_stats["ttfb_total"] += ttfb
+                    _stream_stats["ttfb_max"] = max(_stream_stats["ttfb_max"], ttfb)
+                yield line
+
+        # ─── 3. Persist the completed turn ───
+        if db is not None and conversation_id:
+            await db.record_turn(user_input, "".join(answer), conversation_id)
+            schedule_summary_refresh(conversation_id, db, workspace)
 
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away; closing `contents` above released our subscription
+        _stream_stats["abandoned"] += 1
+        raise
     except Exception as e:
         raise Exception(f"Error in stream_agent_response: {e}")
 
 
-async def agent_response(user_input, message_history):
+async def cancel_on_disconnect(
+    lines: AsyncIterator[bytes],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[bytes]:
+    """Forward `lines`, closing them as soon as `is_disconnected()` reports the client gone.
+
+    The check also runs while waiting for the next line, so a client that leaves
+    during retrieval or a slow generation is noticed before anything is sent.
+    """
+    loop = asyncio.get_running_loop()
+    next_line: Optional[asyncio.Future] = None
+    checked_at = loop.time()
+    try:
+        while True:
+            next_line = asyncio.ensure_future(lines.__anext__())
+            while True:
+                done, _ = await asyncio.wait({next_line}, timeout=STREAM_DISCONNECT_POLL)
+                if loop.time() - checked_at >= STREAM_DISCONNECT_POLL:
+                    checked_at = loop.time()
+                    if await is_disconnected():
+                        return
+                if done:
+                    break
+            try:
+                line = next_line.result()
+            except StopAsyncIteration:
+                return
+            next_line = None
+            yield line
+    finally:
+        if next_line is not None and not next_line.done():
+            next_line.cancel()
+            await asyncio.gather(next_line, return_exceptions=True)
+        await lines.aclose()
+
+
+async def agent_response(
+    user_input,
+    message_history,
+    db=None,
+    conversation_id: Optional[str] = None,
+    workspace: str = DEFAULT_WORKSPACE,
+):
     """
     Non-streaming fallback: return the full response once completed using LightRAG.
+    Stored history is compacted to a token budget (see history_compaction.py).
+    Identical concurrent requests share one retrieval and generation.
     """
     try:
-        return await run_rag_agent(user_input)
+        history = await compact_history(message_history, conversation_id, db) if message_history else []
+        key = _history_answer_key(user_input, workspace, history)
+        async with aclosing(_join(key, lambda: _full_answer(user_input, history, workspace))) as contents:
+            return "".join([content async for content in contents])
     except Exception as e:
         raise Exception(f"Error in agent_response: {e}")
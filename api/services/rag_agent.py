@@ -4,101 +4,177 @@ import os
 import sys
 import argparse
 import asyncio
+from contextlib import aclosing
 from dataclasses import dataclass
+from typing import Optional
 
 import dotenv
 from lightrag.lightrag import LightRAG, QueryParam
-from lightrag.llm.openai import openai_complete_if_cache, openai_embed, gpt_4o_mini_complete
+from lightrag.llm.openai import openai_complete_if_cache, openai_embed
 from lightrag.utils import EmbeddingFunc
-from lightrag.kg.shared_storage import initialize_pipeline_status
+
+from .rag_manager import WORKING_DIR, DEFAULT_WORKSPACE, get_manager, get_rag
+from .answer_cache import answer_cache, normalize_question
+from .embedding_cache import cached_embedding_func
+from .embedding_batcher import batched_embedding_func
+from .llm_router import get_router, hosts_from_env
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
 
 async def custom_llm_model_func(prompt, system_prompt=None, history_messages=[], **kwargs):
-    return await openai_complete_if_cache(
+    router = get_router(hosts_from_env("LLM_BINDING_HOSTS", "LLM_BINDING_HOST"))
+    return await router.call(lambda base_url: openai_complete_if_cache(
         os.getenv("LLM_MODEL", "your-model-name"),
         prompt,
         system_prompt=system_prompt,
         history_messages=history_messages,
         api_key=os.getenv("LLM_BINDING_API_KEY"),
-        base_url=os.getenv("LLM_BINDING_HOST"),
+        base_url=base_url,
         **kwargs,
-    )
+    ))
+
+# Built on first use so every call shares one embedding cache
+_custom_embedding = None
 
 def custom_embedding_func(texts):
-    return EmbeddingFunc(
-        embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")),
-        max_token_size=int(os.getenv("MAX_EMBED_TOKENS", "8192")),
-        func=lambda texts: openai_embed(
-            texts,
-            embed_model=os.getenv("EMBEDDING_MODEL", "your-embedding-model"),
-            api_key=os.getenv("EMBEDDING_BINDING_API_KEY"),
-            base_url=os.getenv("EMBEDDING_BINDING_HOST"),
-        ),
-    )(texts)
-
-WORKING_DIR = "./pydantic-docs"
-
-if not os.path.exists(WORKING_DIR):
-    os.mkdir(WORKING_DIR)
+    global _custom_embedding
+    if _custom_embedding is None:
+        embed_model = os.getenv("EMBEDDING_MODEL", "your-embedding-model")
+        _custom_embedding = cached_embedding_func(
+            batched_embedding_func(EmbeddingFunc(
+                embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")),
+                max_token_size=int(os.getenv("MAX_EMBED_TOKENS", "8192")),
+                func=lambda texts: openai_embed(
+                    texts,
+                    model=embed_model,
+                    api_key=os.getenv("EMBEDDING_BINDING_API_KEY"),
+                    base_url=os.getenv("EMBEDDING_BINDING_HOST"),
+                ),
+            )),
+            embed_model,
+            WORKING_DIR,
+        )
+    return _custom_embedding(texts)
 
 # Check for OpenAI API key (optional, only warn)
 if not os.getenv("OPENAI_API_KEY"):
     print("Warning: OPENAI_API_KEY environment variable not set. Custom LLM may require its own key.")
 
-async def initialize_rag():
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        llm_model_func=gpt_4o_mini_complete
-        # llm_model_func=custom_llm_model_func,
-    )
-    await rag.initialize_storages()
-    return rag
+async def initialize_rag(workspace: str = DEFAULT_WORKSPACE):
+    # Shared, already-initialized instance; see services/rag_manager.py
+    return await get_rag(workspace)
 
 @dataclass
 class RAGDeps:
     lightrag: LightRAG
 
-async def stream_rag_answer(question: str, stream: bool = True):
+async def _cache_on_completion(parts, key: str, version, embedding):
+    """Pass a streamed answer through and cache it once it has been fully produced.
+
+    Closing this generator early (client disconnect) closes `parts`, and with it
+    the upstream LLM stream; partial answers are not cached.
+    """
+    collected = []
+    async with aclosing(parts):
+        async for part in parts:
+            collected.append(str(part))
+            yield part
+    answer_cache.put(key, "".join(collected), version, embedding)
+
+def answer_key(question: str, workspace: str = DEFAULT_WORKSPACE) -> str:
+    """Answer cache / single-flight key; answers never cross workspaces."""
+    return f"{workspace}\0{normalize_question(question)}"
+
+async def stream_rag_answer(
+    question: str,
+    stream: bool = True,
+    workspace: str = DEFAULT_WORKSPACE,
+    conversation_history: Optional[list[dict]] = None,
+):
     """
     Stream the answer to a question using LightRAG.
     If streaming is not supported, yield the full answer at once.
+    Cached answers are replayed as a single chunk; answers that depend on
+    conversation history bypass the answer cache.
     """
-    rag = await initialize_rag()
-    param = QueryParam(mode="local", history_turns=5, only_need_context=False, stream=stream)
-    # Try streaming, fallback to non-streaming
-    if hasattr(rag, "aquery_stream"):
-        async for chunk in rag.aquery_stream(question, param=param):
-            yield chunk
-    else:
-        # Fallback: yield the full answer at once
-        result = await rag.aquery(question, param=param)
-        yield result
+    manager = get_manager(workspace)
+    async with manager.use() as rag:
+        if conversation_history:
+            param = QueryParam(
+                mode="local",
+                history_turns=len(conversation_history),
+                conversation_history=conversation_history,
+                only_need_context=False,
+                stream=stream,
+            )
+            # A stream comes back as one async iterator, which the caller forwards
+            yield await rag.aquery(question, param=param)
+            return
+        version = (workspace, manager.corpus_version)
+        key = answer_key(question, workspace)
+        cached, embedding = await answer_cache.get(key, version, rag.embedding_func, normalize_question(question))
+        if cached is not None:
+            yield cached
+            return
+        param = QueryParam(mode="local", history_turns=5, only_need_context=False, stream=stream)
+        # Try streaming, fallback to non-streaming
+        if hasattr(rag, "aquery_stream"):
+            async with aclosing(_cache_on_completion(rag.aquery_stream(question, param=param), key, version, embedding)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        else:
+            # Fallback: yield the full answer at once
+            result = await rag.aquery(question, param=param)
+            if hasattr(result, "__aiter__"):
+                yield _cache_on_completion(result, key, version, embedding)
+            else:
+                answer_cache.put(key, result, version, embedding)
+                yield result
 
-async def run_rag_agent(question: str) -> str:
+async def run_rag_agent(
+    question: str,
+    conversation_history: Optional[list[dict]] = None,
+    workspace: str = DEFAULT_WORKSPACE,
+) -> str:
     """
     Get the full answer to a question using LightRAG (non-streaming).
+    Answers that depend on conversation history bypass the answer cache.
     """
-    rag = await initialize_rag()
-    param = QueryParam(mode="local", history_turns=5, only_need_context=False)
-    result = await rag.aquery(question, param=param)
-    return result
+    manager = get_manager(workspace)
+    async with manager.use() as rag:
+        if conversation_history:
+            param = QueryParam(
+                mode="local",
+                history_turns=len(conversation_history),
+                conversation_history=conversation_history,
+                only_need_context=False,
+            )
+            return await rag.aquery(question, param=param)
+        version = (workspace, manager.corpus_version)
+        key = answer_key(question, workspace)
+        cached, embedding = await answer_cache.get(key, version, rag.embedding_func, normalize_question(question))
+        if cached is not None:
+            return cached
+        param = QueryParam(mode="local", history_turns=5, only_need_context=False)
+        result = await rag.aquery(question, param=param)
+        answer_cache.put(key, result, version, embedding)
+        return result
 
 def main():
     parser = argparse.ArgumentParser(description="Run a LightRAG agent")
     parser.add_argument("--question", help="The question to answer")
     parser.add_argument("--stream", action="store_true", help="Stream the response")
+    parser.add_argument("--workspace", default=DEFAULT_WORKSPACE, help="The knowledge base to query")
     args = parser.parse_args()
 
     if args.stream:
         async def run_stream():
-            async for chunk in stream_rag_answer(args.question, stream=True):
+            async for chunk in stream_rag_answer(args.question, stream=True, workspace=args.workspace):
                 print(chunk, end="", flush=True)
         asyncio.run(run_stream())
     else:
-        response = asyncio.run(run_rag_agent(args.question))
+        response = asyncio.run(run_rag_agent(args.question, workspace=args.workspace))
         print("\nResponse:")
         print(response)
 
@@ -0,0 +1,455 @@
+"""Process-wide LightRAG instances, one per workspace.
+
+Building a `LightRAG` and calling `initialize_storages()` reloads every KV,
+vector and graph file from disk, so request handlers share a single,
+lock-protected instance per workspace instead of creating one per call.
+
+Each workspace is a separate knowledge base in its own working directory. The
+"default" workspace is `WORKING_DIR`; the others live under `WORKSPACES_DIR`.
+A workspace is created by its first insert; reads of one whose directory does
+not exist raise `WorkspaceNotFoundError` instead of creating it. Instances are
+loaded on first use and kept in LRU order. Once more than
+`RAG_MAX_WORKSPACES` are loaded, or their storage files add up to more than
+`RAG_MAX_WORKSPACE_MB`, idle ones are finalized and unloaded. Loads start from
+a warm-start snapshot (see rag_snapshot.py) when one matches the files on disk.
+"""
+
+import os
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from lightrag.lightrag import LightRAG
+from lightrag.llm.openai import openai_embed, gpt_4o_mini_complete
+from lightrag.kg import shared_storage
+from lightrag.kg.shared_storage import initialize_pipeline_status
+from lightrag.utils import load_json, logger
+
+from .embedding_cache import cached_embedding_func
+from .embedding_batcher import batched_embedding_func
+from .adaptive_limiter import (
+    LLM_LIMIT_MAX, background, bypass_call_queues, limited_embedding_func, limited_llm_func
+)
+from .storage import registry  # noqa: F401  registers the storages under services/storage
+from .storage.llm_cache_storage import SQLiteLLMCacheStorage
+from .rag_snapshot import SNAPSHOT_FILE, Snapshot, write_snapshot
+from .incremental_ingest import attach_index, index_storages
+
+WORKING_DIR = "./pydantic-docs"
+WORKSPACES_DIR = os.getenv("RAG_WORKSPACES_DIR", "./workspaces")
+DEFAULT_WORKSPACE = "default"
+WORKSPACE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+# Budget for loaded workspaces; the memory budget is measured by the size of
+# their storage files, which LightRAG's JSON/GraphML/NanoVectorDB stores load whole
+RAG_MAX_WORKSPACES = int(os.getenv("RAG_MAX_WORKSPACES", "8"))
+RAG_MAX_WORKSPACE_MB = float(os.getenv("RAG_MAX_WORKSPACE_MB", "2048"))
+# Warm-start snapshots, rewritten this many seconds after the last change
+RAG_SNAPSHOT = os.getenv("RAG_SNAPSHOT", "true").lower() == "true"
+RAG_SNAPSHOT_DELAY = float(os.getenv("RAG_SNAPSHOT_DELAY", "30"))
+
+# Seconds between checks for storage files rewritten by another process
+REFRESH_INTERVAL = float(os.getenv("RAG_REFRESH_INTERVAL", "5"))
+# Vector storage backend; IVFVectorDBStorage imports existing NanoVectorDB files on first load
+VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "NanoVectorDBStorage")
+# Graph storage backend; CSRGraphStorage imports an existing GraphML file on first load
+GRAPH_STORAGE = os.getenv("RAG_GRAPH_STORAGE", "NetworkXStorage")
+# KV / doc status backends; the Log* ones import existing kv_store_*.json files on first load
+KV_STORAGE = os.getenv("RAG_KV_STORAGE", "JsonKVStorage")
+DOC_STATUS_STORAGE = os.getenv("RAG_DOC_STATUS_STORAGE", "JsonDocStatusStorage")
+# "sqlite" keeps the LLM response cache in a bounded SQLite store; "kv" leaves it in KV_STORAGE
+LLM_CACHE_STORAGE = os.getenv("RAG_LLM_CACHE_STORAGE", "sqlite")
+
+
+class WorkspaceNotFoundError(LookupError):
+    pass
+
+
+def workspace_dir(workspace: str) -> str:
+    if workspace == DEFAULT_WORKSPACE:
+        return WORKING_DIR
+    if not WORKSPACE_PATTERN.match(workspace):
+        raise ValueError(f"Invalid workspace name: {workspace!r}")
+    return os.path.join(WORKSPACES_DIR, workspace)
+
+
+def workspace_exists(workspace: str) -> bool:
+    """Whether anything was ever inserted into `workspace`; the default one always exists."""
+    if workspace == DEFAULT_WORKSPACE:
+        return True
+    try:
+        return os.path.isdir(workspace_dir(workspace))
+    except ValueError:
+        return False
+
+
+def workspace_prefix(workspace: str) -> str:
+    """Namespace prefix for a workspace's storages.
+
+    LightRAG keeps storage data in process-wide dicts keyed by namespace, so
+    instances loaded side by side need distinct namespaces.
+    """
+    return "" if workspace == DEFAULT_WORKSPACE else f"{workspace}_"
+
+
+def build_lightrag(working_dir: str, namespace_prefix: str = "", snapshot: Optional[Snapshot] = None) -> LightRAG:
+    """Construct (but do not initialize) the LightRAG used by the service."""
+    os.makedirs(working_dir, exist_ok=True)
+    with snapshot.loaders() if snapshot else nullcontext():
+        rag = _construct_lightrag(working_dir, namespace_prefix)
+    # The adaptive limiters replace LightRAG's fixed-size call queues (see adaptive_limiter.py)
+    bypass_call_queues(rag)
+    if LLM_CACHE_STORAGE == "sqlite":
+        # Extraction and queries read rag.llm_response_cache at call time, so it can be swapped here
+        cache = rag.llm_response_cache
+        rag.llm_response_cache = SQLiteLLMCacheStorage(
+            namespace=cache.namespace, global_config=cache.global_config, embedding_func=cache.embedding_func
+        )
+    # Document -> chunk -> graph index for incremental updates and deletes (see incremental_ingest.py)
+    attach_index(rag)
+    return rag
+
+
+# One batcher for the process: every workspace embeds with the same provider and
+# model, so their calls can share requests, and reloads do not add batchers
+_batched_embed = None
+
+
+def _embedding_func():
+    global _batched_embed
+    if _batched_embed is None:
+        _batched_embed = batched_embedding_func(limited_embedding_func(openai_embed))
+    return _batched_embed
+
+
+def _construct_lightrag(working_dir: str, namespace_prefix: str) -> LightRAG:
+    return LightRAG(
+        working_dir=working_dir,
+        namespace_prefix=namespace_prefix,
+        embedding_func=cached_embedding_func(_embedding_func(), "text-embedding-3-small", working_dir),
+        # llm_model_func=limited_llm_func(custom_llm_model_func)
+        llm_model_func=limited_llm_func(gpt_4o_mini_complete),
+        # Enough extraction fan-out for the limiter to grow into
+        llm_model_max_async=LLM_LIMIT_MAX,
+        vector_storage=VECTOR_STORAGE,
+        graph_storage=GRAPH_STORAGE,
+        kv_storage=KV_STORAGE,
+        doc_status_storage=DOC_STATUS_STORAGE,
+        # Storage lifecycle is owned by RAGManager, not by the constructor/__del__
+        auto_manage_storages_states=False,
+    )
+
+
+def _storage_fingerprint(working_dir: str) -> tuple:
+    """Cheap summary of the on-disk storage files, used to detect external writers.
+
+    The LLM response cache is left out: queries persist it on every call.
+    So is the warm-start snapshot, which only mirrors the other files.
+    """
+    if not os.path.isdir(working_dir):
+        return ()
+    entries = []
+    for name in sorted(os.listdir(working_dir)):
+        path = os.path.join(working_dir, name)
+        if os.path.isfile(path) and "llm_response_cache" not in name and not name.startswith(SNAPSHOT_FILE):
+            stat = os.stat(path)
+            entries.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(entries)
+
+
+async def _reload_storages(rag: LightRAG):
+    """Pick up on-disk changes without rebuilding the LightRAG instance."""
+    # JSON KV stores keep their data in a process-wide namespace dict that is
+    # only read from disk once, so reload it in place.
+    for storage in (rag.full_docs, rag.text_chunks, rag.doc_status, *index_storages(rag)):
+        file_name = getattr(storage, "_file_name", None)
+        if file_name is None or storage._data is None:
+            # Log-backed stores catch up on the next access once flagged
+            flag = getattr(storage, "storage_updated", None)
+            if flag is not None:
+                flag.value = True
+            continue
+        data = load_json(file_name) or {}
+        async with storage._storage_lock:
+            storage._data.clear()
+            storage._data.update(data)
+    # Vector and graph stores reload lazily on next access once flagged.
+    for storage in (rag.entities_vdb, rag.relationships_vdb, rag.chunks_vdb, rag.chunk_entity_relation_graph):
+        flag = getattr(storage, "storage_updated", None)
+        if flag is not None:
+            flag.value = True
+
+
+def _storage_footprint(fingerprint: tuple) -> int:
+    """Bytes of storage files in a workspace, the estimate its memory budget is charged."""
+    return sum(size for _, size, _ in fingerprint)
+
+
+def _storages(rag: LightRAG) -> tuple:
+    return (
+        rag.full_docs, rag.text_chunks, rag.llm_response_cache, rag.doc_status,
+        rag.entities_vdb, rag.relationships_vdb, rag.chunks_vdb, rag.chunk_entity_relation_graph,
+        *index_storages(rag),
+    )
+
+
+def _release_shared_data(rag: LightRAG):
+    """Drop a finalized instance's process-wide namespace data so its memory is freed.
+
+    A later load finds the namespaces uninitialized and reads them from disk again.
+    """
+    for storage in _storages(rag):
+        for table in (shared_storage._shared_dicts, shared_storage._init_flags, shared_storage._update_flags):
+            if table is not None:
+                table.pop(storage.namespace, None)
+
+
+# Instances of different workspaces share LightRAG's process-wide pipeline
+# status, so their document pipelines must not run at the same time
+_pipeline_lock = asyncio.Lock()
+
+_pool_stats = {
+    "hits": 0,
+    "loads": 0,
+    "load_seconds": 0.0,
+    "evictions": 0,
+    "snapshot_loads": 0,
+    "snapshot_writes": 0,
+    "snapshot_seconds": 0.0,
+}
+
+
+@dataclass
+class RAGManager:
+    """Owns the long-lived LightRAG for one workspace.
+
+    `use()` hands out the shared instance, `write()` serializes mutations
+    and `refresh()` reloads the storages in place when another process
+    (e.g. `insert_pydantic_docs.py`) changed the files on disk. Both bump
+    `corpus_version`, which caches of query results key their entries on.
+    The manager outlives its instance: after an eviction the next `use()`
+    loads it again, and the version is bumped if the files changed meanwhile.
+    """
+
+    workspace: str = DEFAULT_WORKSPACE
+    working_dir: str = WORKING_DIR
+    rag: Optional[LightRAG] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    corpus_version: int = 0
+    # Callers inside use()/write(); an instance in use is never evicted
+    active: int = 0
+    footprint: int = 0
+    last_used: float = 0.0
+    _fingerprint: tuple = ()
+    _checked_at: float = 0.0
+    _snapshot_task: Optional[asyncio.Task] = None
+    _snapshot_due: float = 0.0
+
+    async def get(self) -> LightRAG:
+        self.last_used = time.monotonic()
+        if self.rag is None:
+            async with self.lock:
+                if self.rag is None:
+                    started = time.perf_counter()
+                    snapshot = Snapshot.open(self.working_dir) if RAG_SNAPSHOT else None
+                    try:
+                        rag = build_lightrag(self.working_dir, workspace_prefix(self.workspace), snapshot)
+                        if snapshot is not None:
+                            await snapshot.restore_kv(rag)
+                            _pool_stats["snapshot_loads"] += 1
+                    finally:
+                        if snapshot is not None:
+                            snapshot.close()
+                    await rag.initialize_storages()
+                    for storage in index_storages(rag):
+                        await storage.initialize()
+                    await initialize_pipeline_status()
+                    fingerprint = _storage_fingerprint(self.working_dir)
+                    if self._fingerprint and fingerprint != self._fingerprint:
+                        # Changed on disk while it was unloaded
+                        self.corpus_version += 1
+                    self._fingerprint = fingerprint
+                    self.footprint = _storage_footprint(fingerprint)
+                    self._checked_at = time.monotonic()
+                    self.rag = rag
+                    _pool_stats["loads"] += 1
+                    _pool_stats["load_seconds"] += time.perf_counter() - started
+                    if snapshot is None:
+                        # Missing or stale; make the next load of this workspace a warm one
+                        self._schedule_snapshot()
+                    await _enforce_budget(keep=self)
+                    return self.rag
+        elif not self.lock.locked() and time.monotonic() - self._checked_at > REFRESH_INTERVAL:
+            # Skipped while a write is running: the writer updates the fingerprint itself
+            await self.refresh()
+        _pool_stats["hits"] += 1
+        return self.rag
+
+    @asynccontextmanager
+    async def use(self) -> AsyncIterator[LightRAG]:
+        """The loaded instance, pinned against eviction until the block exits."""
+        self.active += 1
+        try:
+            yield await self.get()
+        finally:
+            self.active -= 1
+            self.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[LightRAG]:
+        """Hold the instance lock for a mutation and record the resulting on-disk state.
+
+        Provider calls made inside the block queue behind chat traffic.
+        """
+        async with self.use() as rag:
+            async with self.lock, _pipeline_lock:
+                with background():
+                    try:
+                        yield rag
+                    finally:
+                        self.corpus_version += 1
+                        self._fingerprint = _storage_fingerprint(self.working_dir)
+                        self.footprint = _storage_footprint(self._fingerprint)
+                        self._checked_at = time.monotonic()
+                        self._schedule_snapshot()
+
+    async def refresh(self) -> bool:
+        """Reload storages in place if the files on disk changed behind our back."""
+        async with self.lock:
+            self._checked_at = time.monotonic()
+            fingerprint = _storage_fingerprint(self.working_dir)
+            if self.rag is None or fingerprint == self._fingerprint:
+                return False
+            await _reload_storages(self.rag)
+            self.corpus_version += 1
+            self._fingerprint = fingerprint
+            self.footprint = _storage_footprint(fingerprint)
+            self._schedule_snapshot()
+            return True
+
+    def _schedule_snapshot(self):
+        """(Re)start the countdown to the next snapshot; bursts of writes produce one."""
+        if not RAG_SNAPSHOT:
+            return
+        self._snapshot_due = time.monotonic() + RAG_SNAPSHOT_DELAY
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_later())
+
+    async def _snapshot_later(self):
+        try:
+            while (delay := self._snapshot_due - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            # The lock keeps writers out while the storages are serialized
+            async with self.lock:
+                if self.rag is not None:
+                    await self._write_snapshot(self.rag)
+        finally:
+            self._snapshot_task = None
+
+    async def _write_snapshot(self, rag: LightRAG):
+        if _storage_fingerprint(self.working_dir) != self._fingerprint:
+            # Another process changed the files; refresh() reloads and reschedules
+            return
+        started = time.perf_counter()
+        try:
+            path = await asyncio.to_thread(write_snapshot, rag, self.working_dir)
+        except Exception as e:
+            logger.error(f"Failed to write snapshot for workspace {self.workspace}: {e}")
+            return
+        if path is not None:
+            _pool_stats["snapshot_writes"] += 1
+            _pool_stats["snapshot_seconds"] += time.perf_counter() - started
+
+    def idle(self) -> bool:
+        return self.rag is not None and self.active == 0 and not self.lock.locked()
+
+    async def close(self):
+        async with self.lock:
+            # A snapshot still waiting for its countdown is written now instead
+            snapshot_due = self._snapshot_task is not None
+            if snapshot_due:
+                self._snapshot_task.cancel()
+            # Detached first so nothing picks up the instance while it is finalized
+            rag, self.rag = self.rag, None
+            if rag is not None:
+                await rag.finalize_storages()
+                for storage in index_storages(rag):
+                    await storage.finalize()
+                if snapshot_due:
+                    await self._write_snapshot(rag)
+                _release_shared_data(rag)
+
+    def stats(self) -> dict:
+        return {
+            "workspace": self.workspace,
+            "loaded": self.rag is not None,
+            "active": self.active,
+            "footprint_bytes": self.footprint if self.rag is not None else 0,
+            "corpus_version": self.corpus_version,
+            "idle_seconds": time.monotonic() - self.last_used if self.last_used else None,
+        }
+
+
+# In least-recently-used order
+_managers: OrderedDict[str, RAGManager] = OrderedDict()
+
+
+def get_manager(workspace: str = DEFAULT_WORKSPACE, create: bool = False) -> RAGManager:
+    """The workspace's manager; only inserts pass `create` for a workspace that does not exist yet."""
+    working_dir = workspace_dir(workspace)
+    if workspace not in _managers:
+        if not create and not workspace_exists(workspace):
+            raise WorkspaceNotFoundError(f"Unknown workspace: {workspace!r}")
+        _managers[workspace] = RAGManager(workspace=workspace, working_dir=working_dir)
+    _managers.move_to_end(workspace)
+    return _managers[workspace]
+
+
+async def _enforce_budget(keep: RAGManager):
+    """Unload the least recently used idle workspaces until the loaded ones fit the budget."""
+    loaded = [m for m in _managers.values() if m.rag is not None]
+    count = len(loaded)
+    footprint = sum(m.footprint for m in loaded)
+    for manager in loaded:
+        if count <= RAG_MAX_WORKSPACES and footprint <= RAG_MAX_WORKSPACE_MB * 2**20:
+            break
+        if manager is keep or not manager.idle():
+            continue
+        count -= 1
+        footprint -= manager.footprint
+        await manager.close()
+        _pool_stats["evictions"] += 1
+
+
+async def get_rag(workspace: str = DEFAULT_WORKSPACE) -> LightRAG:
+    """The workspace's instance, unpinned; prefer `get_manager(workspace).use()`."""
+    return await get_manager(workspace).get()
+
+
+async def startup_rag(workspace: str = DEFAULT_WORKSPACE) -> LightRAG:
+    """Load the shared instance eagerly so the first request does not pay for it."""
+    return await get_rag(workspace)
+
+
+async def shutdown_rag():
+    for manager in list(_managers.values()):
+        await manager.close()
+    _managers.clear()
+
+
+def workspace_stats() -> dict:
+    managers = list(_managers.values())
+    lookups = _pool_stats["hits"] + _pool_stats["loads"]
+    return {
+        **_pool_stats,
+        "hit_rate": _pool_stats["hits"] / lookups if lookups else 0.0,
+        "loaded": sum(m.rag is not None for m in managers),
+        "footprint_bytes": sum(m.footprint for m in managers if m.rag is not None),
+        "max_workspaces": RAG_MAX_WORKSPACES,
+        "max_footprint_bytes": int(RAG_MAX_WORKSPACE_MB * 2**20),
+        "workspaces": [m.stats() for m in reversed(managers)],
+    }
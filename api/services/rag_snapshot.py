@@ -0,0 +1,212 @@
+"""Warm-start snapshots of a workspace's loaded storages.
+
+Loading a workspace normally parses every `kv_store_*.json`, the GraphML graph
+and each NanoVectorDB file (base64 inside JSON). After the workspace changes,
+`RAGManager` writes the loaded state to `<working_dir>/rag_snapshot.bin`:
+
+    b"LRAGSNAP" | u32 format | u32 header length | header JSON | sections
+
+Each section is page-aligned. KV stores and the graph are pickled, and vector
+matrices are stored as raw float32 and memory-mapped copy-on-write. The header
+records the size and mtime of every source file a section replaces. On the next
+load, any mismatch (or a different format or LightRAG version) makes the
+snapshot stale, and the storages load from their own files as usual.
+
+Only LightRAG's default backends are snapshotted; the log, IVF and CSR storages
+under services/storage already open in constant time.
+"""
+
+import os
+import json
+import mmap
+import time
+import pickle
+import struct
+from contextlib import contextmanager
+from typing import Any, Optional
+
+import numpy as np
+import networkx as nx
+import nano_vectordb.dbs
+import lightrag
+from lightrag.lightrag import LightRAG
+from lightrag.kg.json_kv_impl import JsonKVStorage
+from lightrag.kg.json_doc_status_impl import JsonDocStatusStorage
+from lightrag.kg.nano_vector_db_impl import NanoVectorDBStorage
+from lightrag.kg.networkx_impl import NetworkXStorage
+from lightrag.kg.shared_storage import get_namespace_data, try_initialize_namespace
+from lightrag.utils import logger
+
+SNAPSHOT_FILE = "rag_snapshot.bin"
+FORMAT_VERSION = 1
+
+_MAGIC = b"LRAGSNAP"
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 4096
+
+
+def _source_stat(path: str) -> Optional[list[int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _align(position: int) -> int:
+    return -position % _ALIGN
+
+
+class Snapshot:
+    def __init__(self, path: str, header: dict, data_start: int):
+        self.path = path
+        self.header = header
+        self._data_start = data_start
+        self._sections: dict[str, dict] = header["sections"]
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, working_dir: str) -> Optional["Snapshot"]:
+        """The workspace's snapshot, or None if there is none or it is stale."""
+        path = os.path.join(working_dir, SNAPSHOT_FILE)
+        try:
+            with open(path, "rb") as f:
+                magic, version, length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+                if magic != _MAGIC or version != FORMAT_VERSION:
+                    logger.info(f"Ignoring snapshot {path}: format {version} is not {FORMAT_VERSION}")
+                    return None
+                header = json.loads(f.read(length))
+        except FileNotFoundError:
+            return None
+        except (struct.error, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+        if header["lightrag"] != lightrag.__version__:
+            logger.info(f"Ignoring snapshot {path}: written by LightRAG {header['lightrag']}")
+            return None
+        for source, stat in header["sources"].items():
+            if _source_stat(os.path.join(working_dir, source)) != stat:
+                logger.info(f"Ignoring snapshot {path}: {source} changed since it was written")
+                return None
+        return cls(path, header, _PREAMBLE.size + length + _align(_PREAMBLE.size + length))
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def _bytes(self, offset: int, length: int) -> memoryview:
+        start = self._data_start + offset
+        return memoryview(self._mm)[start:start + length]
+
+    def _load(self, section: dict) -> Any:
+        return pickle.loads(self._bytes(section["offset"], section["length"]))
+
+    def _vectors(self, section: dict) -> dict:
+        storage = self._load(section)
+        rows, dim = section["rows"], storage["embedding_dim"]
+        if rows:
+            storage["matrix"] = np.memmap(
+                self.path, dtype=np.float32, mode="c",
+                offset=self._data_start + section["matrix_offset"], shape=(rows, dim),
+            )
+        else:
+            storage["matrix"] = np.zeros((0, dim), dtype=np.float32)
+        return storage
+
+    @contextmanager
+    def loaders(self):
+        """Serve GraphML and NanoVectorDB loads from the snapshot while a LightRAG is constructed.
+
+        Both stores load their files in `__post_init__`, i.e. inside `LightRAG(...)`.
+        """
+        load_graph = NetworkXStorage.load_nx_graph
+        load_vectors = nano_vectordb.dbs.load_storage
+
+        def snapshot_graph(file_name):
+            section = self._sections.get(os.path.basename(file_name))
+            return self._load(section) if section else load_graph(file_name)
+
+        def snapshot_vectors(file_name):
+            section = self._sections.get(os.path.basename(file_name))
+            return self._vectors(section) if section else load_vectors(file_name)
+
+        NetworkXStorage.load_nx_graph = staticmethod(snapshot_graph)
+        nano_vectordb.dbs.load_storage = snapshot_vectors
+        try:
+            yield
+        finally:
+            NetworkXStorage.load_nx_graph = staticmethod(load_graph)
+            nano_vectordb.dbs.load_storage = load_vectors
+
+    async def restore_kv(self, rag: LightRAG):
+        """Fill the JSON KV namespaces before `initialize_storages()`, which then skips their files."""
+        for storage in (rag.full_docs, rag.text_chunks, rag.doc_status):
+            if not isinstance(storage, (JsonKVStorage, JsonDocStatusStorage)):
+                continue
+            section = self._sections.get(os.path.basename(storage._file_name))
+            if section and await try_initialize_namespace(storage.namespace):
+                data = await get_namespace_data(storage.namespace)
+                data.update(self._load(section))
+
+
+def write_snapshot(rag: LightRAG, working_dir: str) -> Optional[str]:
+    """Write the loaded state of `rag` atomically; the caller keeps it from changing meanwhile.
+
+    Blocking; run it in a worker thread.
+    """
+    sections, sources, blobs = {}, {}, []
+    position = 0
+
+    def add(source_file: str, payload: bytes, **extra) -> dict:
+        nonlocal position
+        source = os.path.basename(source_file)
+        sources[source] = _source_stat(source_file)
+        sections[source] = {"offset": position, "length": len(payload), **extra}
+        blobs.append(payload)
+        position += len(payload)
+        padding = _align(position)
+        blobs.append(b"\0" * padding)
+        position += padding
+        return sections[source]
+
+    for storage in (rag.full_docs, rag.text_chunks, rag.doc_status):
+        if isinstance(storage, (JsonKVStorage, JsonDocStatusStorage)) and storage._data is not None:
+            add(storage._file_name, pickle.dumps(dict(storage._data), protocol=5), kind="kv")
+    graph = rag.chunk_entity_relation_graph
+    if isinstance(graph, NetworkXStorage) and isinstance(graph._graph, nx.Graph):
+        add(graph._graphml_xml_file, pickle.dumps(graph._graph, protocol=5), kind="graph")
+    for storage in (rag.entities_vdb, rag.relationships_vdb, rag.chunks_vdb):
+        if not isinstance(storage, NanoVectorDBStorage):
+            continue
+        vectors = getattr(storage._client, "_NanoVectorDB__storage")
+        matrix = np.ascontiguousarray(vectors["matrix"], dtype=np.float32)
+        meta = {k: v for k, v in vectors.items() if k != "matrix"}
+        section = add(storage._client_file_name, pickle.dumps(meta, protocol=5), kind="vectors", rows=len(matrix))
+        section["matrix_offset"] = position
+        blobs.append(matrix.tobytes())
+        position += matrix.nbytes
+        padding = _align(position)
+        blobs.append(b"\0" * padding)
+        position += padding
+    if not sections:
+        return None
+
+    header = json.dumps({
+        "lightrag": lightrag.__version__,
+        "created_at": time.time(),
+        "sources": sources,
+        "sections": sections,
+    }).encode("utf-8")
+    path = os.path.join(working_dir, SNAPSHOT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREAMBLE.pack(_MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * _align(_PREAMBLE.size + len(header)))
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
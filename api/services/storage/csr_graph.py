@@ -0,0 +1,335 @@
+"""Undirected property graph in CSR layout with an append-only change log.
+
+A snapshot generation interns node names to integer ids and stores the
+adjacency as `indptr`/`indices` arrays (each row sorted), plus node and edge
+attributes as JSON records in a blob with an offsets array. Everything except
+the name table is memory-mapped, and attributes are decoded only when read.
+
+Changes since the snapshot are kept in an in-memory overlay and appended to a
+per-generation log by `flush()`, so persisting costs O(changes). `compact()`
+folds the overlay into a new generation and starts an empty log; a crash at
+any point leaves the previous manifest, snapshot and log intact. A torn record
+at the end of the log is cut off when the graph is opened, so later appends
+are not written after it.
+"""
+
+import os
+import json
+from typing import Any, Iterator, Optional
+
+import numpy as np
+from lightrag.utils import logger
+
+# Compact once the log holds this many operations and at least this fraction of the graph size
+GRAPH_COMPACT_MIN_OPS = int(os.getenv("GRAPH_COMPACT_MIN_OPS", "10000"))
+GRAPH_COMPACT_RATIO = float(os.getenv("GRAPH_COMPACT_RATIO", "0.5"))
+
+
+def _key(u: str, v: str) -> tuple[str, str]:
+    return (u, v) if u <= v else (v, u)
+
+
+class _Blob:
+    """Variable-length records stored back to back, addressed through an offsets array."""
+
+    def __init__(self, path: str):
+        self.offsets = np.load(path + ".npy", mmap_mode="r")
+        size = os.path.getsize(path + ".bin")
+        self.data = np.memmap(path + ".bin", dtype=np.uint8, mode="r") if size else np.empty(0, dtype=np.uint8)
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    @staticmethod
+    def write(path: str, records: list[bytes]):
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in records], out=offsets[1:])
+        with open(path + ".bin", "wb") as f:
+            for record in records:
+                f.write(record)
+        np.save(path + ".npy", offsets)
+
+
+class CSRGraph:
+    def __init__(self, manifest_file: str, data_dir: str):
+        self.manifest_file = manifest_file
+        self.data_dir = data_dir
+        self.load(repair=True)
+
+    def _reset(self):
+        self.generation = 0
+        self.names: list[str] = []
+        self.index: dict[str, int] = {}
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._edge_ref = np.empty(0, dtype=np.int64)
+        self._node_attrs: Optional[_Blob] = None
+        self._edge_attrs: Optional[_Blob] = None
+        self.base_edges = 0
+        # Overlay: name/edge key -> attributes, or None once deleted
+        self._nodes: dict[str, Optional[dict]] = {}
+        self._edges: dict[tuple[str, str], Optional[dict]] = {}
+        # Neighbours joined by edges that are not in the snapshot
+        self._added: dict[str, set[str]] = {}
+        self._pending: list[dict] = []
+        self.log_ops = 0
+
+    # ─── Persistence ───
+
+    def _path(self, name: str, generation: Optional[int] = None) -> str:
+        return os.path.join(self.data_dir, f"{name}-{self.generation if generation is None else generation}")
+
+    @property
+    def log_file(self) -> str:
+        # Next to the manifest, so file-watching reloaders see appends
+        return f"{os.path.splitext(self.manifest_file)[0]}-{self.generation}.log"
+
+    def load(self, repair: bool = False):
+        self._reset()
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.generation = manifest["generation"]
+            self.base_edges = manifest["edges"]
+            names = _Blob(self._path("names"))
+            self.names = [names[i].decode("utf-8") for i in range(manifest["nodes"])]
+            self.index = {name: i for i, name in enumerate(self.names)}
+            self._indptr = np.load(self._path("indptr") + ".npy", mmap_mode="r")
+            self._indices = np.load(self._path("indices") + ".npy", mmap_mode="r")
+            self._edge_ref = np.load(self._path("edge_ref") + ".npy", mmap_mode="r")
+            self._node_attrs = _Blob(self._path("node_attrs"))
+            self._edge_attrs = _Blob(self._path("edge_attrs"))
+        # Generation 0 has no snapshot, only a log
+        self._replay(repair)
+
+    def _replay(self, repair: bool = False):
+        if not os.path.exists(self.log_file):
+            return
+        size = 0
+        with open(self.log_file, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("record without its newline")
+                    op = json.loads(line)
+                except ValueError:
+                    # A torn final record from a crash mid-append
+                    if repair:
+                        logger.warning(f"Truncating {self.log_file} at byte {size}: torn or corrupt record")
+                        os.truncate(self.log_file, size)
+                    # Otherwise another process may still be writing it
+                    break
+                self._apply(op)
+                self.log_ops += 1
+                size += len(line)
+        self._pending = []
+
+    def flush(self):
+        """Append pending operations to the log and fsync it."""
+        if not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+        payload = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in self._pending)
+        with open(self.log_file, "a", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_ops += len(self._pending)
+        self._pending = []
+
+    def should_compact(self) -> bool:
+        return self.log_ops >= GRAPH_COMPACT_MIN_OPS and self.log_ops >= GRAPH_COMPACT_RATIO * (
+            len(self.names) + self.base_edges
+        )
+
+    def compact(self):
+        """Write the current graph as a new snapshot generation and drop the old one."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        names = list(self.nodes())
+        index = {name: i for i, name in enumerate(names)}
+        node_records = [self._node_raw(name) for name in names]
+        src, dst, edge_records = [], [], []
+        for u in names:
+            for v in self.neighbors(u):
+                if u <= v:
+                    src.append(index[u])
+                    dst.append(index[v])
+                    edge_records.append(self._edge_raw(u, v))
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        ref = np.arange(len(edge_records), dtype=np.int64)
+        # Both directions, except that a self-loop is stored once
+        back = src != dst
+        rows = np.concatenate([src, dst[back]])
+        cols = np.concatenate([dst, src[back]]).astype(np.int32)
+        refs = np.concatenate([ref, ref[back]])
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(names)), out=indptr[1:])
+
+        old_generation, old_log = self.generation, self.log_file
+        generation = old_generation + 1
+        _Blob.write(self._path("names", generation), [n.encode("utf-8") for n in names])
+        _Blob.write(self._path("node_attrs", generation), node_records)
+        _Blob.write(self._path("edge_attrs", generation), edge_records)
+        np.save(self._path("indptr", generation) + ".npy", indptr)
+        np.save(self._path("indices", generation) + ".npy", cols[order])
+        np.save(self._path("edge_ref", generation) + ".npy", refs[order])
+        manifest = {"generation": generation, "nodes": len(names), "edges": len(edge_records)}
+        tmp = self.manifest_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_file)
+        self.load()
+
+        for name in ("names", "node_attrs", "edge_attrs"):
+            for suffix in (".bin", ".npy"):
+                _remove(self._path(name, old_generation) + suffix)
+        for name in ("indptr", "indices", "edge_ref"):
+            _remove(self._path(name, old_generation) + ".npy")
+        _remove(old_log)
+
+    # ─── Reads ───
+
+    def _base_row(self, name: str) -> Optional[int]:
+        i = self.index.get(name)
+        return None if i is None or self._nodes.get(name, True) is None else i
+
+    def _base_edge(self, u: str, v: str) -> Optional[int]:
+        """Attribute record of the snapshot edge u-v, found by binary search in u's row."""
+        i, j = self.index.get(u), self.index.get(v)
+        if i is None or j is None:
+            return None
+        start, end = self._indptr[i], self._indptr[i + 1]
+        pos = start + np.searchsorted(self._indices[start:end], j)
+        if pos < end and self._indices[pos] == j:
+            return int(self._edge_ref[pos])
+        return None
+
+    def has_node(self, name: str) -> bool:
+        if name in self._nodes:
+            return self._nodes[name] is not None
+        return name in self.index
+
+    def get_node(self, name: str) -> Optional[dict[str, Any]]:
+        if name in self._nodes:
+            return self._nodes[name]
+        i = self.index.get(name)
+        return json.loads(self._node_attrs[i]) if i is not None else None
+
+    def _node_raw(self, name: str) -> bytes:
+        if name in self._nodes:
+            return json.dumps(self._nodes[name], ensure_ascii=False).encode("utf-8")
+        return self._node_attrs[self.index[name]]
+
+    def nodes(self) -> Iterator[str]:
+        for name in self.names:
+            if self._nodes.get(name, True) is not None:
+                yield name
+        for name, data in self._nodes.items():
+            if data is not None and name not in self.index:
+                yield name
+
+    def neighbors(self, name: str) -> list[str]:
+        """Neighbours of `name` in O(degree)."""
+        result = []
+        i = self._base_row(name)
+        if i is not None:
+            for j in self._indices[self._indptr[i]:self._indptr[i + 1]]:
+                other = self.names[j]
+                if self._edges.get(_key(name, other), True) is not None:
+                    result.append(other)
+        result.extend(self._added.get(name, ()))
+        return result
+
+    def degree(self, name: str) -> int:
+        if not self.has_node(name):
+            return 0
+        neighbors = self.neighbors(name)
+        # A self-loop counts twice, as in networkx
+        return len(neighbors) + (name in neighbors)
+
+    def has_edge(self, u: str, v: str) -> bool:
+        key = _key(u, v)
+        if key in self._edges:
+            return self._edges[key] is not None
+        return self._base_edge(u, v) is not None and self.has_node(u) and self.has_node(v)
+
+    def get_edge(self, u: str, v: str) -> Optional[dict[str, Any]]:
+        key = _key(u, v)
+        if key in self._edges:
+            return self._edges[key]
+        if not (self.has_node(u) and self.has_node(v)):
+            return None
+        ref = self._base_edge(u, v)
+        return json.loads(self._edge_attrs[ref]) if ref is not None else None
+
+    def _edge_raw(self, u: str, v: str) -> bytes:
+        key = _key(u, v)
+        if key in self._edges:
+            return json.dumps(self._edges[key], ensure_ascii=False).encode("utf-8")
+        return self._edge_attrs[self._base_edge(u, v)]
+
+    # ─── Writes ───
+
+    def _apply(self, op: dict):
+        kind = op["op"]
+        if kind == "node":
+            self._upsert_node(op["id"], op["data"])
+        elif kind == "edge":
+            self._upsert_edge(op["src"], op["tgt"], op["data"])
+        elif kind == "del_node":
+            self._delete_node(op["id"])
+        elif kind == "del_edge":
+            self._delete_edge(op["src"], op["tgt"])
+
+    def _record(self, op: dict):
+        self._apply(op)
+        self._pending.append(op)
+
+    def upsert_node(self, name: str, data: dict[str, Any]):
+        self._record({"op": "node", "id": name, "data": data})
+
+    def upsert_edge(self, u: str, v: str, data: dict[str, Any]):
+        self._record({"op": "edge", "src": u, "tgt": v, "data": data})
+
+    def delete_node(self, name: str):
+        self._record({"op": "del_node", "id": name})
+
+    def delete_edge(self, u: str, v: str):
+        self._record({"op": "del_edge", "src": u, "tgt": v})
+
+    # Same merge semantics as networkx.Graph.add_node / add_edge
+    def _upsert_node(self, name: str, data: dict[str, Any]):
+        self._nodes[name] = {**(self.get_node(name) or {}), **data}
+
+    def _upsert_edge(self, u: str, v: str, data: dict[str, Any]):
+        for name in (u, v):
+            if not self.has_node(name):
+                self._nodes[name] = {}
+        existing = self.get_edge(u, v)
+        self._edges[_key(u, v)] = {**(existing or {}), **data}
+        if existing is None and self._base_edge(u, v) is None:
+            self._added.setdefault(u, set()).add(v)
+            self._added.setdefault(v, set()).add(u)
+
+    def _delete_edge(self, u: str, v: str):
+        if not self.has_edge(u, v):
+            return
+        self._edges[_key(u, v)] = None
+        self._added.get(u, set()).discard(v)
+        self._added.get(v, set()).discard(u)
+
+    def _delete_node(self, name: str):
+        if not self.has_node(name):
+            return
+        for other in self.neighbors(name):
+            self._delete_edge(name, other)
+        self._nodes[name] = None
+        self._added.pop(name, None)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,240 @@
+"""LightRAG graph storage backed by `CSRGraph` instead of a whole-file GraphML load.
+
+Select it with `RAG_GRAPH_STORAGE=CSRGraphStorage`. The manifest and change log
+live at `<working_dir>/graph_<namespace>.csr.json` and `graph_<namespace>.csr-<gen>.log`,
+with the snapshot arrays in `csr_<namespace>/`. An existing
+`graph_<namespace>.graphml` is imported on first load.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import final
+
+from lightrag.base import BaseGraphStorage
+from lightrag.types import KnowledgeGraph, KnowledgeGraphNode, KnowledgeGraphEdge
+from lightrag.utils import logger
+from lightrag.kg.shared_storage import get_storage_lock, get_update_flag, set_all_update_flags
+
+from .csr_graph import CSRGraph
+
+MAX_GRAPH_NODES = int(os.getenv("MAX_GRAPH_NODES", 1000))
+
+
+@final
+@dataclass
+class CSRGraphStorage(BaseGraphStorage):
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._manifest_file = os.path.join(working_dir, f"graph_{self.namespace}.csr.json")
+        self._data_dir = os.path.join(working_dir, f"csr_{self.namespace}")
+        self._graphml_file = os.path.join(working_dir, f"graph_{self.namespace}.graphml")
+        self._storage_lock = None
+        self.storage_updated = None
+        self._graph = self._open_graph()
+        logger.info(f"Loaded graph {self.namespace} with {len(self._graph.names)} interned nodes")
+
+    def _open_graph(self) -> CSRGraph:
+        graph = CSRGraph(self._manifest_file, self._data_dir)
+        if graph.generation == 0 and not graph.log_ops and os.path.exists(self._graphml_file):
+            self._import_graphml(graph)
+        return graph
+
+    def _import_graphml(self, graph: CSRGraph):
+        import networkx as nx
+
+        nx_graph = nx.read_graphml(self._graphml_file)
+        for node, data in nx_graph.nodes(data=True):
+            graph.upsert_node(node, data)
+        for source, target, data in nx_graph.edges(data=True):
+            graph.upsert_edge(source, target, data)
+        graph.compact()
+        logger.info(
+            f"Imported {nx_graph.number_of_nodes()} nodes, {nx_graph.number_of_edges()} edges from {self._graphml_file}"
+        )
+
+    async def initialize(self):
+        """Initialize storage data"""
+        self.storage_updated = await get_update_flag(self.namespace)
+        self._storage_lock = get_storage_lock()
+
+    async def _get_graph(self) -> CSRGraph:
+        """Check if the storage should be reloaded"""
+        async with self._storage_lock:
+            if self.storage_updated.value:
+                logger.info(
+                    f"Process {os.getpid()} reloading graph {self.namespace} due to update by another process"
+                )
+                self._graph.load()
+                self.storage_updated.value = False
+            return self._graph
+
+    async def has_node(self, node_id: str) -> bool:
+        graph = await self._get_graph()
+        return graph.has_node(node_id)
+
+    async def has_edge(self, source_node_id: str, target_node_id: str) -> bool:
+        graph = await self._get_graph()
+        return graph.has_edge(source_node_id, target_node_id)
+
+    async def get_node(self, node_id: str) -> dict[str, str] | None:
+        graph = await self._get_graph()
+        return graph.get_node(node_id)
+
+    async def node_degree(self, node_id: str) -> int:
+        graph = await self._get_graph()
+        return graph.degree(node_id)
+
+    async def edge_degree(self, src_id: str, tgt_id: str) -> int:
+        graph = await self._get_graph()
+        return graph.degree(src_id) + graph.degree(tgt_id)
+
+    async def get_edge(self, source_node_id: str, target_node_id: str) -> dict[str, str] | None:
+        graph = await self._get_graph()
+        return graph.get_edge(source_node_id, target_node_id)
+
+    async def get_node_edges(self, source_node_id: str) -> list[tuple[str, str]] | None:
+        graph = await self._get_graph()
+        if graph.has_node(source_node_id):
+            return [(source_node_id, other) for other in graph.neighbors(source_node_id)]
+        return None
+
+    # Writes are persisted to the log by the next index_done_callback
+    async def upsert_node(self, node_id: str, node_data: dict[str, str]) -> None:
+        graph = await self._get_graph()
+        graph.upsert_node(node_id, node_data)
+
+    async def upsert_edge(self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]) -> None:
+        graph = await self._get_graph()
+        graph.upsert_edge(source_node_id, target_node_id, edge_data)
+
+    async def delete_node(self, node_id: str) -> None:
+        graph = await self._get_graph()
+        if graph.has_node(node_id):
+            graph.delete_node(node_id)
+            logger.debug(f"Node {node_id} deleted from the graph.")
+        else:
+            logger.warning(f"Node {node_id} not found in the graph for deletion.")
+
+    async def remove_nodes(self, nodes: list[str]):
+        graph = await self._get_graph()
+        for node in nodes:
+            graph.delete_node(node)
+
+    async def remove_edges(self, edges: list[tuple[str, str]]):
+        graph = await self._get_graph()
+        for source, target in edges:
+            graph.delete_edge(source, target)
+
+    async def get_all_labels(self) -> list[str]:
+        graph = await self._get_graph()
+        return sorted(graph.nodes())
+
+    async def get_knowledge_graph(
+        self,
+        node_label: str,
+        max_depth: int = 3,
+        max_nodes: int = MAX_GRAPH_NODES,
+    ) -> KnowledgeGraph:
+        """Same selection as NetworkXStorage: top-degree nodes for "*", otherwise a degree-first BFS."""
+        graph = await self._get_graph()
+        result = KnowledgeGraph()
+
+        if node_label == "*":
+            degrees = sorted(((n, graph.degree(n)) for n in graph.nodes()), key=lambda x: x[1], reverse=True)
+            if len(degrees) > max_nodes:
+                result.is_truncated = True
+                logger.info(f"Graph truncated: {len(degrees)} nodes found, limited to {max_nodes}")
+            selected = [node for node, _ in degrees[:max_nodes]]
+        else:
+            if not graph.has_node(node_label):
+                logger.warning(f"Node {node_label} not found in the graph")
+                return KnowledgeGraph()
+            selected = []
+            visited = set()
+            queue = [(node_label, 0, graph.degree(node_label))]
+            while queue and len(selected) < max_nodes:
+                current_depth = queue[0][1]
+                level = []
+                while queue and queue[0][1] == current_depth:
+                    level.append(queue.pop(0))
+                level.sort(key=lambda x: x[2], reverse=True)
+                for node, depth, _ in level:
+                    if node not in visited:
+                        visited.add(node)
+                        selected.append(node)
+                        if depth < max_depth:
+                            for neighbor in graph.neighbors(node):
+                                if neighbor not in visited:
+                                    queue.append((neighbor, depth + 1, graph.degree(neighbor)))
+                    if len(selected) >= max_nodes:
+                        break
+            if queue and len(selected) >= max_nodes:
+                result.is_truncated = True
+                logger.info(f"Graph truncated: breadth-first search limited to {max_nodes} nodes")
+
+        members = set(selected)
+        for node in selected:
+            result.nodes.append(KnowledgeGraphNode(id=node, labels=[node], properties=dict(graph.get_node(node))))
+        seen_edges = set()
+        for node in selected:
+            for neighbor in graph.neighbors(node):
+                if neighbor not in members:
+                    continue
+                source, target = sorted((node, neighbor))
+                edge_id = f"{source}-{target}"
+                if edge_id in seen_edges:
+                    continue
+                seen_edges.add(edge_id)
+                result.edges.append(
+                    KnowledgeGraphEdge(
+                        id=edge_id,
+                        type="DIRECTED",
+                        source=source,
+                        target=target,
+                        properties=dict(graph.get_edge(source, target)),
+                    )
+                )
+
+        logger.info(
+            f"Subgraph query successful | Node count: {len(result.nodes)} | Edge count: {len(result.edges)}"
+        )
+        return result
+
+    async def index_done_callback(self) -> bool:
+        """Append this batch's changes to the log; compact into a new snapshot when the log is large"""
+        async with self._storage_lock:
+            if self.storage_updated.value:
+                logger.info(f"Graph for {self.namespace} was updated by another process, reloading...")
+                self._graph.load()
+                self.storage_updated.value = False
+                return False
+            try:
+                self._graph.flush()
+                if self._graph.should_compact():
+                    logger.info(f"Compacting graph {self.namespace} ({self._graph.log_ops} logged changes)")
+                    self._graph.compact()
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+                return True
+            except Exception as e:
+                logger.error(f"Error saving graph for {self.namespace}: {e}")
+                return False
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            async with self._storage_lock:
+                graph = self._graph
+                for path in (self._manifest_file, graph.log_file, self._graphml_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+                if os.path.isdir(self._data_dir):
+                    for name in os.listdir(self._data_dir):
+                        os.remove(os.path.join(self._data_dir, name))
+                self._graph = self._open_graph()
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+                logger.info(f"Process {os.getpid()} drop graph {self.namespace} (file:{self._manifest_file})")
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            logger.error(f"Error dropping graph {self.namespace}: {e}")
+            return {"status": "error", "message": str(e)}
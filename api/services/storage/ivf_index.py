@@ -0,0 +1,416 @@
+"""Inverted-file (IVF) index over unit-normalized float32 vectors.
+
+Vectors are clustered around `nlist` k-means centroids; a query only scores
+the rows of the `nprobe` closest clusters instead of the whole matrix. A saved
+generation is a set of generation-stamped `.npy` files plus a JSON manifest, and
+the vector file is memory-mapped on load, so opening an index does not read it
+into RAM. Rows added since the generation was written live in an in-memory
+tail; deletes are tombstones.
+
+`save()` appends the rows and tombstones since the previous save to the
+generation's delta log, so persisting costs O(changes). The delta is replayed
+into the tail on load, and a torn record at its end is cut off. `compact()`
+drops tombstoned rows, retrains the clusters when due and writes a new
+generation; `save()` runs it once the delta outgrows the base or the index
+needs (re)clustering.
+
+With `IVF_QUANTIZATION` set to `float16` or `int8` (one scale per vector), the
+saved rows are scored from a compact in-memory copy of the vectors instead of
+the float32 file. The best `top_k * IVF_RERANK` candidates are then re-scored
+at full precision, reading only those rows from the memory-mapped file.
+"""
+
+import os
+import json
+import math
+import base64
+from typing import Any, Optional
+
+import numpy as np
+from lightrag.utils import logger
+
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Below this many vectors queries scan everything; clustering would not pay off
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", "2048"))
+# Number of clusters; 0 picks sqrt(n)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+# Re-cluster once the index has grown by this factor since the last training
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "2.0"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "50000"))
+IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", "10"))
+# "none", "float16" or "int8"
+IVF_QUANTIZATION = os.getenv("IVF_QUANTIZATION", "none")
+# Candidates re-scored at full precision, as a multiple of top_k; 0 trusts the quantized scores
+IVF_RERANK = int(os.getenv("IVF_RERANK", "4"))
+# Compact once the delta log holds this many records and at least this fraction of the base rows
+IVF_COMPACT_MIN_RECORDS = int(os.getenv("IVF_COMPACT_MIN_RECORDS", "1000"))
+IVF_COMPACT_RATIO = float(os.getenv("IVF_COMPACT_RATIO", "0.5"))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = IVF_TRAIN_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on normalized vectors; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = np.bincount(labels, minlength=k) == 0
+        # Re-seed empty clusters with random points so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return `(codes, scales)`; scales are only used by int8."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` largest scores, best first."""
+    if len(scores) > k:
+        best = np.argpartition(scores, -k)[-k:]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(scores[best])[::-1]]
+
+
+class IVFIndex:
+    def __init__(self, manifest_file: str, data_dir: str, dim: int):
+        self.manifest_file = manifest_file
+        self.data_dir = data_dir
+        self.dim = dim
+        self.nprobe = IVF_NPROBE
+        self.quantization = IVF_QUANTIZATION
+        self.rerank = IVF_RERANK
+        self.ids: list[str] = []
+        self.meta: list[dict[str, Any]] = []
+        self._row: dict[str, int] = {}
+        self._base = np.empty((0, dim), dtype=np.float32)
+        self._tail: list[np.ndarray] = []
+        self._tail_matrix: Optional[np.ndarray] = None
+        # Quantized copy of `_base`, held in memory; None when quantization is off
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._alive = np.ones(0, dtype=bool)
+        self._assign = np.empty(0, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._generation = 0
+        # Rows below this are on disk; ids of those deleted since the last save
+        self._saved_rows = 0
+        self._saved_deletes: list[str] = []
+        self.delta_records = 0
+        # CSR layout of the inverted lists, rebuilt lazily after changes
+        self._lists: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self.load(repair=True)
+
+    # ─── Persistence ───
+
+    def _file(self, name: str, generation: int) -> str:
+        return os.path.join(self.data_dir, f"{name}-{generation}.npy")
+
+    @property
+    def delta_file(self) -> str:
+        return os.path.join(self.data_dir, f"delta-{self._generation}.log")
+
+    def load(self, repair: bool = False):
+        if not os.path.exists(self.manifest_file):
+            return
+        with open(self.manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["dim"] != self.dim:
+            raise ValueError(f"Embedding dim mismatch, expected: {self.dim}, but loaded: {manifest['dim']}")
+        self._generation = manifest["generation"]
+        self.meta = manifest["meta"]
+        self.ids = [m["__id__"] for m in self.meta]
+        self._row = {id_: row for row, id_ in enumerate(self.ids)}
+        self.trained_size = manifest["trained_size"]
+        self._open_generation()
+        self._replay(repair)
+
+    def _open_generation(self):
+        """Map the current generation's files; the tail, tombstones and delta start empty."""
+        if self.ids:
+            self._base = np.load(self._file("vectors", self._generation), mmap_mode="r")
+            self._assign = np.load(self._file("assign", self._generation))
+        else:
+            self._base = np.empty((0, self.dim), dtype=np.float32)
+            self._assign = np.empty(0, dtype=np.int32)
+        self.centroids = np.load(self._file("centroids", self._generation)) if self.trained_size else None
+        self._codes = self._scales = None
+        if self.quantization != "none" and self.ids:
+            self._load_codes()
+        self._alive = np.ones(len(self.ids), dtype=bool)
+        self._tail, self._tail_matrix, self._lists = [], None, None
+        self._saved_rows, self._saved_deletes, self.delta_records = len(self.ids), [], 0
+
+    def _replay(self, repair: bool = False):
+        """Apply the delta log written since this generation was compacted."""
+        if not os.path.exists(self.delta_file):
+            return
+        size = 0
+        metas, vectors = [], []
+        with open(self.delta_file, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("record without its newline")
+                    record = json.loads(line)
+                    if "add" in record:
+                        vector = np.frombuffer(base64.b64decode(record["vector"]), dtype=np.float32)
+                        if len(vector) != self.dim:
+                            raise ValueError("vector of the wrong size")
+                except ValueError:
+                    # A torn final record from a crash mid-append
+                    if repair:
+                        logger.warning(f"Truncating {self.delta_file} at byte {size}: torn or corrupt record")
+                        os.truncate(self.delta_file, size)
+                    # Otherwise another process may still be writing it
+                    break
+                if "add" in record:
+                    metas.append(record["add"])
+                    vectors.append(vector)
+                else:
+                    # Consecutive adds go in as one batch
+                    if metas:
+                        self.upsert(metas, np.stack(vectors))
+                        metas, vectors = [], []
+                    self.delete([record["delete"]])
+                self.delta_records += 1
+                size += len(line)
+        if metas:
+            self.upsert(metas, np.stack(vectors))
+        self._saved_rows, self._saved_deletes = len(self.ids), []
+
+    def _load_codes(self):
+        codes_file = self._file(f"codes-{self.quantization}", self._generation)
+        scales_file = self._file("scales-int8", self._generation)
+        if not os.path.exists(codes_file):
+            # Saved with another quantization setting; encode once and keep it for next time
+            codes, scales = quantize(np.asarray(self._base), self.quantization)
+            np.save(codes_file, codes)
+            if scales is not None:
+                np.save(scales_file, scales)
+        self._codes = np.load(codes_file)
+        if self.quantization == "int8":
+            self._scales = np.load(scales_file)
+
+    def _retrain_due(self) -> bool:
+        alive = len(self)
+        if alive < IVF_MIN_TRAIN:
+            return self.centroids is not None
+        return self.centroids is None or alive >= self.trained_size * IVF_RETRAIN_GROWTH
+
+    def should_compact(self) -> bool:
+        return self.delta_records >= IVF_COMPACT_MIN_RECORDS and self.delta_records >= IVF_COMPACT_RATIO * len(
+            self._base
+        )
+
+    def save(self):
+        """Append changes since the last save to the delta log and fsync it; compact when due."""
+        if not self._saved_deletes and self._saved_rows == len(self.ids):
+            return
+        if not os.path.exists(self.manifest_file) or self._retrain_due():
+            self.compact()
+            return
+        # Tombstones first: they refer to saved rows, never to the re-added ones after them
+        records = [{"delete": id_} for id_ in self._saved_deletes]
+        rows = np.arange(self._saved_rows, len(self.ids))
+        rows = rows[self._alive[rows]]
+        for row, vector in zip(rows, self._rows(rows)):
+            records.append({"add": self.meta[row], "vector": base64.b64encode(vector.tobytes()).decode("ascii")})
+        os.makedirs(self.data_dir, exist_ok=True)
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self.delta_file, "a", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.delta_records += len(records)
+        self._saved_rows, self._saved_deletes = len(self.ids), []
+        if self.should_compact():
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows, (re)train if due, and write a new generation atomically."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        rows = np.flatnonzero(self._alive)
+        vectors = self._rows(rows) if len(rows) else np.empty((0, self.dim), dtype=np.float32)
+        self.meta = [self.meta[r] for r in rows]
+        self.ids = [self.ids[r] for r in rows]
+        self._row = {id_: row for row, id_ in enumerate(self.ids)}
+        self._assign = self._assign[rows]
+
+        if len(rows) >= IVF_MIN_TRAIN and (
+            self.centroids is None or len(rows) >= self.trained_size * IVF_RETRAIN_GROWTH
+        ):
+            self._train(vectors)
+        elif len(rows) < IVF_MIN_TRAIN:
+            self.centroids, self.trained_size = None, 0
+            self._assign = np.full(len(rows), -1, dtype=np.int32)
+
+        old_delta = self.delta_file
+        old_generation, self._generation = self._generation, self._generation + 1
+        np.save(self._file("vectors", self._generation), vectors)
+        np.save(self._file("assign", self._generation), self._assign)
+        if self.centroids is not None:
+            np.save(self._file("centroids", self._generation), self.centroids)
+        manifest = {
+            "dim": self.dim,
+            "generation": self._generation,
+            "trained_size": self.trained_size,
+            "meta": self.meta,
+        }
+        tmp = self.manifest_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_file)
+        self._open_generation()
+        # Readers that still map the old files keep them alive until they reopen
+        for name in ("vectors", "assign", "centroids", "codes-float16", "codes-int8", "scales-int8"):
+            try:
+                os.remove(self._file(name, old_generation))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(old_delta)
+        except FileNotFoundError:
+            pass
+
+    def _train(self, vectors: np.ndarray):
+        nlist = IVF_NLIST or max(1, int(math.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), IVF_TRAIN_SAMPLE), replace=False)]
+        self.centroids = kmeans(sample, min(nlist, len(sample)))
+        self._assign = self._nearest_centroid(vectors)
+        self.trained_size = len(vectors)
+
+    # ─── Rows ───
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    def _tail_vectors(self) -> np.ndarray:
+        if self._tail_matrix is None:
+            self._tail_matrix = np.vstack(self._tail) if self._tail else np.empty((0, self.dim), dtype=np.float32)
+        return self._tail_matrix
+
+    def _rows(self, rows: np.ndarray) -> np.ndarray:
+        base_size = len(self._base)
+        in_base = rows < base_size
+        if in_base.all():
+            return np.asarray(self._base[rows])
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._tail_vectors()[rows[~in_base] - base_size]
+        return out
+
+    def _nearest_centroid(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            assign[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ self.centroids.T, axis=1)
+        return assign
+
+    def memory_bytes(self) -> int:
+        """Bytes of vector data scored from memory (the float32 file is mapped, not loaded, when quantized)."""
+        if self._codes is None:
+            resident = self._base.nbytes
+        else:
+            resident = self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+        return resident + self._tail_vectors().nbytes
+
+    def get(self, ids: list[str]) -> list[dict[str, Any]]:
+        return [self.meta[self._row[i]] for i in ids if i in self._row and self._alive[self._row[i]]]
+
+    def upsert(self, metas: list[dict[str, Any]], vectors: np.ndarray):
+        """Add or replace rows; every meta dict must carry its `__id__`."""
+        vectors = normalize(vectors)
+        self.delete([m["__id__"] for m in metas])
+        start = len(self.ids)
+        for offset, meta in enumerate(metas):
+            self.ids.append(meta["__id__"])
+            self.meta.append(meta)
+            self._row[meta["__id__"]] = start + offset
+        self._tail.append(vectors)
+        self._tail_matrix = None
+        self._alive = np.concatenate([self._alive, np.ones(len(metas), dtype=bool)])
+        self._assign = np.concatenate([self._assign, self._nearest_centroid(vectors)])
+        self._lists = None
+
+    def delete(self, ids: list[str]):
+        for id_ in ids:
+            row = self._row.pop(id_, None)
+            if row is not None:
+                self._alive[row] = False
+                if row < self._saved_rows:
+                    self._saved_deletes.append(id_)
+
+    def alive_meta(self) -> list[dict[str, Any]]:
+        return [self.meta[r] for r in np.flatnonzero(self._alive)]
+
+    # ─── Search ───
+
+    def _inverted_lists(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assign, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(self._assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.flatnonzero(self._alive)
+        order, offsets = self._inverted_lists()
+        probes = np.argsort(self.centroids @ query)[-self.nprobe:]
+        rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+        return rows[self._alive[rows]]
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self._codes is None:
+            return self._rows(rows) @ query
+        base_size = len(self._codes)
+        in_base = rows < base_size
+        base_rows = rows[in_base]
+        base_scores = np.empty(len(base_rows), dtype=np.float32)
+        # Decode in cache-sized blocks rather than materializing a float32 copy of every candidate
+        for start in range(0, len(base_rows), 4096):
+            block = base_rows[start:start + 4096]
+            base_scores[start:start + 4096] = self._codes[block].astype(np.float32) @ query
+        if self._scales is not None:
+            base_scores *= self._scales[base_rows]
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[in_base] = base_scores
+        # The unsaved tail is small and still float32
+        scores[~in_base] = self._tail_vectors()[rows[~in_base] - base_size] @ query
+        return scores
+
+    def search(self, query: np.ndarray, top_k: int, threshold: float = -1.0) -> list[tuple[int, float]]:
+        """Return up to `top_k` (row, cosine) pairs above `threshold`, best first."""
+        query = normalize(query)
+        rows = self._candidates(query)
+        if not len(rows):
+            return []
+        scores = self._scores(rows, query)
+        if self._codes is not None and self.rerank:
+            shortlist = _top(scores, top_k * self.rerank)
+            rows = rows[shortlist]
+            scores = self._rows(rows) @ query
+        best = _top(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best if scores[i] >= threshold]
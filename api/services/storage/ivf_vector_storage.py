@@ -0,0 +1,189 @@
+"""LightRAG vector storage backed by `IVFIndex` instead of a brute-force NanoVectorDB scan.
+
+Select it with `RAG_VECTOR_STORAGE=IVFVectorDBStorage`. The manifest lives at
+`<working_dir>/vdb_<namespace>.ivf.json` with the arrays in `ivf_<namespace>/`.
+An existing `vdb_<namespace>.json` from NanoVectorDB is imported on first load.
+"""
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Any, final
+
+import numpy as np
+from lightrag.base import BaseVectorStorage
+from lightrag.utils import logger, compute_mdhash_id
+from lightrag.kg.shared_storage import get_storage_lock, get_update_flag, set_all_update_flags
+
+from .ivf_index import IVFIndex
+
+
+@final
+@dataclass
+class IVFVectorDBStorage(BaseVectorStorage):
+    def __post_init__(self):
+        self._storage_lock = None
+        self.storage_updated = None
+
+        kwargs = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        cosine_threshold = kwargs.get("cosine_better_than_threshold")
+        if cosine_threshold is None:
+            raise ValueError(
+                "cosine_better_than_threshold must be specified in vector_db_storage_cls_kwargs"
+            )
+        self.cosine_better_than_threshold = cosine_threshold
+
+        working_dir = self.global_config["working_dir"]
+        self._manifest_file = os.path.join(working_dir, f"vdb_{self.namespace}.ivf.json")
+        self._data_dir = os.path.join(working_dir, f"ivf_{self.namespace}")
+        self._nano_file = os.path.join(working_dir, f"vdb_{self.namespace}.json")
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._index = self._open_index()
+
+    def _open_index(self) -> IVFIndex:
+        index = IVFIndex(self._manifest_file, self._data_dir, self.embedding_func.embedding_dim)
+        if not os.path.exists(self._manifest_file) and os.path.exists(self._nano_file):
+            self._import_nano(index)
+        return index
+
+    def _import_nano(self, index: IVFIndex):
+        from nano_vectordb import NanoVectorDB
+
+        client = NanoVectorDB(self.embedding_func.embedding_dim, storage_file=self._nano_file)
+        storage = getattr(client, "_NanoVectorDB__storage")
+        if storage["data"]:
+            metas = [{k: v for k, v in dp.items() if k != "__vector__"} for dp in storage["data"]]
+            index.upsert(metas, storage["matrix"])
+            index.save()
+            logger.info(f"Imported {len(metas)} vectors for {self.namespace} from {self._nano_file}")
+
+    async def initialize(self):
+        """Initialize storage data"""
+        self.storage_updated = await get_update_flag(self.namespace)
+        self._storage_lock = get_storage_lock(enable_logging=False)
+
+    async def _get_index(self) -> IVFIndex:
+        """Check if the storage should be reloaded"""
+        async with self._storage_lock:
+            if self.storage_updated.value:
+                logger.info(
+                    f"Process {os.getpid()} reloading {self.namespace} due to update by another process"
+                )
+                self._index = self._open_index()
+                self.storage_updated.value = False
+            return self._index
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        logger.debug(f"Inserting {len(data)} to {self.namespace}")
+        if not data:
+            return
+
+        current_time = int(time.time())
+        metas = [
+            {
+                "__id__": k,
+                "__created_at__": current_time,
+                **{k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+            }
+            for k, v in data.items()
+        ]
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        # Execute embedding outside of lock to avoid long lock times
+        embeddings = np.concatenate(await asyncio.gather(*[self.embedding_func(batch) for batch in batches]))
+        if len(embeddings) != len(metas):
+            logger.error(f"embedding is not 1-1 with data, {len(embeddings)} != {len(metas)}")
+            return
+        index = await self._get_index()
+        index.upsert(metas, embeddings)
+
+    async def query(
+        self, query: str, top_k: int, ids: list[str] | None = None
+    ) -> list[dict[str, Any]]:
+        embedding = await self.embedding_func([query], _priority=5)  # higher priority for query
+        index = await self._get_index()
+        results = []
+        for row, score in index.search(embedding[0], top_k, self.cosine_better_than_threshold):
+            dp = index.meta[row]
+            results.append({**dp, "id": dp["__id__"], "distance": score, "created_at": dp.get("__created_at__")})
+        return results
+
+    @property
+    async def client_storage(self):
+        # Same shape as NanoVectorDB's storage, which LightRAG's delete path reads
+        index = await self._get_index()
+        return {"data": index.alive_meta()}
+
+    async def delete(self, ids: list[str]):
+        index = await self._get_index()
+        index.delete(list(ids))
+        logger.debug(f"Successfully deleted {len(ids)} vectors from {self.namespace}")
+
+    async def delete_entity(self, entity_name: str) -> None:
+        entity_id = compute_mdhash_id(entity_name, prefix="ent-")
+        logger.debug(f"Attempting to delete entity {entity_name} with ID {entity_id}")
+        await self.delete([entity_id])
+
+    async def delete_entity_relation(self, entity_name: str) -> None:
+        index = await self._get_index()
+        ids_to_delete = [
+            dp["__id__"]
+            for dp in index.alive_meta()
+            if dp.get("src_id") == entity_name or dp.get("tgt_id") == entity_name
+        ]
+        index.delete(ids_to_delete)
+        logger.debug(f"Deleted {len(ids_to_delete)} relations for {entity_name}")
+
+    async def index_done_callback(self) -> bool:
+        """Save data to disk"""
+        async with self._storage_lock:
+            if self.storage_updated.value:
+                logger.warning(
+                    f"Storage for {self.namespace} was updated by another process, reloading..."
+                )
+                self._index = self._open_index()
+                self.storage_updated.value = False
+                return False
+            try:
+                self._index.save()
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+                return True
+            except Exception as e:
+                logger.error(f"Error saving data for {self.namespace}: {e}")
+                return False
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        results = await self.get_by_ids([id])
+        return results[0] if results else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        if not ids:
+            return []
+        index = await self._get_index()
+        return [
+            {**dp, "id": dp.get("__id__"), "created_at": dp.get("__created_at__")}
+            for dp in index.get(ids)
+        ]
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            async with self._storage_lock:
+                for path in (self._manifest_file, self._nano_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+                if os.path.isdir(self._data_dir):
+                    for name in os.listdir(self._data_dir):
+                        os.remove(os.path.join(self._data_dir, name))
+                self._index = self._open_index()
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+                logger.info(f"Process {os.getpid()} drop {self.namespace}(file:{self._manifest_file})")
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            logger.error(f"Error dropping {self.namespace}: {e}")
+            return {"status": "error", "message": str(e)}
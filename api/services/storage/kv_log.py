@@ -0,0 +1,211 @@
+"""Append-only key/value log with an in-memory offset index.
+
+Every `put_many`/`delete_many` appends one line per key to the log file, of the
+form `<crc32 hex>\\t<json>\\n`. The JSON is `[key, value]` for a write and `[key]`
+for a delete. Only the key -> (offset, length) index lives in memory, and values
+are read back with `pread`. `sync()` fsyncs the appended records. On open, a
+torn or corrupt tail left by a crash is cut off at the last intact record.
+
+Overwritten and deleted records are dead bytes until compaction. Compaction
+copies the live records to a new file (off the event loop) and then replays
+whatever was appended in the meantime. Finally it atomically replaces the log.
+"""
+
+import os
+import json
+import zlib
+from typing import Any, Iterator, Optional
+
+from lightrag.utils import logger
+
+# Compact when the file is at least this large and this many times its live data
+KV_COMPACT_MIN_BYTES = int(os.getenv("KV_COMPACT_MIN_BYTES", str(16 * 2**20)))
+KV_COMPACT_RATIO = float(os.getenv("KV_COMPACT_RATIO", "2.0"))
+
+
+def encode_record(key: str, value: Any = None, deleted: bool = False) -> bytes:
+    body = json.dumps([key] if deleted else [key, value], ensure_ascii=False).encode("utf-8")
+    return b"%08x\t%s\n" % (zlib.crc32(body), body)
+
+
+def decode_record(line: bytes) -> Optional[list]:
+    """`[key]` or `[key, value]`, or None for a torn/corrupt line."""
+    if len(line) < 10 or not line.endswith(b"\n") or line[8:9] != b"\t":
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path: str):
+    """Make a rename durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class KVLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.index: dict[str, tuple[int, int]] = {}
+        self.size = 0
+        self.live_bytes = 0
+        self.dirty = False
+        self._fd: Optional[int] = None
+        self._inode = None
+        self.open(repair=True)
+
+    # ─── Files ───
+
+    def open(self, repair: bool = False):
+        self.close()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        self.index, self.size, self.live_bytes = {}, 0, 0
+        self._scan(repair)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _scan(self, repair: bool = False, end: Optional[int] = None):
+        """Index records from `self.size` to `end`, or to the end of the file."""
+        with open(self.path, "rb") as f:
+            f.seek(self.size)
+            data = f if end is None else f.read(end - self.size).splitlines(keepends=True)
+            for line in data:
+                record = decode_record(line)
+                if record is None:
+                    if repair:
+                        logger.warning(f"Truncating {self.path} at byte {self.size}: torn or corrupt record")
+                        os.truncate(self.path, self.size)
+                    # Otherwise another process may still be writing it
+                    break
+                self._index_record(record[0], self.size, len(line), len(record) == 1)
+                self.size += len(line)
+
+    def refresh(self):
+        """Pick up records appended (or a compaction done) by another process."""
+        try:
+            replaced = os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self.open()
+        else:
+            self._scan()
+
+    def _index_record(self, key: str, offset: int, length: int, deleted: bool):
+        old = self.index.pop(key, None)
+        if old is not None:
+            self.live_bytes -= old[1]
+        if not deleted:
+            self.index[key] = (offset, length)
+            self.live_bytes += length
+
+    def _append(self, records: list[tuple[str, bytes, bool]]):
+        if not records:
+            return
+        payload = b"".join(line for _, line, _ in records)
+        os.write(self._fd, payload)
+        # O_APPEND: the records landed at the current end of the file
+        offset = os.lseek(self._fd, 0, os.SEEK_CUR) - len(payload)
+        if offset > self.size:
+            # Another process appended since we last read; index its records first
+            self._scan(end=offset)
+            self.size = offset
+        for key, line, deleted in records:
+            self._index_record(key, offset, len(line), deleted)
+            offset += len(line)
+        self.size = offset
+        self.dirty = True
+
+    def sync(self) -> bool:
+        """fsync appended records; returns whether there was anything to sync."""
+        if not self.dirty:
+            return False
+        os.fsync(self._fd)
+        self.dirty = False
+        return True
+
+    # ─── Access ───
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.index))
+
+    def get(self, key: str) -> Optional[Any]:
+        location = self.index.get(key)
+        if location is None:
+            return None
+        record = decode_record(os.pread(self._fd, location[1], location[0]))
+        return record[1] if record else None
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        for key in self.keys():
+            value = self.get(key)
+            if value is not None:
+                yield key, value
+
+    def put_many(self, data: dict[str, Any]):
+        self._append([(key, encode_record(key, value), False) for key, value in data.items()])
+
+    def delete_many(self, keys) -> int:
+        present = [key for key in keys if key in self.index]
+        self._append([(key, encode_record(key, deleted=True), True) for key in present])
+        return len(present)
+
+    def clear(self):
+        self.close()
+        os.remove(self.path)
+        self.open()
+
+    # ─── Compaction ───
+
+    def compaction_due(self) -> bool:
+        return self.size >= KV_COMPACT_MIN_BYTES and self.size >= KV_COMPACT_RATIO * self.live_bytes
+
+    def write_compacted(self, snapshot: dict[str, tuple[int, int]]) -> dict[str, tuple[int, int]]:
+        """Copy the records in `snapshot` to `<path>.compact`; safe to run in a worker thread."""
+        index = {}
+        with open(self.path + ".compact", "wb") as out:
+            for key, (offset, length) in snapshot.items():
+                index[key] = (out.tell(), length)
+                out.write(os.pread(self._fd, length, offset))
+        return index
+
+    def finish_compaction(self, start: int, index: dict[str, tuple[int, int]]):
+        """Append records written since `start`, then swap the compacted file in."""
+        tmp = self.path + ".compact"
+        tail = os.pread(self._fd, self.size - start, start)
+        with open(tmp, "ab") as out:
+            position = out.tell()
+            for line in tail.splitlines(keepends=True):
+                record = decode_record(line)
+                index.pop(record[0], None)
+                if len(record) == 2:
+                    index[record[0]] = (position, len(line))
+                out.write(line)
+                position += len(line)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        _fsync_dir(os.path.dirname(self.path) or ".")
+        self.close()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        self._inode = os.fstat(self._fd).st_ino
+        self.index, self.size = index, position
+        self.live_bytes = sum(length for _, length in index.values())
+        self.dirty = False
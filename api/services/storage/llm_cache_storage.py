@@ -0,0 +1,298 @@
+"""LightRAG's LLM response cache in SQLite, bounded and indexed by model and prompt hash.
+
+LightRAG keeps the cache in its KV storage: one JSON document per mode that grows
+forever and is loaded whole. `SQLiteLLMCacheStorage` stores one row per
+`(model, mode, args_hash)` in `<working_dir>/llm_response_cache.sqlite3` instead.
+Entries are split into two namespaces with their own limits. `extract` holds the
+entity extraction calls (mode "default") and `query` holds everything else. Each
+namespace has a byte cap, enforced by evicting the least recently used rows, and
+an optional TTL. A running byte count per namespace decides when to evict, so
+queries do not pay for a scan; expired rows are swept on a timer.
+
+`build_lightrag` swaps it in for `rag.llm_response_cache`; the other KV namespaces
+keep using the configured KV storage.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, final
+
+from lightrag.base import BaseKVStorage
+from lightrag.utils import load_json, logger
+
+# Byte caps and TTLs (seconds, 0 = never expire) per namespace
+LLM_CACHE_EXTRACT_MAX_BYTES = int(os.getenv("LLM_CACHE_EXTRACT_MAX_BYTES", str(512 * 2**20)))
+LLM_CACHE_QUERY_MAX_BYTES = int(os.getenv("LLM_CACHE_QUERY_MAX_BYTES", str(64 * 2**20)))
+LLM_CACHE_EXTRACT_TTL = float(os.getenv("LLM_CACHE_EXTRACT_TTL", "0"))
+LLM_CACHE_QUERY_TTL = float(os.getenv("LLM_CACHE_QUERY_TTL", str(24 * 3600)))
+# Eviction frees space down to this fraction of the cap so it does not run on every write
+LLM_CACHE_EVICT_TO = 0.9
+# Seconds between sweeps for expired rows, which also write out recency updates
+LLM_CACHE_SWEEP_INTERVAL = float(os.getenv("LLM_CACHE_SWEEP_INTERVAL", "300"))
+# Recency updates held before they are written, whatever the sweep interval
+LLM_CACHE_MAX_TOUCHED = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    model TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    args_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (model, mode, args_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (kind, accessed_at);
+CREATE INDEX IF NOT EXISTS llm_cache_age ON llm_cache (kind, created_at);
+"""
+
+
+def cache_kind(mode: str) -> str:
+    """LightRAG caches entity extraction under mode "default" and queries under their mode."""
+    return "extract" if mode == "default" else "query"
+
+
+class _Counters:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+
+_stores: list["SQLiteLLMCacheStorage"] = []
+
+
+@final
+@dataclass
+class SQLiteLLMCacheStorage(BaseKVStorage):
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._db_file = os.path.join(working_dir, "llm_response_cache.sqlite3")
+        self._json_file = os.path.join(working_dir, f"kv_store_{self.namespace}.json")
+        self._model = self.global_config.get("llm_model_name") or "default"
+        self._limits = {
+            "extract": (LLM_CACHE_EXTRACT_MAX_BYTES, LLM_CACHE_EXTRACT_TTL),
+            "query": (LLM_CACHE_QUERY_MAX_BYTES, LLM_CACHE_QUERY_TTL),
+        }
+        self._counters = {kind: _Counters() for kind in self._limits}
+        # Recency updates for hits, written in one statement by the next sweep or eviction
+        self._touched: dict[tuple[str, str], float] = {}
+        # Misses already counted; save_to_cache looks the key up again before writing it
+        self._pending: set[tuple[str, str]] = set()
+        # Bytes per namespace; replaced rows are counted twice until the next recount
+        self._bytes = dict.fromkeys(self._limits, 0)
+        self._swept_at = 0.0
+        self._conn = None
+
+    async def initialize(self):
+        """Initialize storage data"""
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self._db_file, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        empty = self._conn.execute("SELECT 1 FROM llm_cache LIMIT 1").fetchone() is None
+        if empty and os.path.exists(self._json_file):
+            data = load_json(self._json_file) or {}
+            self._write(data)
+            logger.info(f"Imported LLM cache for {len(data)} modes from {self._json_file}")
+        self._recount()
+        self._swept_at = time.monotonic()
+        _stores.append(self)
+        logger.info(f"Process {os.getpid()} LLM cache opened {self._db_file}")
+
+    def _write(self, data: dict[str, dict[str, Any]]):
+        now = time.time()
+        rows = []
+        for mode, entries in data.items():
+            if not isinstance(entries, dict):
+                continue
+            for args_hash, entry in entries.items():
+                value = json.dumps(entry, ensure_ascii=False)
+                rows.append((self._model, mode, args_hash, cache_kind(mode), value, len(value), now, now))
+                self._pending.discard((mode, args_hash))
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        for row in rows:
+            self._bytes[row[3]] += row[5]
+
+    def _fresh_after(self, mode: str) -> float:
+        ttl = self._limits[cache_kind(mode)][1]
+        return time.time() - ttl if ttl > 0 else 0.0
+
+    async def get_by_mode_and_id(self, mode: str, id: str) -> dict[str, Any] | None:
+        """One cached response; LightRAG's cache helpers prefer this over `get_by_id(mode)`."""
+        counters = self._counters[cache_kind(mode)]
+        row = self._conn.execute(
+            "SELECT value, created_at FROM llm_cache WHERE model = ? AND mode = ? AND args_hash = ?",
+            (self._model, mode, id),
+        ).fetchone()
+        if row is not None and row[1] < self._fresh_after(mode):
+            counters.expired += 1
+            row = None
+        if row is None:
+            if (mode, id) not in self._pending:
+                counters.misses += 1
+                if len(self._pending) > 10000:
+                    self._pending.clear()
+                self._pending.add((mode, id))
+            return None
+        counters.hits += 1
+        self._touched[(mode, id)] = time.time()
+        return {id: json.loads(row[0])}
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        """A whole mode, as JsonKVStorage returns it (used by the similarity cache)."""
+        rows = self._conn.execute(
+            "SELECT args_hash, value FROM llm_cache WHERE model = ? AND mode = ? AND created_at >= ?",
+            (self._model, id, self._fresh_after(id)),
+        ).fetchall()
+        return {args_hash: json.loads(value) for args_hash, value in rows} or None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        return [await self.get_by_id(id) for id in ids]
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        rows = self._conn.execute("SELECT DISTINCT mode FROM llm_cache WHERE model = ?", (self._model,))
+        return set(keys) - {mode for (mode,) in rows}
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        logger.debug(f"Inserting {len(data)} modes to {self.namespace}")
+        self._write(data)
+
+    async def delete(self, ids: list[str]) -> None:
+        await self.drop_cache_by_modes(ids)
+
+    async def drop_cache_by_modes(self, modes: list[str] | None = None) -> bool:
+        if not modes:
+            return False
+        try:
+            with self._conn:
+                self._conn.executemany("DELETE FROM llm_cache WHERE mode = ?", [(mode,) for mode in modes])
+            self._recount()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _recount(self):
+        self._bytes = dict.fromkeys(self._limits, 0)
+        for kind, size in self._conn.execute("SELECT kind, COALESCE(SUM(bytes), 0) FROM llm_cache GROUP BY kind"):
+            if kind in self._bytes:
+                self._bytes[kind] = size
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET accessed_at = max(accessed_at, ?) WHERE model = ? AND mode = ? AND args_hash = ?",
+                [(at, self._model, mode, args_hash) for (mode, args_hash), at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _sweep(self):
+        """Write out recency updates, delete expired rows and correct the byte counts."""
+        now = time.time()
+        with self._conn:
+            self._flush_touched()
+            for kind, (_, ttl) in self._limits.items():
+                if ttl > 0:
+                    cursor = self._conn.execute(
+                        "DELETE FROM llm_cache WHERE kind = ? AND created_at < ?", (kind, now - ttl)
+                    )
+                    self._counters[kind].expired += cursor.rowcount
+        self._recount()
+        self._swept_at = time.monotonic()
+
+    def _evict(self, kind: str):
+        """Delete the least recently used rows of `kind` until it is back under its cap."""
+        max_bytes = self._limits[kind][0]
+        with self._conn:
+            self._flush_touched()
+            total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_cache WHERE kind = ?", (kind,)).fetchone()[0]
+            if total > max_bytes:
+                excess, victims = total - int(max_bytes * LLM_CACHE_EVICT_TO), []
+                for model, mode, args_hash, size in self._conn.execute(
+                    "SELECT model, mode, args_hash, bytes FROM llm_cache WHERE kind = ? ORDER BY accessed_at",
+                    (kind,),
+                ):
+                    if excess <= 0:
+                        break
+                    victims.append((model, mode, args_hash))
+                    excess -= size
+                    total -= size
+                self._conn.executemany(
+                    "DELETE FROM llm_cache WHERE model = ? AND mode = ? AND args_hash = ?", victims
+                )
+                self._counters[kind].evictions += len(victims)
+                logger.info(f"LLM cache evicted {len(victims)} {kind} entries ({max_bytes} byte cap)")
+        self._bytes[kind] = total
+
+    def _maintain(self, force: bool = False):
+        if force or len(self._touched) >= LLM_CACHE_MAX_TOUCHED or (
+            time.monotonic() - self._swept_at >= LLM_CACHE_SWEEP_INTERVAL
+        ):
+            self._sweep()
+        for kind, (max_bytes, _) in self._limits.items():
+            if self._bytes[kind] > max_bytes:
+                self._evict(kind)
+
+    async def index_done_callback(self) -> None:
+        if self._conn is not None:
+            self._maintain()
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM llm_cache")
+            self._touched.clear()
+            self._bytes = dict.fromkeys(self._limits, 0)
+            logger.info(f"Process {os.getpid()} drop {self.namespace}")
+            return {"status": "success", "message": "data dropped"}
+        except sqlite3.Error as e:
+            logger.error(f"Error dropping {self.namespace}: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def finalize(self):
+        if self._conn is None:
+            return
+        self._maintain(force=True)
+        self._conn.close()
+        self._conn = None
+        if self in _stores:
+            _stores.remove(self)
+
+    def stats(self) -> dict:
+        sizes = dict.fromkeys(self._limits, (0, 0))
+        for kind, entries, size in self._conn.execute(
+            "SELECT kind, COUNT(*), COALESCE(SUM(bytes), 0) FROM llm_cache GROUP BY kind"
+        ):
+            sizes[kind] = (entries, size)
+        result = {"file": self._db_file, "model": self._model}
+        for kind, (max_bytes, ttl) in self._limits.items():
+            counters = self._counters[kind]
+            lookups = counters.hits + counters.misses
+            result[kind] = {
+                "entries": sizes[kind][0],
+                "bytes": sizes[kind][1],
+                "max_bytes": max_bytes,
+                "ttl": ttl,
+                "hits": counters.hits,
+                "misses": counters.misses,
+                "hit_rate": counters.hits / lookups if lookups else 0.0,
+                "evictions": counters.evictions,
+                "expired": counters.expired,
+            }
+        return result
+
+
+def llm_cache_stats() -> list[dict]:
+    return [store.stats() for store in _stores]
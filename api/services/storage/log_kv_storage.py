@@ -0,0 +1,266 @@
+"""LightRAG KV and doc-status storages backed by `KVLog` instead of whole-file JSON.
+
+Select them with `RAG_KV_STORAGE=LogKVStorage` and
+`RAG_DOC_STATUS_STORAGE=LogDocStatusStorage`. Each namespace is one
+`<working_dir>/kv_store_<namespace>.log`. An existing `kv_store_<namespace>.json` is
+imported on first load. A save fsyncs only the records appended since the last
+one, and compaction runs in the background once dead records dominate the file.
+
+The LLM response cache is stored like the Mongo backend stores it: one record
+per `<mode>/<args_hash>`, so caching an answer appends one entry instead of
+rewriting that mode's whole dictionary.
+"""
+
+import os
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Optional, final
+
+from lightrag.base import BaseKVStorage, DocProcessingStatus, DocStatus, DocStatusStorage
+from lightrag.utils import load_json, logger
+from lightrag.kg.shared_storage import get_storage_lock, get_update_flag, set_all_update_flags
+
+from .kv_log import KVLog
+
+
+class _LogStorage:
+    """Lifecycle shared by the log-backed storages: open/import, reload, persist, compact."""
+
+    def _open_log(self):
+        working_dir = self.global_config["working_dir"]
+        self._log_file = os.path.join(working_dir, f"kv_store_{self.namespace}.log")
+        self._json_file = os.path.join(working_dir, f"kv_store_{self.namespace}.json")
+        self._storage_lock = None
+        self.storage_updated = None
+        self._compaction: Optional[asyncio.Task] = None
+        imported = not os.path.exists(self._log_file) and os.path.exists(self._json_file)
+        self._log = KVLog(self._log_file)
+        if imported:
+            self._log.put_many(self._flatten(load_json(self._json_file) or {}))
+            self._log.sync()
+            logger.info(f"Imported {len(self._log)} records for {self.namespace} from {self._json_file}")
+        self._loaded()
+
+    def _flatten(self, data: dict[str, Any]) -> dict[str, Any]:
+        return data
+
+    def _loaded(self):
+        """Hook for derived in-memory indexes, called after the log is (re)opened."""
+
+    async def initialize(self):
+        """Initialize storage data"""
+        self._storage_lock = get_storage_lock()
+        self.storage_updated = await get_update_flag(self.namespace)
+        logger.info(f"Process {os.getpid()} KV load {self.namespace} with {len(self._log)} records")
+
+    async def _get_log(self) -> KVLog:
+        """Check if another process appended to the log; caller holds the storage lock"""
+        if self.storage_updated.value:
+            self._log.refresh()
+            self._loaded()
+            self.storage_updated.value = False
+        return self._log
+
+    async def index_done_callback(self) -> None:
+        async with self._storage_lock:
+            if self._log.sync():
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+        if self._compaction is None and self._log.compaction_due():
+            self._compaction = asyncio.create_task(self._compact())
+
+    async def _compact(self):
+        try:
+            async with self._storage_lock:
+                start, snapshot = self._log.size, dict(self._log.index)
+            before = self._log.size
+            # The copy reads with pread and never touches the index, so writers keep going
+            index = await asyncio.to_thread(self._log.write_compacted, snapshot)
+            async with self._storage_lock:
+                self._log.finish_compaction(start, index)
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+            logger.info(f"Compacted {self.namespace}: {before} -> {self._log.size} bytes")
+        except Exception as e:
+            logger.error(f"Error compacting {self.namespace}: {e}")
+        finally:
+            self._compaction = None
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            if self._compaction is not None:
+                await self._compaction
+            async with self._storage_lock:
+                self._log.clear()
+                if os.path.exists(self._json_file):
+                    os.remove(self._json_file)
+                self._loaded()
+                await set_all_update_flags(self.namespace)
+                self.storage_updated.value = False
+            logger.info(f"Process {os.getpid()} drop {self.namespace}")
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            logger.error(f"Error dropping {self.namespace}: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def finalize(self):
+        if self._compaction is not None:
+            await self._compaction
+        await self.index_done_callback()
+        self._log.close()
+
+
+@final
+@dataclass
+class LogKVStorage(_LogStorage, BaseKVStorage):
+    def __post_init__(self):
+        # LightRAG names the response cache namespace "...llm_response_cache"
+        self._is_cache = self.namespace.endswith("cache")
+        self._open_log()
+
+    def _flatten(self, data: dict[str, Any]) -> dict[str, Any]:
+        if not self._is_cache:
+            return data
+        return {
+            f"{mode}/{args_hash}": entry
+            for mode, entries in data.items()
+            if isinstance(entries, dict)
+            for args_hash, entry in entries.items()
+        }
+
+    def _mode_keys(self, log: KVLog, mode: str) -> list[str]:
+        prefix = f"{mode}/"
+        return [key for key in log.keys() if key.startswith(prefix)]
+
+    async def get_all(self) -> dict[str, Any]:
+        async with self._storage_lock:
+            log = await self._get_log()
+            if not self._is_cache:
+                return dict(log.items())
+            result: dict[str, dict] = {}
+            for key, value in log.items():
+                mode, args_hash = key.split("/", 1)
+                result.setdefault(mode, {})[args_hash] = value
+            return result
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        async with self._storage_lock:
+            log = await self._get_log()
+            if self._is_cache:
+                # A whole mode, as JsonKVStorage returns it (used by the similarity cache)
+                entries = {key.split("/", 1)[1]: log.get(key) for key in self._mode_keys(log, id)}
+                return entries or None
+            return log.get(id)
+
+    async def get_by_mode_and_id(self, mode: str, id: str) -> dict[str, Any] | None:
+        """One cached response; LightRAG's cache helpers prefer this over `get_by_id(mode)`."""
+        async with self._storage_lock:
+            log = await self._get_log()
+            entry = log.get(f"{mode}/{id}")
+            return {id: entry} if entry is not None else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        async with self._storage_lock:
+            log = await self._get_log()
+            return [log.get(id) for id in ids]
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        async with self._storage_lock:
+            log = await self._get_log()
+            return {key for key in keys if key not in log}
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        """Appended right away; fsynced by the next index_done_callback"""
+        if not data:
+            return
+        logger.debug(f"Inserting {len(data)} records to {self.namespace}")
+        async with self._storage_lock:
+            log = await self._get_log()
+            log.put_many(self._flatten(data))
+
+    async def delete(self, ids: list[str]) -> None:
+        async with self._storage_lock:
+            log = await self._get_log()
+            log.delete_many(ids)
+
+    async def drop_cache_by_modes(self, modes: list[str] | None = None) -> bool:
+        if not modes:
+            return False
+        try:
+            async with self._storage_lock:
+                log = await self._get_log()
+                keys = [key for mode in modes for key in self._mode_keys(log, mode)] if self._is_cache else modes
+                log.delete_many(keys)
+            return True
+        except Exception:
+            return False
+
+
+@final
+@dataclass
+class LogDocStatusStorage(_LogStorage, DocStatusStorage):
+    """Document status on a KV log, with an in-memory id -> status index for counts and filters"""
+
+    def __post_init__(self):
+        self._status: dict[str, str] = {}
+        self._open_log()
+
+    def _loaded(self):
+        self._status = {key: value["status"] for key, value in self._log.items()}
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        async with self._storage_lock:
+            await self._get_log()
+            return set(keys) - set(self._status)
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        async with self._storage_lock:
+            log = await self._get_log()
+            return log.get(id)
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        async with self._storage_lock:
+            log = await self._get_log()
+            return [data for data in (log.get(id) for id in ids) if data]
+
+    async def get_status_counts(self) -> dict[str, int]:
+        counts = {status.value: 0 for status in DocStatus}
+        async with self._storage_lock:
+            await self._get_log()
+            for status in self._status.values():
+                counts[status] += 1
+        return counts
+
+    async def get_docs_by_status(self, status: DocStatus) -> dict[str, DocProcessingStatus]:
+        result = {}
+        async with self._storage_lock:
+            log = await self._get_log()
+            for key in [k for k, v in self._status.items() if v == status.value]:
+                data = log.get(key)
+                try:
+                    if "content" not in data and "content_summary" in data:
+                        data["content"] = data["content_summary"]
+                    if "file_path" not in data:
+                        data["file_path"] = "no-file-path"
+                    result[key] = DocProcessingStatus(**data)
+                except (KeyError, TypeError) as e:
+                    logger.error(f"Missing required field for document {key}: {e}")
+        return result
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        logger.debug(f"Inserting {len(data)} records to {self.namespace}")
+        async with self._storage_lock:
+            log = await self._get_log()
+            log.put_many(data)
+            self._status.update((key, value["status"]) for key, value in data.items())
+        # Status changes are persisted immediately, as JsonDocStatusStorage does
+        await self.index_done_callback()
+
+    async def delete(self, doc_ids: list[str]) -> None:
+        async with self._storage_lock:
+            log = await self._get_log()
+            log.delete_many(doc_ids)
+            for doc_id in doc_ids:
+                self._status.pop(doc_id, None)
@@ -0,0 +1,22 @@
+"""Registers this service's own storage backends with LightRAG.
+
+LightRAG resolves `vector_storage=` (and the other storage kwargs) by name through
+the tables in `lightrag.kg`; importing this module adds our implementations there
+so they can be selected like the built-in ones.
+"""
+
+from lightrag import kg
+
+
+def register_storage(storage_type: str, name: str, module: str, env: tuple[str, ...] = ()):
+    kg.STORAGES[name] = module
+    implementations = kg.STORAGE_IMPLEMENTATIONS[storage_type]["implementations"]
+    if name not in implementations:
+        implementations.append(name)
+    kg.STORAGE_ENV_REQUIREMENTS[name] = list(env)
+
+
+register_storage("VECTOR_STORAGE", "IVFVectorDBStorage", f"{__package__}.ivf_vector_storage")
+register_storage("GRAPH_STORAGE", "CSRGraphStorage", f"{__package__}.csr_graph_storage")
+register_storage("KV_STORAGE", "LogKVStorage", f"{__package__}.log_kv_storage")
+register_storage("DOC_STATUS_STORAGE", "LogDocStatusStorage", f"{__package__}.log_kv_storage")
@@ -0,0 +1,126 @@
+"""CSRGraph: overlay and log replay, compaction into snapshot generations, torn log tails."""
+
+import os
+
+from services.storage.csr_graph import CSRGraph
+
+
+def open_graph(tmp_path) -> CSRGraph:
+    return CSRGraph(str(tmp_path / "graph_test.csr.json"), str(tmp_path / "csr_test"))
+
+
+def build(graph: CSRGraph):
+    graph.upsert_node("a", {"type": "person"})
+    graph.upsert_node("b", {"type": "place"})
+    graph.upsert_edge("a", "b", {"weight": 1.0})
+    graph.upsert_edge("b", "c", {"weight": 2.0})
+    graph.upsert_edge("a", "a", {"weight": 3.0})
+
+
+def assert_built(graph: CSRGraph):
+    assert sorted(graph.nodes()) == ["a", "b", "c"]
+    assert graph.get_node("a") == {"type": "person"}
+    assert graph.get_node("c") == {}
+    assert graph.get_edge("b", "a") == {"weight": 1.0}
+    assert sorted(graph.neighbors("b")) == ["a", "c"]
+    # The self-loop counts twice
+    assert graph.degree("a") == 3
+
+
+def test_log_replay_restores_the_graph(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    reopened = open_graph(tmp_path)
+    assert reopened.generation == 0
+    assert reopened.log_ops == 5
+    assert_built(reopened)
+
+
+def test_unflushed_changes_are_not_persisted(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    graph.upsert_node("d", {})
+    assert not open_graph(tmp_path).has_node("d")
+
+
+def test_compaction_writes_a_new_generation_and_drops_the_old_log(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    old_log = graph.log_file
+    graph.compact()
+    assert graph.generation == 1
+    assert graph.log_ops == 0
+    assert not os.path.exists(old_log)
+    assert_built(graph)
+    assert_built(open_graph(tmp_path))
+
+
+def test_changes_after_compaction_overlay_the_snapshot(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.compact()
+    graph.delete_edge("a", "b")
+    graph.delete_node("c")
+    graph.upsert_node("a", {"name": "Ada"})
+    graph.upsert_edge("a", "d", {"weight": 4.0})
+    graph.flush()
+
+    reopened = open_graph(tmp_path)
+    assert reopened.generation == 1
+    assert sorted(reopened.nodes()) == ["a", "b", "d"]
+    assert reopened.get_node("a") == {"type": "person", "name": "Ada"}
+    assert not reopened.has_edge("a", "b")
+    assert reopened.neighbors("b") == []
+    assert sorted(reopened.neighbors("a")) == ["a", "d"]
+
+    reopened.compact()
+    assert sorted(open_graph(tmp_path).nodes()) == ["a", "b", "d"]
+
+
+def test_torn_log_tail_is_truncated_on_open(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    size = os.path.getsize(graph.log_file)
+    with open(graph.log_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "node", "id": "torn", "da')
+
+    reopened = open_graph(tmp_path)
+    assert os.path.getsize(reopened.log_file) == size
+    assert_built(reopened)
+    # Appends after the repair are read back
+    reopened.upsert_node("d", {"type": "late"})
+    reopened.flush()
+    again = open_graph(tmp_path)
+    assert again.get_node("d") == {"type": "late"}
+    assert not again.has_node("torn")
+
+
+def test_record_missing_its_newline_counts_as_torn(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    with open(graph.log_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "node", "id": "torn", "data": {}}')
+
+    reopened = open_graph(tmp_path)
+    assert not reopened.has_node("torn")
+    reopened.upsert_node("d", {})
+    reopened.flush()
+    assert open_graph(tmp_path).has_node("d")
+
+
+def test_reload_without_repair_leaves_the_log_alone(tmp_path):
+    graph = open_graph(tmp_path)
+    build(graph)
+    graph.flush()
+    with open(graph.log_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "node", "id": "in-progress"')
+    size = os.path.getsize(graph.log_file)
+    # Another process may still be appending this record
+    graph.load()
+    assert os.path.getsize(graph.log_file) == size
+    assert_built(graph)
@@ -0,0 +1,139 @@
+"""EmbeddingCache: reopening, crash repair, legacy indexes and processes sharing one directory."""
+
+import os
+import zlib
+import asyncio
+import multiprocessing
+
+import numpy as np
+from lightrag.utils import EmbeddingFunc
+
+from services.embedding_cache import _LINE_LEN, EmbeddingCache, cached_embedding_func, content_key
+
+DIM = 4
+
+
+def vector(i: int) -> np.ndarray:
+    return np.full(DIM, i + 1, dtype=np.float32)
+
+
+def key(i: int) -> str:
+    return f"{i:032x}"
+
+
+def fill(cache: EmbeddingCache, ids):
+    ids = list(ids)
+    cache.add([key(i) for i in ids], np.stack([vector(i) for i in ids]))
+
+
+def assert_cached(cache: EmbeddingCache, ids):
+    for i in ids:
+        assert cache.get(key(i)) is not None, i
+        assert (cache.get(key(i)) == vector(i)).all(), i
+
+
+def test_rows_survive_reopening(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM)
+    fill(cache, range(5))
+    cache.close()
+    reopened = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert reopened.stats()["entries"] == 5
+    assert_cached(reopened, range(5))
+
+
+def test_index_lines_without_their_rows_are_cut_on_open(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM)
+    fill(cache, range(5))
+    cache.close()
+    # Lines whose vectors never reached the disk: the rows are still zero padding
+    with open(cache.index_file, "ab") as f:
+        for i in (5, 6):
+            f.write(key(i).encode() + b" %08x\n" % zlib.crc32(vector(i).tobytes()))
+        f.write(key(7).encode()[:10])
+
+    reopened = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert reopened.stats()["entries"] == 5
+    assert reopened.get(key(5)) is None
+    assert os.path.getsize(reopened.index_file) == 5 * _LINE_LEN
+    fill(reopened, [8])
+    reopened.close()
+    assert_cached(EmbeddingCache(str(tmp_path), "model", DIM), [0, 4, 8])
+
+
+def test_legacy_index_is_converted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIM)
+    fill(cache, range(3))
+    cache.close()
+    os.remove(cache.index_file)
+    legacy = os.path.join(str(tmp_path), f"model-{DIM}.idx")
+    with open(legacy, "wb") as f:
+        f.write(b"".join(key(i).encode() + b"\n" for i in range(3)))
+
+    converted = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert not os.path.exists(legacy)
+    assert_cached(converted, range(3))
+
+
+def test_instances_sharing_a_directory_do_not_overwrite_each_other(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model", DIM)
+    second = EmbeddingCache(str(tmp_path), "model", DIM)
+    fill(first, range(3))
+    # `second` has not seen those rows; its own go after them
+    fill(second, range(3, 6))
+    assert_cached(second, range(6))
+    fill(first, range(6, 8))
+    assert_cached(first, range(8))
+    # A key the other instance already cached is not written again
+    fill(second, [0])
+    assert os.path.getsize(second.index_file) == 8 * _LINE_LEN
+
+
+def test_growing_never_shrinks_a_file_another_instance_grew(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model", DIM)
+    second = EmbeddingCache(str(tmp_path), "model", DIM)
+    fill(first, [0])
+    fill(second, range(1, 3000))
+    size = os.path.getsize(second.vectors_file)
+    fill(first, [3000])
+    assert os.path.getsize(first.vectors_file) >= size
+    assert_cached(EmbeddingCache(str(tmp_path), "model", DIM), range(3001))
+
+
+def _writer(directory: str, worker: int):
+    cache = EmbeddingCache(directory, "model", DIM)
+    for batch in range(20):
+        fill(cache, range(worker * 1000 + batch * 10, worker * 1000 + batch * 10 + 10))
+    cache.close()
+
+
+def test_concurrent_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_writer, args=(str(tmp_path), w)) for w in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+    cache = EmbeddingCache(str(tmp_path), "model", DIM)
+    assert cache.stats()["entries"] == 800
+    assert_cached(cache, [w * 1000 + i for w in range(4) for i in range(200)])
+
+
+def test_cached_embedding_func_only_embeds_misses(tmp_path):
+    calls = []
+
+    async def embed(texts):
+        calls.append(list(texts))
+        return np.stack([np.full(DIM, len(t), dtype=np.float32) for t in texts])
+
+    func = cached_embedding_func(EmbeddingFunc(embedding_dim=DIM, max_token_size=8192, func=embed), "m", str(tmp_path))
+
+    async def main():
+        first = await func(["a", "bb"])
+        second = await func(["bb", "ccc"])
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert second[0][0] == 2 and second[1][0] == 3
+    assert content_key("m", "bb") != content_key("other", "bb")
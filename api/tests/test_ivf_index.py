@@ -0,0 +1,163 @@
+"""IVFIndex: delta-log saves, replay on load, torn deltas, compaction and clustering."""
+
+import os
+
+import numpy as np
+import pytest
+
+from services.storage import ivf_index
+from services.storage.ivf_index import IVFIndex
+
+DIM = 8
+
+
+def open_index(tmp_path) -> IVFIndex:
+    return IVFIndex(str(tmp_path / "vdb_test.ivf.json"), str(tmp_path / "ivf_test"), DIM)
+
+
+def vectors(ids) -> np.ndarray:
+    rng = np.random.default_rng(list(ids))
+    return rng.normal(size=(len(ids), DIM)).astype(np.float32)
+
+
+def add(index: IVFIndex, ids):
+    ids = list(ids)
+    index.upsert([{"__id__": f"v{i}", "n": i} for i in ids], np.concatenate([vectors([i]) for i in ids]))
+
+
+def nearest(index: IVFIndex, i: int) -> str:
+    row, _ = index.search(vectors([i])[0], 1)[0]
+    return index.meta[row]["__id__"]
+
+
+def live_ids(index: IVFIndex) -> list[str]:
+    return sorted(m["__id__"] for m in index.alive_meta())
+
+
+@pytest.fixture
+def small_compaction(monkeypatch):
+    monkeypatch.setattr(ivf_index, "IVF_COMPACT_MIN_RECORDS", 10)
+
+
+def test_first_save_writes_a_generation(tmp_path):
+    index = open_index(tmp_path)
+    add(index, range(20))
+    index.save()
+    assert index._generation == 1
+    assert not os.path.exists(index.delta_file)
+    reopened = open_index(tmp_path)
+    assert len(reopened) == 20
+    assert nearest(reopened, 7) == "v7"
+
+
+def test_later_saves_append_to_the_delta_log(tmp_path):
+    index = open_index(tmp_path)
+    add(index, range(20))
+    index.save()
+    with open(index.manifest_file, "rb") as f:
+        manifest = f.read()
+
+    add(index, range(20, 23))
+    index.delete(["v3"])
+    index.save()
+    assert index._generation == 1
+    assert index.delta_records == 4
+    # The base and its manifest are not rewritten
+    with open(index.manifest_file, "rb") as f:
+        assert f.read() == manifest
+
+    reopened = open_index(tmp_path)
+    assert len(reopened) == 22
+    assert reopened.delta_records == 4
+    assert "v3" not in live_ids(reopened)
+    assert nearest(reopened, 21) == "v21"
+    assert reopened.get(["v22"]) == [{"__id__": "v22", "n": 22}]
+
+
+def test_replaced_and_deleted_rows_replay_in_order(tmp_path):
+    index = open_index(tmp_path)
+    add(index, range(5))
+    index.save()
+    # Replace a saved row, then add and drop a row that never reaches the disk
+    index.upsert([{"__id__": "v1", "n": 100}], vectors([100]))
+    add(index, [6])
+    index.delete(["v6", "v2"])
+    index.save()
+    index.upsert([{"__id__": "v1", "n": 101}], vectors([101]))
+    index.save()
+
+    reopened = open_index(tmp_path)
+    assert live_ids(reopened) == ["v0", "v1", "v3", "v4"]
+    assert reopened.get(["v1"]) == [{"__id__": "v1", "n": 101}]
+    assert nearest(reopened, 101) == "v1"
+
+
+def test_torn_delta_tail_is_truncated_on_open(tmp_path):
+    index = open_index(tmp_path)
+    add(index, range(5))
+    index.save()
+    add(index, [5])
+    index.save()
+    size = os.path.getsize(index.delta_file)
+    with open(index.delta_file, "a", encoding="utf-8") as f:
+        f.write('{"add": {"__id__": "torn"}, "vector": "AAAA')
+
+    reopened = open_index(tmp_path)
+    assert os.path.getsize(reopened.delta_file) == size
+    assert live_ids(reopened) == [f"v{i}" for i in range(6)]
+    add(reopened, [6])
+    reopened.save()
+    assert "v6" in live_ids(open_index(tmp_path))
+
+
+def test_delta_is_compacted_into_a_new_generation(tmp_path, small_compaction):
+    index = open_index(tmp_path)
+    add(index, range(20))
+    index.save()
+    add(index, range(20, 25))
+    index.save()
+    assert index._generation == 1
+    old_delta = index.delta_file
+    add(index, range(25, 30))
+    index.delete(["v0"])
+    index.save()
+    assert index._generation == 2
+    assert index.delta_records == 0
+    assert not os.path.exists(old_delta)
+
+    reopened = open_index(tmp_path)
+    assert len(reopened._base) == 29
+    assert live_ids(reopened) == sorted(f"v{i}" for i in range(1, 30))
+
+
+def test_growth_past_the_training_size_recompacts_with_clusters(tmp_path, monkeypatch):
+    monkeypatch.setattr(ivf_index, "IVF_MIN_TRAIN", 50)
+    index = open_index(tmp_path)
+    add(index, range(40))
+    index.save()
+    assert index.centroids is None
+    add(index, range(40, 60))
+    index.save()
+    assert index._generation == 2
+    assert index.trained_size == 60
+    # Rows saved to the delta are assigned to the existing clusters
+    add(index, range(60, 62))
+    index.save()
+    reopened = open_index(tmp_path)
+    assert reopened.centroids is not None
+    reopened.nprobe = len(reopened.centroids)
+    assert nearest(reopened, 61) == "v61"
+    assert nearest(reopened, 10) == "v10"
+
+
+def test_quantized_index_scores_delta_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(ivf_index, "IVF_QUANTIZATION", "int8")
+    index = open_index(tmp_path)
+    add(index, range(30))
+    index.save()
+    add(index, range(30, 33))
+    index.save()
+    reopened = open_index(tmp_path)
+    assert reopened._codes is not None and len(reopened._codes) == 30
+    assert nearest(reopened, 32) == "v32"
+    assert nearest(reopened, 4) == "v4"
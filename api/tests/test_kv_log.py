@@ -0,0 +1,98 @@
+"""KVLog: reopening, torn tails, processes sharing one log, and compaction."""
+
+import os
+
+from services.storage.kv_log import KVLog, encode_record
+
+
+def open_log(tmp_path) -> KVLog:
+    return KVLog(str(tmp_path / "kv_store_test.log"))
+
+
+def test_records_survive_reopening(tmp_path):
+    log = open_log(tmp_path)
+    log.put_many({"a": {"n": 1}, "b": {"n": 2}})
+    log.put_many({"a": {"n": 3}})
+    log.delete_many(["b", "missing"])
+    log.sync()
+    reopened = open_log(tmp_path)
+    assert sorted(reopened.keys()) == ["a"]
+    assert reopened.get("a") == {"n": 3}
+    assert reopened.get("b") is None
+    assert reopened.live_bytes == len(encode_record("a", {"n": 3}))
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    log = open_log(tmp_path)
+    log.put_many({"a": 1, "b": 2})
+    size = log.size
+    log.close()
+    with open(log.path, "ab") as f:
+        f.write(encode_record("c", 3)[:-4])
+
+    reopened = open_log(tmp_path)
+    assert os.path.getsize(reopened.path) == size
+    assert "c" not in reopened
+    reopened.put_many({"d": 4})
+    assert open_log(tmp_path).get("d") == 4
+
+
+def test_corrupt_record_is_truncated_on_open(tmp_path):
+    log = open_log(tmp_path)
+    log.put_many({"a": 1})
+    log.close()
+    with open(log.path, "ab") as f:
+        f.write(encode_record("b", 2).replace(b"2", b"3"))
+    reopened = open_log(tmp_path)
+    assert "b" not in reopened
+    assert os.path.getsize(reopened.path) == reopened.size
+
+
+def test_refresh_picks_up_another_instances_records(tmp_path):
+    first, second = open_log(tmp_path), open_log(tmp_path)
+    first.put_many({"a": 1})
+    second.refresh()
+    assert second.get("a") == 1
+
+
+def test_append_indexes_records_another_instance_wrote_first(tmp_path):
+    first, second = open_log(tmp_path), open_log(tmp_path)
+    first.put_many({"a": 1})
+    # `second` has not refreshed; its write lands after `first`'s record
+    second.put_many({"b": 2})
+    second.refresh()
+    assert second.get("a") == 1
+    assert second.get("b") == 2
+    first.refresh()
+    assert sorted(first.keys()) == ["a", "b"]
+    assert first.size == second.size == os.path.getsize(first.path)
+
+
+def test_compaction_drops_dead_records_and_keeps_concurrent_writes(tmp_path):
+    log = open_log(tmp_path)
+    for i in range(10):
+        log.put_many({"a": i, "b": i})
+    log.delete_many(["b"])
+    start, snapshot = log.size, dict(log.index)
+    index = log.write_compacted(snapshot)
+    # Written while the copy ran
+    log.put_many({"c": 3})
+    log.delete_many(["a"])
+    log.finish_compaction(start, index)
+
+    assert sorted(log.keys()) == ["c"]
+    assert log.get("c") == 3
+    assert log.size == os.path.getsize(log.path)
+    reopened = open_log(tmp_path)
+    assert sorted(reopened.keys()) == ["c"]
+    assert reopened.live_bytes == log.live_bytes
+
+
+def test_refresh_after_another_instance_compacted(tmp_path):
+    first, second = open_log(tmp_path), open_log(tmp_path)
+    first.put_many({"a": 1})
+    first.put_many({"a": 2})
+    first.finish_compaction(first.size, first.write_compacted(dict(first.index)))
+    second.refresh()
+    assert second.get("a") == 2
+    assert second.size == os.path.getsize(second.path)
@@ -0,0 +1,299 @@
+"""LLMRouter against stand-in OpenAI-compatible backends served by aiohttp.
+
+Each backend answers `POST /chat/completions` after a configurable delay, or
+with a configurable error status, and counts the requests it received and the
+most it had in flight at once. Requests go out through httpx, as the OpenAI
+client sends them, so failures surface as `httpx.HTTPStatusError`.
+"""
+
+import time
+import asyncio
+
+import httpx
+import openai
+import pytest
+import tenacity
+from aiohttp import web
+
+from services import llm_router
+from services.llm_router import LLMRouter
+
+
+class StandIn:
+    def __init__(self, delay: float = 0.0, status: int = 200):
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+        self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.status != 200:
+                return web.json_response({"error": "unavailable"}, status=self.status)
+            return web.json_response({"choices": [{"message": {"content": self.url}}]})
+        finally:
+            self.in_flight -= 1
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/chat/completions", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def run(scenario, *backends: StandIn):
+    """Start the backends, run `scenario(client)`, and shut everything down."""
+
+    async def main():
+        for backend in backends:
+            await backend.start()
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                return await scenario(client)
+        finally:
+            for backend in backends:
+                await backend.stop()
+
+    return asyncio.run(main())
+
+
+def completion(client: httpx.AsyncClient):
+    async def send(base_url: str) -> str:
+        response = await client.post(f"{base_url}/chat/completions", json={"messages": []})
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    return send
+
+
+@pytest.fixture
+def ejection(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_EJECT_AFTER", 2)
+    monkeypatch.setattr(llm_router, "LLM_EJECT_SECONDS", 0.3)
+
+
+def test_least_outstanding_spreads_concurrent_requests():
+    a, b = StandIn(delay=0.2), StandIn(delay=0.2)
+
+    async def scenario(client):
+        router = LLMRouter([a.url, b.url])
+        return await asyncio.gather(*(router.call(completion(client)) for _ in range(6)))
+
+    answers = run(scenario, a, b)
+    assert sorted(answers) == sorted([a.url] * 3 + [b.url] * 3)
+    assert a.max_in_flight == b.max_in_flight == 3
+
+
+def test_least_outstanding_prefers_idle_backend_over_busy_one():
+    slow, fast = StandIn(delay=0.5), StandIn(delay=0.0)
+
+    async def scenario(client):
+        router = LLMRouter([slow.url, fast.url])
+        busy = asyncio.create_task(router.call(completion(client)))
+        await asyncio.sleep(0.05)
+        # The slow backend still holds the first request, so these go to the idle one
+        answers = [await router.call(completion(client)) for _ in range(3)]
+        return await busy, answers
+
+    first, answers = run(scenario, slow, fast)
+    assert first == slow.url
+    assert answers == [fast.url] * 3
+    assert slow.requests == 1
+
+
+def test_failing_backend_fails_over_and_is_ejected(ejection):
+    broken, healthy = StandIn(status=503), StandIn()
+
+    async def scenario(client):
+        router = LLMRouter([broken.url, healthy.url])
+        answers = [await router.call(completion(client)) for _ in range(5)]
+        return router, answers
+
+    router, answers = run(scenario, broken, healthy)
+    assert answers == [healthy.url] * 5
+    # Both failures fail over; after the second the backend is ejected and skipped
+    assert broken.requests == 2
+    assert router.failovers == 2
+    assert router.stats()["backends"][0]["ejected"]
+
+
+def test_ejected_backend_recovers_after_ejection_period(ejection):
+    broken, healthy = StandIn(status=500), StandIn(delay=0.05)
+
+    async def scenario(client):
+        router = LLMRouter([broken.url, healthy.url])
+        for _ in range(3):
+            await router.call(completion(client))
+        assert router.stats()["backends"][0]["ejected"]
+        broken.status = 200
+        await asyncio.sleep(llm_router.LLM_EJECT_SECONDS + 0.05)
+        return router, await router.call(completion(client))
+
+    router, answer = run(scenario, broken, healthy)
+    assert answer == broken.url
+    backend = router.backends[0]
+    assert not router.stats()["backends"][0]["ejected"]
+    assert backend.consecutive_failures == 0
+
+
+def test_client_errors_are_not_failed_over(ejection):
+    rejecting, healthy = StandIn(status=400), StandIn()
+
+    async def scenario(client):
+        router = LLMRouter([rejecting.url, healthy.url])
+        with pytest.raises(httpx.HTTPStatusError):
+            await router.call(completion(client))
+        return router
+
+    router = run(scenario, rejecting, healthy)
+    assert healthy.requests == 0
+    assert router.failovers == 0
+    assert router.backends[0].consecutive_failures == 0
+
+
+def test_slow_request_is_hedged_on_another_backend():
+    slow, fast = StandIn(delay=2.0), StandIn(delay=0.05)
+
+    async def scenario(client):
+        router = LLMRouter([slow.url, fast.url], hedge_after=0.1)
+        started = time.monotonic()
+        answer = await router.call(completion(client))
+        return router, answer, time.monotonic() - started
+
+    router, answer, elapsed = run(scenario, slow, fast)
+    assert answer == fast.url
+    assert elapsed < 1.0
+    assert slow.requests == fast.requests == 1
+    assert router.hedged == 1
+    assert router.hedge_wins == 1
+
+
+def test_fast_request_is_not_hedged():
+    first, second = StandIn(delay=0.02), StandIn(delay=0.02)
+
+    async def scenario(client):
+        router = LLMRouter([first.url, second.url], hedge_after=0.5)
+        return router, await router.call(completion(client))
+
+    router, answer = run(scenario, first, second)
+    assert answer == first.url
+    assert second.requests == 0
+    assert router.hedged == 0
+
+
+def test_losing_hedge_result_is_discarded():
+    a, b = StandIn(delay=0.2), StandIn(delay=0.2)
+    discarded = []
+
+    async def discard(result):
+        discarded.append(result)
+
+    async def scenario(client):
+        router = LLMRouter([a.url, b.url], hedge_after=0.05)
+        send, answered, gate = completion(client), [], asyncio.Event()
+
+        async def gated(base_url):
+            # Hold each answer until both backends replied, so both attempts finish together
+            result = await send(base_url)
+            answered.append(result)
+            if len(answered) == 2:
+                gate.set()
+            await gate.wait()
+            return result
+
+        return router, await router.call(gated, discard)
+
+    router, answer = run(scenario, a, b)
+    assert router.hedged == 1
+    assert len(discarded) == 1
+    assert {answer, *discarded} == {a.url, b.url}
+
+
+def test_duplicate_hosts_are_one_backend(monkeypatch):
+    broken = StandIn(status=503)
+    monkeypatch.setenv("LLM_BINDING_HOSTS", "http://a, http://b,http://a")
+    assert llm_router.hosts_from_env("LLM_BINDING_HOSTS", "LLM_BINDING_HOST") == ["http://a", "http://b"]
+
+    async def scenario(client):
+        router = LLMRouter([broken.url, broken.url])
+        with pytest.raises(httpx.HTTPStatusError):
+            await router.call(completion(client))
+        return router
+
+    router = run(scenario, broken)
+    assert len(router.backends) == 1
+    assert broken.requests == 1
+    assert router.failovers == 0
+
+
+def test_local_errors_are_not_failed_over(ejection):
+    a, b = StandIn(), StandIn()
+
+    async def scenario(client):
+        router = LLMRouter([a.url, b.url])
+        send = completion(client)
+
+        async def parse(base_url):
+            answer = await send(base_url)
+            return {}["missing"] if answer else answer
+
+        for _ in range(3):
+            with pytest.raises(KeyError):
+                await router.call(parse)
+        return router
+
+    router = run(scenario, a, b)
+    assert router.failovers == 0
+    assert all(backend.failures == 0 for backend in router.backends)
+    assert not any(backend["ejected"] for backend in router.stats()["backends"])
+
+
+def test_unreachable_backend_fails_over(ejection):
+    gone, healthy = StandIn(), StandIn()
+
+    async def scenario(client):
+        await gone.stop()
+        router = LLMRouter([gone.url, healthy.url])
+        return router, await router.call(completion(client))
+
+    async def main():
+        await gone.start()
+        await healthy.start()
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                return await scenario(client)
+        finally:
+            await healthy.stop()
+
+    router, answer = asyncio.run(main())
+    assert answer == healthy.url
+    assert router.failovers == 1
+    assert router.backends[0].failures == 1
+
+
+def test_retry_wrapped_connection_error_counts_as_backend_failure():
+    request = httpx.Request("POST", "http://backend/chat/completions")
+
+    @tenacity.retry(stop=tenacity.stop_after_attempt(1))
+    async def send():
+        raise openai.APIConnectionError(request=request)
+
+    with pytest.raises(tenacity.RetryError) as wrapped:
+        asyncio.run(send())
+    assert llm_router._is_backend_failure(wrapped.value)
+    assert llm_router._is_backend_failure(asyncio.TimeoutError())
+    assert not llm_router._is_backend_failure(ValueError("bad json"))
@@ -1,53 +1,455 @@
+"""Bulk-ingest documentation into the LightRAG working directory.
+
+The source (a URL, a local file or a directory of text/markdown files) is read
+as a stream and pushed through bounded queues:
+
+    read -> split (markdown sections) -> embed (chunks) -> extract/merge (graph)
+
+Every stage has its own worker count. Each section is one document, identified
+by its source and heading, and is ingested incrementally (see
+api/services/incremental_ingest.py): after the docs change, only new or edited
+chunks are embedded and extracted, and sections that disappeared are removed.
+A checkpoint file records the content hash of finished sections, so an
+interrupted run picks up where it stopped. Stage throughput and queue depths
+are printed while the run progresses.
+"""
+
 import os
+import sys
+import json
+import re
+import time
 import asyncio
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
 from lightrag import LightRAG
-from lightrag.llm.openai import gpt_4o_mini_complete, openai_embed
-from lightrag.kg.shared_storage import initialize_pipeline_status
+from lightrag.kg.shared_storage import get_namespace_data, get_pipeline_status_lock, initialize_pipeline_status
+from lightrag.utils import compute_mdhash_id
 import dotenv
 import httpx
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from services.incremental_ingest import (  # noqa: E402
+    ChunkDiff, apply_chunks, delete_document, diff_document, extract_chunks, index_storages, persist, record,
+)
+from services.adaptive_limiter import limiter_stats  # noqa: E402
+from services.embedding_cache import close_embedding_caches, embedding_cache_stats  # noqa: E402
+from services.rag_manager import build_lightrag  # noqa: E402
+
 # Load environment variables from .env file
 dotenv.load_dotenv()
 
 WORKING_DIR = "./pydantic-docs"
 
-if not os.path.exists(WORKING_DIR):
-    os.mkdir(WORKING_DIR)
-
 # URL of the Pydantic AI documentation
 PYDANTIC_DOCS_URL = "https://ai.pydantic.dev/llms.txt"
 
-def fetch_pydantic_docs() -> str:
-    """Fetch the Pydantic AI documentation from the URL.
-    
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+TEXT_EXTENSIONS = (".txt", ".md", ".mdx", ".rst")
+# Sections shorter than this are merged into the following one
+MIN_SECTION_CHARS = 1000
+READ_BLOCK_CHARS = 64 * 1024
+# ATX headings only; `#` lines inside code fences are comments, not headings
+HEADING = re.compile(r" {0,3}(#{1,6})(?:[ \t]+|$)")
+FENCE = re.compile(r" {0,3}(`{3,}|~{3,})")
+
+
+@dataclass
+class Section:
+    source: str
+    # Source and heading, numbered when a heading repeats within the source
+    file_path: str
+    content: str
+    diff: Optional[ChunkDiff] = None
+
+    @property
+    def doc_id(self) -> str:
+        return compute_mdhash_id(self.file_path, prefix="doc-")
+
+    @property
+    def content_hash(self) -> str:
+        return compute_mdhash_id(self.content)
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items_in: int = 0
+    items_out: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    queue: Optional[asyncio.Queue] = None
+
+    def totals(self) -> dict:
+        return {
+            "name": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def line(self, elapsed: float) -> str:
+        depth = f"{self.queue.qsize()}/{self.queue.maxsize}" if self.queue is not None else "-"
+        rate = self.items_out / elapsed if elapsed else 0.0
+        return (
+            f"{self.name:<8} in={self.items_in:<6} out={self.items_out:<6} failed={self.failed:<4} "
+            f"{rate:7.2f}/s  busy={self.busy_seconds:7.1f}s  queue={depth}"
+        )
+
+
+# ─── Read ───
+
+async def read_source(source: str) -> AsyncIterator[tuple[str, str]]:
+    """Yield `(source name, text block)` pairs from a URL, a file or a directory.
+
+    Args:
+        source: http(s) URL, path to a text file, or a directory searched recursively
+
     Returns:
-        The content of the documentation
+        An async iterator of text blocks. Blocks of one source arrive in order,
+        followed by an empty block that makes the splitter flush its last section.
     """
-    try:
-        response = httpx.get(PYDANTIC_DOCS_URL)
-        response.raise_for_status()
-        return response.text
-    except Exception as e:
-        raise Exception(f"Error fetching Pydantic AI documentation: {e}")
+    if source.startswith(("http://", "https://")):
+        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=120.0)) as client:
+            async with client.stream("GET", source) as response:
+                response.raise_for_status()
+                async for text in response.aiter_text():
+                    yield source, text
+        yield source, ""
+        return
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if name.endswith(TEXT_EXTENSIONS)
+        )
+    else:
+        paths = [source]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            while text := await asyncio.to_thread(f.read, READ_BLOCK_CHARS):
+                yield path, text
+        yield path, ""
+
+
+# ─── Split ───
+
+class SectionSplitter:
+    """Cut a stream of text into markdown sections, one LightRAG document each."""
+
+    def __init__(self):
+        self.source: Optional[str] = None
+        self._pending = ""
+        self._lines: list[str] = []
+        self._title = ""
+        self._seen: dict[str, int] = {}
+        # Marker of the open code fence, if any
+        self._fence: Optional[str] = None
+
+    def feed(self, source: str, text: str) -> list[Section]:
+        sections = []
+        if source != self.source:
+            sections += self.flush()
+            self.source = source
+            self._seen = {}
+            self._fence = None
+        if not text:
+            return sections + self.flush()
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            heading = self._heading(line)
+            if heading is not None and sum(len(l) + 1 for l in self._lines) >= MIN_SECTION_CHARS:
+                sections += self._emit()
+            if heading is not None and not self._lines:
+                self._title = heading
+            self._lines.append(line)
+        return sections
+
+    def _heading(self, line: str) -> Optional[str]:
+        """The heading text if `line` is an ATX heading outside a code fence."""
+        fence = FENCE.match(line)
+        if fence:
+            marker = fence.group(1)
+            if self._fence is None:
+                self._fence = marker
+            elif marker[0] == self._fence[0] and len(marker) >= len(self._fence) and not line[fence.end():].strip():
+                self._fence = None
+            return None
+        if self._fence is not None or not HEADING.match(line):
+            return None
+        return re.sub(r"[ \t]+#+[ \t]*$", "", line.strip().lstrip("#")).strip()
+
+    def flush(self) -> list[Section]:
+        if self._pending:
+            self._lines.append(self._pending)
+            self._pending = ""
+        return self._emit()
 
+    def _emit(self) -> list[Section]:
+        content = "\n".join(self._lines).strip()
+        self._lines = []
+        title, self._title = self._title, ""
+        if not content:
+            return []
+        file_path = f"{self.source}#{title}" if title else self.source
+        self._seen[file_path] = self._seen.get(file_path, 0) + 1
+        if self._seen[file_path] > 1:
+            file_path += f" ({self._seen[file_path]})"
+        return [Section(self.source, file_path, content)]
 
-async def initialize_rag():
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        llm_model_func=gpt_4o_mini_complete
-    )
+
+# ─── Checkpoint ───
+
+class Checkpoint:
+    """Sections whose chunks, entities and relations are persisted, by doc id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # doc id -> {"source": ..., "hash": content hash}
+        self.done: dict[str, dict] = {}
+        self._unsaved: dict[str, Optional[dict]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = json.load(f).get("sections", {})
+
+    def is_done(self, section: Section) -> bool:
+        entry = self.done.get(section.doc_id)
+        return entry is not None and entry["hash"] == section.content_hash
+
+    def mark(self, section: Section):
+        self._unsaved[section.doc_id] = {"source": section.source, "hash": section.content_hash}
+
+    def forget(self, doc_id: str):
+        self._unsaved[doc_id] = None
+
+    @property
+    def unsaved(self) -> int:
+        return len(self._unsaved)
+
+    def save(self, stats: list[StageStats]):
+        for doc_id, entry in self._unsaved.items():
+            if entry is None:
+                self.done.pop(doc_id, None)
+            else:
+                self.done[doc_id] = entry
+        self._unsaved = {}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "updated_at": datetime.now(tz=timezone.utc).isoformat(),
+                "sections": self.done,
+                "stages": [stage.totals() for stage in stats],
+            }, f)
+        os.replace(tmp, self.path)
+
+
+# ─── Pipeline ───
+
+class IngestPipeline:
+    def __init__(self, rag: LightRAG, checkpoint: Checkpoint, args):
+        self.rag = rag
+        self.checkpoint = checkpoint
+        self.args = args
+        self.read = StageStats("read", 1)
+        self.split = StageStats("split", 1, queue=asyncio.Queue(args.queue_size))
+        self.embed = StageStats("embed", args.embed_workers, queue=asyncio.Queue(args.queue_size))
+        self.extract = StageStats("extract", args.extract_workers, queue=asyncio.Queue(args.queue_size))
+        self.stages = [self.read, self.split, self.embed, self.extract]
+        self.skipped = 0
+        self.removed = 0
+        # Chunks reused from earlier runs vs. embedded and extracted in this one
+        self.chunks_reused = 0
+        self.chunks_added = 0
+        self.chunks_removed = 0
+        self._splitter = SectionSplitter()
+        self._seen: dict[str, set[str]] = {}
+        self._read_complete = False
+        self._persist_lock = asyncio.Lock()
+        self._started = time.monotonic()
+
+    async def run(self, source: str):
+        self.pipeline_status = await get_namespace_data("pipeline_status")
+        self.pipeline_status_lock = get_pipeline_status_lock()
+        reporter = asyncio.create_task(self._report_periodically())
+        try:
+            await asyncio.gather(
+                self._read(source),
+                self._workers(self.split, self._split_worker, self.embed),
+                self._workers(self.embed, self._embed_worker, self.extract),
+                self._workers(self.extract, self._extract_worker, None),
+            )
+            if self._read_complete and not any(stage.failed for stage in self.stages):
+                await self._remove_vanished()
+        finally:
+            reporter.cancel()
+            await self._persist()
+            self._report()
+
+    async def _read(self, source: str):
+        blocks = read_source(source)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = await anext(blocks)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    self.read.busy_seconds += time.perf_counter() - started
+                self.read.items_in += 1
+                self.read.items_out += 1
+                await self.split.queue.put(item)
+            self._read_complete = True
+        finally:
+            await self.split.queue.put(None)
+
+    async def _workers(self, stage: StageStats, work, downstream: Optional[StageStats]):
+        """Run `stage.workers` copies of `work`; each `None` put on the queue stops one of them."""
+        async def worker():
+            while (item := await stage.queue.get()) is not None:
+                stage.items_in += 1
+                started = time.perf_counter()
+                try:
+                    outputs = await work(item)
+                except Exception as e:
+                    stage.failed += 1
+                    print(f"{stage.name} failed: {e}")
+                    outputs = []
+                finally:
+                    stage.busy_seconds += time.perf_counter() - started
+                for output in outputs:
+                    stage.items_out += 1
+                    if downstream is not None:
+                        await downstream.queue.put(output)
+
+        await asyncio.gather(*(worker() for _ in range(stage.workers)))
+        if downstream is not None:
+            for _ in range(downstream.workers):
+                await downstream.queue.put(None)
+
+    async def _split_worker(self, item: tuple[str, str]) -> list[Section]:
+        source, text = item
+        sections = []
+        for section in self._splitter.feed(source, text):
+            self._seen.setdefault(section.source, set()).add(section.doc_id)
+            if self.checkpoint.is_done(section):
+                self.skipped += 1
+                continue
+            sections.append(section)
+        return sections
+
+    async def _embed_worker(self, section: Section) -> list[Section]:
+        diff = await diff_document(self.rag, section.doc_id, section.content, section.file_path)
+        if diff.unchanged:
+            # Persisted by an earlier run after its last checkpoint
+            self.skipped += 1
+            self._finish(section, diff)
+            return []
+        await apply_chunks(self.rag, diff)
+        section.diff = diff
+        return [section]
+
+    async def _extract_worker(self, section: Section) -> list[Section]:
+        await extract_chunks(self.rag, section.diff, self.pipeline_status, self.pipeline_status_lock)
+        self._finish(section, section.diff)
+        if self.checkpoint.unsaved >= self.args.checkpoint_every:
+            await self._persist()
+        return [section]
+
+    def _finish(self, section: Section, diff: ChunkDiff):
+        report = record(diff)
+        self.chunks_reused += report["chunks_reused"]
+        self.chunks_added += report["chunks_added"]
+        self.chunks_removed += report["chunks_removed"]
+        self.checkpoint.mark(section)
+
+    async def _remove_vanished(self):
+        """Delete the sections of the sources read in this run that no longer contain them."""
+        for doc_id, entry in list(self.checkpoint.done.items()):
+            seen = self._seen.get(entry["source"])
+            if seen is None or doc_id in seen:
+                continue
+            report = await delete_document(self.rag, doc_id)
+            if report is not None:
+                self.chunks_removed += report["chunks_removed"]
+            self.checkpoint.forget(doc_id)
+            self.removed += 1
+
+    async def _persist(self):
+        """Write every storage to disk, then record the finished sections in the checkpoint."""
+        async with self._persist_lock:
+            await persist(self.rag)
+            self.checkpoint.save(self.stages)
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(self.args.report_interval)
+            self._report()
+
+    def _report(self):
+        elapsed = time.monotonic() - self._started
+        print(
+            f"--- {elapsed:.0f}s, {len(self.checkpoint.done)} sections checkpointed, {self.skipped} unchanged, "
+            f"{self.removed} removed; chunks: {self.chunks_reused} reused, {self.chunks_added} processed, "
+            f"{self.chunks_removed} retracted"
+        )
+        for stage in self.stages:
+            print(stage.line(elapsed))
+        for name, state in limiter_stats().items():
+            print(
+                f"{name:>12}: limit {state['limit']}, {state['in_flight']} in flight, "
+                f"{state['overloads']} throttled, latency {state['ewma_latency']:.1f}s"
+            )
+        for cache in embedding_cache_stats():
+            print(
+                f"{'embed cache':>12}: {cache['entries']} vectors, {cache['hits']} hits, "
+                f"{cache['misses']} misses ({cache['hit_rate']:.0%})"
+            )
+
+
+async def initialize_rag(working_dir: str = WORKING_DIR):
+    # The API's construction: configured storage backends, SQLite LLM cache,
+    # adaptive limiters, shared embedding batcher and cache, incremental index
+    rag = build_lightrag(working_dir)
 
     await rag.initialize_storages()
+    for storage in index_storages(rag):
+        await storage.initialize()
     await initialize_pipeline_status()
 
     return rag
 
 
+async def ingest(args):
+    rag = await initialize_rag(args.working_dir)
+    checkpoint = Checkpoint(os.path.join(args.working_dir, CHECKPOINT_FILE))
+    try:
+        await IngestPipeline(rag, checkpoint, args).run(args.source)
+    finally:
+        await rag.finalize_storages()
+        for storage in index_storages(rag):
+            await storage.finalize()
+        close_embedding_caches()
+
+
 def main():
-    # Initialize RAG instance and insert Pydantic documentation
-    rag = asyncio.run(initialize_rag())
-    rag.insert(fetch_pydantic_docs())
+    parser = argparse.ArgumentParser(description="Stream documentation into LightRAG")
+    parser.add_argument("--source", default=PYDANTIC_DOCS_URL, help="URL, text file or directory to ingest")
+    parser.add_argument("--working-dir", default=WORKING_DIR)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--extract-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32, help="capacity of each stage's input queue")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="sections between checkpoints")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between progress reports")
+    args = parser.parse_args()
+    asyncio.run(ingest(args))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
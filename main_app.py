@@ -135,58 +135,57 @@ async def retrieve(context: RunContext[RAGDeps], search_query: str) -> str:
         search_query, param=QueryParam(mode="local")
     )
 
+# One long-lived LightRAG shared by all handlers; loading storages is expensive
+_rag: Optional[LightRAG] = None
+_rag_lock = asyncio.Lock()
+
 async def initialize_rag():
     rag = LightRAG(
         working_dir=WORKING_DIR,
         embedding_func=openai_embed,
-        llm_model_func=gpt_4o_mini_complete
+        llm_model_func=gpt_4o_mini_complete,
+        auto_manage_storages_states=False,
     )
     await rag.initialize_storages()
+    await initialize_pipeline_status()
     return rag
 
 # ===================== Services =====================
 
 async def get_lightrag():
-    if not os.path.exists(WORKING_DIR):
-        os.mkdir(WORKING_DIR)
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        llm_model_func=gpt_4o_mini_complete
-    )
-    await rag.initialize_storages()
-    return rag
+    global _rag
+    if _rag is None:
+        async with _rag_lock:
+            if _rag is None:
+                if not os.path.exists(WORKING_DIR):
+                    os.mkdir(WORKING_DIR)
+                _rag = await initialize_rag()
+    return _rag
 
 async def get_lightrag_for_insertion():
-    if not os.path.exists(WORKING_DIR):
-        os.mkdir(WORKING_DIR)
-    rag = LightRAG(
-        working_dir=WORKING_DIR,
-        embedding_func=openai_embed,
-        llm_model_func=gpt_4o_mini_complete
-    )
-    await rag.initialize_storages()
-    await initialize_pipeline_status()
-    return rag
+    return await get_lightrag()
 
 async def insert_document(content: str):
     try:
         rag = await get_lightrag_for_insertion()
-        return await rag.ainsert(content)
+        async with _rag_lock:
+            return await rag.ainsert(content)
     except Exception as e:
         raise Exception(f"Failed to insert document: {str(e)}")
 
 async def update_document(doc_id: str, content: str):
     try:
         rag = await get_lightrag()
-        return await rag.update(doc_id, content)
+        async with _rag_lock:
+            return await rag.update(doc_id, content)
     except Exception as e:
         raise Exception(f"Failed to update document {doc_id}: {str(e)}")
 
 async def remove_document(doc_id: str):
     try:
         rag = await get_lightrag()
-        return await rag.remove(doc_id)
+        async with _rag_lock:
+            return await rag.remove(doc_id)
     except Exception as e:
         raise Exception(f"Failed to remove document {doc_id}: {str(e)}")
 
@@ -224,6 +223,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_lightrag():
+    await get_lightrag()
+
+@app.on_event("shutdown")
+async def shutdown_lightrag():
+    global _rag
+    if _rag is not None:
+        await _rag.finalize_storages()
+        _rag = None
+
 @app.post("/chat/stream")
 async def chat_stream(chat_request: ChatRequest):
     try: